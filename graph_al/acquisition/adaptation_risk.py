@@ -42,7 +42,7 @@ class AcquisitionStrategyAdaptationRisk(AcquisitionStrategyByAttribute):
     @jaxtyped(typechecker=typechecked)
     def get_attribute(self, prediction: Prediction | None, model: BaseModel, dataset: Dataset, generator: Generator,
                         model_config: ModelConfig) -> Tensor:
-        agent = FeatAgentDisable(dataset.data, model, self.config)
+        agent = FeatAgentDisable(dataset, model, self.config)
         # agent = FeatAgent(dataset.data, model, self.config)
         probs = prediction.get_probabilities(propagated=True)[0]
         proxy = [float('inf') for i in range(dataset.num_nodes)]
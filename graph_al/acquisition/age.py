@@ -8,11 +8,9 @@ from jaxtyping import Float, Int, jaxtyped, Bool, Shaped
 from typeguard import typechecked
 from torch import Tensor
 from typing import Dict, Tuple, Any
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 import torch
-from torch_geometric.utils import to_dense_adj
 import numpy as np
-import networkx as nx
 
 from graph_al.model.config import ModelConfig
 
@@ -22,6 +20,17 @@ def percd(input,k):
 def perc(input,k): 
     return torch.mean((input < input[k]).float())
 
+@jaxtyped(typechecker=typechecked)
+def percentile_ranks(input: Float[Tensor, 'n'], descending: bool = False) -> Float[Tensor, 'n']:
+    """ Computes `perc` (or `percd` if `descending`) for all entries at once, i.e. the fraction of entries that are strictly
+    smaller (larger) than each entry. Ties are handled as in `perc` and `percd`. """
+    sorted_input = input.sort().values
+    if descending:
+        count = input.size(0) - torch.searchsorted(sorted_input, input, right=True)
+    else:
+        count = torch.searchsorted(sorted_input, input, right=False)
+    return count.float() / input.size(0)
+
 
 class AcquisitionStrategyAGELike(BaseAcquisitionStrategy):
     """ Strategy that uses a mix of uncertainty and representativeness and centrality. """
@@ -29,7 +38,11 @@ class AcquisitionStrategyAGELike(BaseAcquisitionStrategy):
     def __init__(self, config: AcquisitionStrategyAGELikeConfig):
         super().__init__(config)
         self.num_clusters = config.num_clusters
-        self.centrality_measure = None
+        self.kmeans_batch_size = config.kmeans_batch_size
+        self.kmeans_warm_start = config.kmeans_warm_start
+        self.pagerank_damping = config.pagerank_damping
+        self.pagerank_tolerance = config.pagerank_tolerance
+        self.reset()
                 
     @property
     def is_stateful(self) -> bool:
@@ -38,21 +51,21 @@ class AcquisitionStrategyAGELike(BaseAcquisitionStrategy):
     def reset(self):
         super().reset()
         self.centrality_measure = None
+        self._cluster_centers: Tensor | None = None # centroids of the last clustering
+        self._clustered_logits: Tensor | None = None # the logits that were clustered last
+
+    def state_dict(self) -> Dict[str, Any]:
+        return super().state_dict() | {'centrality_measure' : self.centrality_measure, 'cluster_centers' : self._cluster_centers}
+
+    def load_state_dict(self, state: Dict[str, Any]):
+        super().load_state_dict(state)
+        self.centrality_measure, self._cluster_centers = state['centrality_measure'], state['cluster_centers']
                 
     @jaxtyped(typechecker=typechecked)
     def _calculate_centrality(self, dataset: Dataset) -> Float[Tensor, 'num_nodes']:
-        adj = to_dense_adj(dataset.data.edge_index)
-        graph = nx.from_numpy_array(adj[0].cpu().numpy())
-        centralities = []
-        centralities.append(nx.pagerank(graph))                #print 'page rank: check.'
-        L = len(centralities[0])
-        Nc = len(centralities)
-        cenarray = np.zeros((Nc,L))
-        for i in range(Nc):
-            cenarray[i][list(centralities[i].keys())]=list(centralities[i].values())
-        normcen = (cenarray.astype(float)-np.min(cenarray,axis=1)[:,None])/(np.max(cenarray,axis=1)-np.min(cenarray,axis=1))[:,None]
-        normcen =  torch.tensor(normcen).float() # centrality for all possible nodes
-        return normcen[0]
+        # The pagerank is cached with the graph, so it is computed only once per dataset
+        centrality = dataset.data.get_pagerank(damping=self.pagerank_damping, tolerance=self.pagerank_tolerance)
+        return (centrality - centrality.min()) / (centrality.max() - centrality.min()) # centrality for all possible nodes
     
     @jaxtyped(typechecker=typechecked)
     def _centrality(self, mask_train: Bool[Tensor, 'num_nodes_train_pool'], 
@@ -86,12 +99,28 @@ class AcquisitionStrategyAGELike(BaseAcquisitionStrategy):
             raise RuntimeError(f'Model does not predict attribute requested by AGE representativeness')
         x = x[0]
         
-        kmeans = KMeans(n_clusters=self.num_clusters, random_state=0).fit(x.cpu().numpy())
-        ed = torch.cdist(x[mask_train_pool], torch.tensor(kmeans.cluster_centers_).to(x.device))
+        cluster_centers = self._cluster(prediction.logits).to(x.device)
+        ed = torch.cdist(x[mask_train_pool], cluster_centers)
         ed_score = torch.min(ed, dim=1).values
-        edprec = torch.tensor([percd(ed_score,i) for i in range(len(ed_score))]).to(x.device)
+        edprec = percentile_ranks(ed_score, descending=True)
 
         return edprec
+    
+    def _cluster(self, logits: Tensor) -> Tensor:
+        """ Clusters the logits of the first sample. The clustering is only fit once for the same logits, e.g. within one acquisition. """
+        if self._cluster_centers is not None and logits is self._clustered_logits:
+            return self._cluster_centers
+        x = logits[0].cpu().numpy()
+        kwargs = {}
+        if self.kmeans_warm_start and self._cluster_centers is not None and self._cluster_centers.size() == (self.num_clusters, x.shape[1]):
+            kwargs = {'init' : self._cluster_centers.numpy().astype(x.dtype), 'n_init' : 1}
+        if self.kmeans_batch_size is None:
+            kmeans = KMeans(n_clusters=self.num_clusters, random_state=0, **kwargs).fit(x)
+        else:
+            kmeans = MiniBatchKMeans(n_clusters=self.num_clusters, batch_size=self.kmeans_batch_size, random_state=0, **kwargs).fit(x)
+        self._cluster_centers = torch.tensor(kmeans.cluster_centers_)
+        self._clustered_logits = logits
+        return self._cluster_centers
 
 
 
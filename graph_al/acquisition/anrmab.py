@@ -5,11 +5,12 @@ from graph_al.model.prediction import Prediction
 from graph_al.acquisition.age import AcquisitionStrategyAGELike
 from graph_al.model.config import ModelConfig
 from graph_al.utils.logging import get_logger
+from graph_al.utils.seed import draw_seed
 
 from jaxtyping import Float, Int, jaxtyped, Bool, Shaped
 from typeguard import typechecked
 from torch import Tensor
-from typing import Dict, List, Tuple
+from typing import Any, Dict, List, Tuple
 import torch
 import numpy as np
 
@@ -24,12 +25,20 @@ class AcquisitionStrategyANRMAB(AcquisitionStrategyAGELike):
 
     def reset(self):
         super().reset()
-        self.weights = torch.ones(3).float()
-        self.reward_terms = []
+        self.weights = torch.ones(3).float() # weight of each arm, i.e. representativeness, entropy and centrality
+        self.cumulative_reward_terms = torch.tensor(0.0) # sum of the reward terms of all acquired nodes
 
         self._cached_query_matrix = None
         self._cached_phi = None
         self._cached_probabilities = None
+        self._cached_idxs_train_pool = None
+
+    def state_dict(self) -> Dict[str, Any]:
+        return super().state_dict() | {'weights' : self.weights, 'cumulative_reward_terms' : self.cumulative_reward_terms}
+
+    def load_state_dict(self, state: Dict[str, Any]):
+        super().load_state_dict(state)
+        self.weights, self.cumulative_reward_terms = state['weights'], state['cumulative_reward_terms']
 
     @torch.no_grad()
     def acquire_one(self, mask_acquired: Bool[Tensor, 'num_nodes'], prediction: Prediction | None, model: BaseModel, dataset: Dataset, 
@@ -38,7 +47,7 @@ class AcquisitionStrategyANRMAB(AcquisitionStrategyAGELike):
         assert prediction is not None, f'Need a model prediction for ANRMAB acquisition'
 
         mask_train, mask_train_pool = dataset.data.mask_train.clone().cpu(), dataset.data.mask_train_pool.clone().cpu()
-        idxs_train_pool = torch.tensor(range(len(mask_train_pool)))[mask_train_pool]
+        idxs_train_pool = torch.where(mask_train_pool)[0]
 
         if mask_train.sum() == 0:
             # No training instances, sample one index randomly from pool
@@ -71,7 +80,7 @@ class AcquisitionStrategyANRMAB(AcquisitionStrategyAGELike):
             assert torch.allclose(torch.tensor(1.0), phi.sum())
 
             # We have to use a numpy generator to sample, as torch.distributions.Categorical does not support a generator...
-            numpy_rng = np.random.default_rng(generator.seed())
+            numpy_rng = np.random.default_rng(draw_seed(generator))
             sampled_unlabeled_idx = numpy_rng.choice(phi.size(0), size=1, p=phi.detach().cpu().numpy())
             sampled_idx = int((idxs_train_pool[sampled_unlabeled_idx]).item())
         
@@ -79,7 +88,7 @@ class AcquisitionStrategyANRMAB(AcquisitionStrategyAGELike):
             self._cached_phi = phi
             self._cached_probabilities = probabilities
             self._cached_query_matrix = query_matrix
-            self._cached_idx_to_unlabled_idx = {idx : unlabeled_idx for unlabeled_idx, idx in enumerate(idxs_train_pool.tolist())}
+            self._cached_idxs_train_pool = idxs_train_pool
 
         return sampled_idx, {'mask_train' : mask_train, 'mask_train_pool' : mask_train_pool,
             'representativeness' : representativeness, 'entropy' : entropy, 'centrality' : centrality, 'weights' : self.weights}
@@ -94,25 +103,29 @@ class AcquisitionStrategyANRMAB(AcquisitionStrategyAGELike):
         assert self._cached_phi is not None
         assert self._cached_probabilities is not None
         assert self._cached_query_matrix is not None
-        assert self._cached_idx_to_unlabled_idx is not None
+        assert self._cached_idxs_train_pool is not None
 
         phi, probabilities, query_matrix = self._cached_phi, self._cached_probabilities, self._cached_query_matrix
 
-        # Calculate the reward r^t(v_i; f^t, tau)
-        for sampled_idx in idxs_acquired:
-            assert sampled_idx in self._cached_idx_to_unlabled_idx, f'The sampled node {sampled_idx} was not in the pool'
-            sampled_unlabeled_idx = self._cached_idx_to_unlabled_idx[sampled_idx]
+        # Positions of the acquired nodes among the (sorted) pool nodes the probabilities were computed for
+        idxs = torch.tensor(idxs_acquired, dtype=torch.long)
+        sampled_unlabeled_idxs = torch.searchsorted(self._cached_idxs_train_pool, idxs).clamp(max=phi.size(0) - 1)
+        assert (self._cached_idxs_train_pool[sampled_unlabeled_idxs] == idxs).all(), f'Some sampled nodes of {idxs_acquired} were not in the pool'
 
-            self.reward_terms.append(1 / (phi[sampled_unlabeled_idx] * phi.size(0)))
-            reward = 1 / self.budget * sum(self.reward_terms)
+        # Calculate the rewards r^t(v_i; f^t, tau) of all acquired nodes at once, where each reward includes the terms of previously acquired nodes
+        phi_sampled = phi[sampled_unlabeled_idxs]
+        reward_terms = 1 / (phi_sampled * phi.size(0))
+        rewards = (self.cumulative_reward_terms + reward_terms.cumsum(0)) / self.budget
+        self.cumulative_reward_terms = self.cumulative_reward_terms + reward_terms.sum()
 
-            r_hat = reward * query_matrix[:, sampled_unlabeled_idx] / phi[sampled_unlabeled_idx]
-            self.weights *= torch.exp(self.min_probability_strategy / 2 * (r_hat + (1 / probabilities) * np.sqrt(np.log(self.num_nodes / (0.1 * 3 * self.budget)))))
+        r_hat = rewards[None, :] * query_matrix[:, sampled_unlabeled_idxs] / phi_sampled[None, :] # 3 x num_acquired
+        exploration = (1 / probabilities) * np.sqrt(np.log(self.num_nodes / (0.1 * 3 * self.budget)))
+        self.weights *= torch.exp(self.min_probability_strategy / 2 * (r_hat.sum(1) + idxs.size(0) * exploration))
 
         self._cached_phi = None
         self._cached_probabilities = None
         self._cached_query_matrix = None
-        self._cached_idx_to_unlabled_idx = None
+        self._cached_idxs_train_pool = None
 
 
 
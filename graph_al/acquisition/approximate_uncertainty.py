@@ -7,11 +7,15 @@ from graph_al.model.prediction import Prediction
 from graph_al.acquisition.attribute import AcquisitionStrategyByAttribute
 from graph_al.model.sgc import SGC
 from graph_al.model.build import get_model
+from graph_al.model.logistic_regression import BatchedLogisticRegression, batched_logistic_regression, label_configurations, refit_approximation_error
+from graph_al.model.enum import RefitApproximation
 
 from jaxtyping import jaxtyped, Bool, Int, Float
 from typeguard import typechecked
 from torch import Generator, Tensor
 
+from typing import Any, Callable, List, Tuple
+
 import itertools
 import torch
 import numpy as np
@@ -20,7 +24,8 @@ from graph_al.utils.logging import get_logger
 from sklearn.linear_model import LogisticRegression
 import scipy.special
 
-from graph_al.utils.timer import Timer
+from graph_al.utils.utils import batched
+from graph_al.utils.worker_pool import get_worker_pool
 
 class AcquisitionStrategyApproximateUncertainty(AcquisitionStrategyByAttribute):
     
@@ -34,6 +39,12 @@ class AcquisitionStrategyApproximateUncertainty(AcquisitionStrategyByAttribute):
         self.multiprocessing = config.multiprocessing
         self.num_workers = config.num_workers
         self.subsample_pool = config.subsample_pool
+        self.batched_solver = config.batched_solver
+        self.solver_batch_size = config.solver_batch_size
+        self.refit_approximation = config.refit_approximation
+        self.num_newton_steps = config.num_newton_steps
+        self.refit_approximation_error_samples = config.refit_approximation_error_samples
+        assert self.batched_solver or self.refit_approximation == RefitApproximation.EXACT, f'Refit approximations need the batched solver'
         self.aleatoric_confidence_with_left_out_node = config.aleatoric_confidence_with_left_out_node
         self.aleatoric_confidence_labels_num_samples = config.aleatoric_confidence_labels_num_samples
         self.compute_as_ratio = config.compute_as_ratio
@@ -89,15 +100,31 @@ class AcquisitionStrategyApproximateUncertainty(AcquisitionStrategyByAttribute):
             x = model.get_diffused_node_features(batch).cpu().numpy()
         aleatoric_confidence = torch.full((mask_train.size(0),), float('nan'), dtype=torch.float32)
         
-        if self.aleatoric_confidence_with_left_out_node:
+        if self.aleatoric_confidence_with_left_out_node and self.batched_solver:
+            # compute aleatoric confidence from one model trained on leaving out a node for each node, many at once
+            labels, mask_all = labels.cpu(), torch.ones_like(mask_train, device='cpu')
+            x_torch = torch.from_numpy(x)
+            regression = batched_logistic_regression(model).fit(x_torch, labels[None], mask_all[None], batch.num_classes)
+            coef, intercept = regression.coef_[0], regression.intercept_[0]
+            idxs_predict = torch.where(mask_predict)[0].cpu()
+            for idxs in torch.split(idxs_predict, self.solver_batch_size):
+                y_batch, mask_batch = label_configurations(labels, mask_all, idxs, labels[idxs], observed=False)
+                regression.refit(self.refit_approximation, x_torch, y_batch, mask_batch, batch.num_classes, coef, intercept,
+                                 labels, mask_all, num_newton_steps=self.num_newton_steps)
+                probabilities = regression.predict_proba(x_torch[idxs]).diagonal(dim1=0, dim2=1).T
+                aleatoric_confidence[idxs] = probabilities[torch.arange(idxs.size(0)), labels[idxs]].float()
+            if self.refit_approximation_error_samples > 0 and self.refit_approximation != RefitApproximation.EXACT:
+                idxs = idxs_predict[np.random.choice(idxs_predict.size(0), size=min(self.refit_approximation_error_samples, 
+                                                                                     idxs_predict.size(0)), replace=False)]
+                y_batch, mask_batch = label_configurations(labels, mask_all, idxs, labels[idxs], observed=False)
+                self.log_refit_approximation_error(regression, x_torch, y_batch, mask_batch, batch.num_classes, coef, intercept,
+                                                   labels, mask_all, mask_all)
+        elif self.aleatoric_confidence_with_left_out_node:
             # compute aleatoric confidence from one model trained on leaving out a node for each node
-            iterator = tqdm( torch.where(mask_predict)[0]) if self.verbose else torch.where(mask_predict)[0]
-            for idx in iterator:
-                mask_aleatoric = np.ones_like(mask_train_np)
-                mask_aleatoric[idx] = False
-                aleatoric_confidence_idx = _probabilities_from_logistic_regression(x, 
-                                                                        labels_np, mask_aleatoric, model, batch.num_classes)
-                aleatoric_confidence[idx] = float(aleatoric_confidence_idx[idx, labels[idx]])
+            jobs = [int(idx) for idx in torch.where(mask_predict)[0]]
+            for idx, aleatoric_confidence_idx in self.run_jobs(_leave_one_out_confidence_job, jobs, 'Leave-one-out aleatoric confidence',
+                                                               x=x, labels=labels_np, model=model, num_classes=batch.num_classes):
+                aleatoric_confidence[idx] = aleatoric_confidence_idx
         else:
             # use one base model for aleatoric confidence, cheaper
             idxs = torch.where(mask_predict)[0]
@@ -137,9 +164,10 @@ class AcquisitionStrategyApproximateUncertainty(AcquisitionStrategyByAttribute):
         epistemic_uncertainties = aleatoric_confidences / (total_confidences + 1e-12)
         epistemic_uncertainty = epistemic_uncertainties.mean(0)
         epistemic_uncertainty[~mask_predict] = -float('inf')
-        print('alea conf', torch.nanmean(aleatoric_confidences), aleatoric_confidences)
-        print('epi uncertainty', torch.nanmean(epistemic_uncertainty), epistemic_uncertainty)
-        print('class counts', torch.unique(aleatoric_samples.flatten(), return_counts=True))
+        if self.verbose:
+            get_logger().info(f'Mean aleatoric confidence {torch.nanmean(aleatoric_confidences).item():.5f}, ' \
+                              f'mean epistemic uncertainty {torch.nanmean(epistemic_uncertainty[mask_predict]).item():.5f}, ' \
+                              f'class counts {torch.unique(aleatoric_samples.flatten(), return_counts=True)}')
         
         return epistemic_uncertainty
     
@@ -164,10 +192,9 @@ class AcquisitionStrategyApproximateUncertainty(AcquisitionStrategyByAttribute):
             if prev_idx is not None:
                 mask_aleatoric[prev_idx] = True
             prev_idx = idx
-            with Timer() as timer:
-                aleatoric_confidence_idx = _probabilities_from_logistic_regression(x, 
-                                                                        labels_np, mask_aleatoric, model, batch.num_classes)
-                aleatoric_confidence[idx] = aleatoric_confidence_idx[idx, labels[idx]]
+            aleatoric_confidence_idx = _probabilities_from_logistic_regression(x, 
+                                                                    labels_np, mask_aleatoric, model, batch.num_classes)
+            aleatoric_confidence[idx] = aleatoric_confidence_idx[idx, labels[idx]]
         
         epistemic_uncertainty = aleatoric_confidence / total_confidence[torch.arange(total_confidence.size(0)), labels]
         epistemic_uncertainty[~mask_predict] = -float('inf')
@@ -204,22 +231,16 @@ class AcquisitionStrategyApproximateUncertainty(AcquisitionStrategyByAttribute):
 
         joint_log_probs = torch.full_like(total_confidence, -float('inf'))
 
-        if self.verbose: 
-            print()
-            
         # We simplify the computation of epistemic uncertainty up to a constant factor using
         # equation (28) in our paper, (see appendix G.2)
-        for i, c in tqdm(list(itertools.product(torch.where(mask_predict)[0], range(batch.num_classes))), disable=not self.verbose):
-
-            label_i_true, labels_np[i], mask_train_np[i] = batch.y[i], c, True
-            # compute the log probability p(y_u-i = y_u-i^label | y_O, y_i=c)
-            
-            probs = _probabilities_from_logistic_regression(x, labels_np, mask_train_np, model, batch.num_classes)
-            denominator_pseudo_labels = probs.argmax(1)
-
-            joint_log_probs[i, c] = np.log(probs[np.arange(n), denominator_pseudo_labels][~mask_train_np]).sum()
-            joint_log_probs[i, c] += np.log(total_confidence_np[i, int(labels_np[i])])
-            labels_np[i], mask_train_np[i] = label_i_true, False
+        if self.batched_solver:
+            joint_log_probs = self.joint_log_probs_batched(mask_predict, mask_train, total_confidence, x, batch.num_classes, model)
+        else:
+            jobs = list(itertools.product(map(int, torch.where(mask_predict)[0]), range(batch.num_classes)))
+            for i, c, joint_log_prob in self.run_jobs(_joint_log_probs_job, jobs, 'Joint log probabilities', x=x, labels=labels_np, 
+                                                      mask_train=mask_train_np, total_confidence=total_confidence_np, model=model,
+                                                      num_classes=batch.num_classes):
+                joint_log_probs[i, c] = joint_log_prob
 
         joint_log_probs = joint_log_probs.cpu()
         # Now we take the expectation over the label for y_i = c weighted by the total confidence
@@ -228,6 +249,78 @@ class AcquisitionStrategyApproximateUncertainty(AcquisitionStrategyByAttribute):
         assert not np.isnan(expected_ratios).any()
         return torch.from_numpy(expected_ratios).float()
             
+    @jaxtyped(typechecker=typechecked)
+    def joint_log_probs_batched(self, mask_predict: Bool[Tensor, 'n'], mask_train: Bool[Tensor, 'n'], 
+                                total_confidence: Float[Tensor, 'n c'], x: Float[np.ndarray, 'n d'], num_classes: int,
+                                model: SGC) -> Float[Tensor, 'n c']:
+        """ Computes the joint log probabilities of `epistemic_uncertainty_esp` for many label configurations at once.
+        
+        Returns:
+            Float[Tensor, 'n c']: log p(y_u-i = pseudo labels | y_O, y_i=c) + log p(y_i = c), -inf for nodes not in `mask_predict`
+        """
+        x_torch = torch.from_numpy(x)
+        total_confidence, mask_train = total_confidence.cpu(), mask_train.cpu()
+        labels = total_confidence.argmax(1)
+        regression = batched_logistic_regression(model).fit(x_torch, labels[None], mask_train[None], num_classes)
+        coef, intercept = regression.coef_[0], regression.intercept_[0]
+
+        joint_log_probs = torch.full_like(total_confidence, -float('inf'))
+        jobs = torch.cartesian_prod(torch.where(mask_predict)[0].cpu(), torch.arange(num_classes))
+        for batch_jobs in tqdm(torch.split(jobs, self.solver_batch_size), disable=not self.verbose):
+            idxs, labels_batch = batch_jobs.T
+            y_batch, mask_train_batch = label_configurations(labels, mask_train, idxs, labels_batch)
+            regression.refit(self.refit_approximation, x_torch, y_batch, mask_train_batch, num_classes, coef, intercept, labels, 
+                             mask_train, num_newton_steps=self.num_newton_steps)
+            log_probs = torch.log(regression.predict_proba(x_torch).max(-1).values)
+            joint_log_probs[idxs, labels_batch] = ((log_probs * ~mask_train_batch).sum(1) + 
+                                                   torch.log(total_confidence[idxs, labels_batch])).float()
+        if self.refit_approximation_error_samples > 0 and self.refit_approximation != RefitApproximation.EXACT:
+            idxs, labels_batch = jobs[np.random.choice(jobs.size(0), size=min(self.refit_approximation_error_samples, jobs.size(0)),
+                                                       replace=False)].T
+            y_batch, mask_train_batch = label_configurations(labels, mask_train, idxs, labels_batch)
+            self.log_refit_approximation_error(regression, x_torch, y_batch, mask_train_batch, num_classes, coef, intercept, labels,
+                                               mask_train, ~mask_train)
+        return joint_log_probs
+    
+    def run_jobs(self, job: Callable, jobs: List[Any], desc: str, **kwargs) -> List[Any]:
+        """ Runs `job` on chunks of `jobs` and concatenates the results. With `multiprocessing`, the chunks are distributed over
+        the persistent worker pool, numpy arrays in `kwargs` are put into its shared memory and the model is pickled only once.
+        
+        Args:
+            job (Callable): function that gets a chunk of jobs and `kwargs` and returns a list of results
+            jobs (List[Any]): all jobs
+            desc (str): description of the progress bar
+            
+        Returns:
+            List[Any]: the results of all jobs, not necessarily in order
+        """
+        results = []
+        if self.multiprocessing:
+            pool = get_worker_pool(self.num_workers)
+            for key, value in kwargs.items():
+                if isinstance(value, np.ndarray):
+                    kwargs[key] = pool.share(f'approximate_uncertainty/{key}', value)
+                elif isinstance(value, BaseModel):
+                    kwargs[key] = pool.share_object(f'approximate_uncertainty/{key}', value)
+            # Multiple chunks per worker for balancing the load and reporting progress
+            chunks = [(chunk,) for chunk in batched(max(1, int(np.ceil(len(jobs) / (4 * pool.num_workers)))), jobs)]
+            for result in tqdm(pool.imap_unordered(job, chunks, **kwargs), total=len(chunks), desc=desc, disable=not self.verbose):
+                results += result
+        else:
+            for chunk in tqdm(batched(1, jobs), total=len(jobs), desc=desc, disable=not self.verbose):
+                results += job(chunk, **kwargs)
+        return results
+    
+    def log_refit_approximation_error(self, regression: BatchedLogisticRegression, x: Float[Tensor, 'n d'], y: Int[Tensor, 'b n'],
+                                      mask_train: Bool[Tensor, 'b n'], num_classes: int, coef: Float[Tensor, 'c d'], 
+                                      intercept: Float[Tensor, 'c'], y_fitted: Int[Tensor, 'n'], mask_train_fitted: Bool[Tensor, 'n'],
+                                      mask_evaluate: Bool[Tensor, 'n']):
+        """ Logs the error of the refit approximation against exact refits of some label configurations. """
+        approximation_error = refit_approximation_error(regression, self.refit_approximation, x, y, mask_train, num_classes, coef, 
+                                                        intercept, y_fitted, mask_train_fitted, mask_evaluate, 
+                                                        num_newton_steps=self.num_newton_steps)
+        get_logger().info(f'Error of the {self.refit_approximation} refit approximation on {y.size(0)} label configurations: {approximation_error}')
+            
     @jaxtyped(typechecker=typechecked)
     def get_attribute(self, prediction: Prediction | None, model: BaseModel, dataset: Dataset, generator: Generator,
                         model_config: ModelConfig) -> Tensor:
@@ -253,8 +346,7 @@ class AcquisitionStrategyApproximateUncertainty(AcquisitionStrategyByAttribute):
         mask_predict_nodes &= dataset.data.get_mask(DatasetSplit.TRAIN_POOL).cpu().numpy()
         if self.subsample_pool is not None:
             idxs_predict_nodes = np.where(mask_predict_nodes)[0]
-            np.random.shuffle(idxs_predict_nodes)
-            idxs_predict_nodes = idxs_predict_nodes[:self.subsample_pool]
+            idxs_predict_nodes = idxs_predict_nodes[torch.randperm(idxs_predict_nodes.shape[0], generator=generator)[:self.subsample_pool].numpy()]
             mask_predict_nodes = np.zeros_like(mask_predict_nodes)
             mask_predict_nodes[idxs_predict_nodes] = True
         
@@ -305,6 +397,29 @@ def _probabilities_from_logistic_regression(x: Float[np.ndarray, 'num_nodes num_
         del regression
     return probabilities
 
+def _joint_log_probs_job(jobs: List[Tuple[int, int]], x: Float[np.ndarray, 'num_nodes num_features'], labels: Int[np.ndarray, 'num_nodes'],
+                         mask_train: Bool[np.ndarray, 'num_nodes'], total_confidence: Float[np.ndarray, 'num_nodes num_classes'],
+                         model: SGC, num_classes: int) -> List[Tuple[int, int, float]]:
+    """ Computes log p(y_u-i = pseudo labels | y_O, y_i=c) + log p(y_i = c) of `epistemic_uncertainty_esp` for each job (i, c).
+    The inputs are not modified, so they can be shared between workers. """
+    labels, mask_train = labels.copy(), mask_train.copy()
+    results = []
+    for i, c in jobs:
+        label_i, labels[i], mask_train[i] = labels[i], c, True
+        probs = _probabilities_from_logistic_regression(x, labels, mask_train, model, num_classes)
+        joint_log_prob = np.log(probs.max(1)[~mask_train]).sum() + np.log(total_confidence[i, c])
+        results.append((i, c, float(joint_log_prob)))
+        labels[i], mask_train[i] = label_i, False
+    return results
 
-
-
+def _leave_one_out_confidence_job(idxs: List[int], x: Float[np.ndarray, 'num_nodes num_features'], labels: Int[np.ndarray, 'num_nodes'],
+                                  model: SGC, num_classes: int) -> List[Tuple[int, float]]:
+    """ Computes the confidence in the label of each node in `idxs` of a model fit to all other nodes. """
+    mask_train = np.ones(labels.shape[0], dtype=bool)
+    results = []
+    for idx in idxs:
+        mask_train[idx] = False
+        probs = _probabilities_from_logistic_regression(x, labels, mask_train, model, num_classes)
+        results.append((idx, float(probs[idx, labels[idx]])))
+        mask_train[idx] = True
+    return results
@@ -5,11 +5,12 @@ from graph_al.model.base import BaseModel
 from graph_al.model.prediction import Prediction
 from graph_al.model.config import ModelConfig
 from graph_al.utils.logging import get_logger
+from graph_al.utils.profiler import get_profiler
 
 from jaxtyping import jaxtyped, Shaped, Bool
 from typeguard import typechecked
 from torch import Tensor, Generator
-from typing import Tuple, Dict
+from typing import Tuple, Dict, List, Any
 
 import torch
 
@@ -28,12 +29,44 @@ class AcquisitionStrategyByAttribute(BaseAcquisitionStrategy):
     
     def acquire_one(self, mask_acquired: Bool[Tensor, 'num_nodes'], prediction: Prediction | None, model: BaseModel, dataset: Dataset, 
             model_config: ModelConfig, generator: Generator) -> Tuple[int, Dict[str, Tensor | None]]:
-        attribute = self.get_attribute(prediction, model, dataset, generator, model_config)
+        with get_profiler().phase('attribute'):
+            attribute = self.get_attribute(prediction, model, dataset, generator, model_config)
         if self.higher_is_better:
             attribute = -attribute
+        idx_sampled = self.select_one(attribute, mask_acquired, model, dataset, generator)
+        return idx_sampled, {'acquisition_attribute' : attribute.detach().cpu()}
+    
+    def select_one(self, attribute: Shaped[Tensor, 'num_nodes'], mask_acquired: Bool[Tensor, 'num_nodes'], model: BaseModel, dataset: Dataset,
+                   generator: Generator) -> int:
+        """ Selects the pool node with the lowest attribute. """
         idx_pool = torch.where(self.pool(mask_acquired, model, dataset, generator))[0].to(attribute.device)
         if idx_pool.size(0) == 0:
             get_logger().warn(f'Trying to acquire label, but only none are in the pool.')
         attribute_pool = attribute[idx_pool]
         idx_sampled = idx_pool[torch.argmin(attribute_pool)].item()
-        return int(idx_sampled), {'acquisition_attribute' : attribute.detach().cpu()}
\ No newline at end of file
+        return int(idx_sampled)
+    
+    def acquire_batch(self, num: int, prediction: Prediction | None, model: BaseModel, dataset: Dataset, model_config: ModelConfig,
+                      generator: Generator) -> Tuple[List[int], Dict[str, Any]]:
+        """ Computes the attribute only once and acquires the `num` best nodes of the pool. The 'acquisition_attribute' meta
+        is therefore returned once per iteration, shape [num_nodes]. """
+        with get_profiler().phase('attribute'):
+            attribute = self.get_attribute(prediction, model, dataset, generator, model_config)
+        if self.higher_is_better:
+            attribute = -attribute
+        mask_acquired = torch.zeros_like(dataset.data.mask_train_pool)
+        if self.balanced:
+            # The pool depends on the classes of the already acquired nodes
+            acquired_idxs = []
+            for _ in range(num):
+                idx = self.select_one(attribute, mask_acquired, model, dataset, generator)
+                acquired_idxs.append(idx)
+                mask_acquired[idx] = True
+        else:
+            idx_pool = torch.where(self.pool(mask_acquired, model, dataset, generator))[0].to(attribute.device)
+            if idx_pool.size(0) < num:
+                get_logger().warn(f'Trying to acquire {num} labels, but only {idx_pool.size(0)} are in the pool.')
+            # A stable sort breaks ties like iteratively using `argmin`
+            order = torch.sort(attribute[idx_pool], stable=True).indices[:num]
+            acquired_idxs = idx_pool[order].tolist()
+        return acquired_idxs, {'acquisition_attribute' : attribute.detach().cpu()}
@@ -0,0 +1,139 @@
+import torch
+from torch import Tensor, Generator
+from typing import List
+
+from jaxtyping import jaxtyped, Float, Bool
+from typeguard import typechecked
+
+from graph_al.data.base import Data
+from graph_al.acquisition.enum import NodeAugmentation, EdgeAugmentation
+from graph_al.utils.adjacency import get_normalized_adjacency_cache
+
+
+class AugmentationSampler:
+    """ Samples augmented views of a graph for test time augmentation.
+
+    Masks of multiple views are drawn at once, i.e. edge masks as one [num_views, num_edges] tensor
+    and feature column masks as one [num_views, num_features] tensor. All randomness comes from the
+    passed generator, such that (chunked) test time augmentation is reproducible.
+
+    Args:
+        strat_node (str | None): the node augmentation strategy
+        strat_edge (str | None): the edge augmentation strategy
+        p_node (float): the node augmentation strength
+        p_edge (float): the edge augmentation strength
+        feature_weights (Tensor | None): feature weights for adaptive node augmentations
+        drop_weights (Tensor | None): edge weights for adaptive edge augmentations
+        threshold (float): maximal drop probability of adaptive augmentations
+        p_train_connection (float): drop probability of edges incident to training nodes
+    """
+
+    def __init__(self, strat_node: str | None, strat_edge: str | None, p_node: float, p_edge: float,
+                 feature_weights: Tensor | None = None, drop_weights: Tensor | None = None, threshold: float = 0.7,
+                 p_train_connection: float = 0.8):
+        self.strat_node = strat_node
+        self.strat_edge = strat_edge
+        self.p_node = p_node
+        self.p_edge = p_edge
+        self.feature_weights = feature_weights
+        self.drop_weights = drop_weights
+        self.threshold = threshold
+        self.p_train_connection = p_train_connection
+
+    @property
+    def augments_nodes(self) -> bool:
+        return self.strat_node not in (None, NodeAugmentation.NONE)
+
+    @property
+    def augments_edges(self) -> bool:
+        return self.strat_edge not in (None, EdgeAugmentation.NONE)
+
+    @property
+    def masks_columns(self) -> bool:
+        return self.strat_node in (NodeAugmentation.MASK, NodeAugmentation.ADAPTIVE)
+
+    @jaxtyped(typechecker=typechecked)
+    def column_drop_probabilities(self, num_features: int) -> Float[Tensor, 'num_features']:
+        """ Probabilities of each feature column to be masked. """
+        match self.strat_node:
+            case NodeAugmentation.MASK:
+                return torch.full((num_features,), self.p_node)
+            case NodeAugmentation.ADAPTIVE:
+                assert self.feature_weights is not None, 'Adaptive node augmentations need feature weights'
+                w = self.feature_weights.float().cpu()
+                return (w / w.mean() * self.p_node).clamp(max=self.threshold)
+            case _:
+                raise ValueError(f'Node augmentation {self.strat_node} does not mask columns')
+
+    @jaxtyped(typechecker=typechecked)
+    def edge_drop_probabilities(self, data: Data) -> Float[Tensor, 'num_edges']:
+        """ Probabilities of each edge to be dropped. """
+        edge_index = data.edge_index.cpu()
+        match self.strat_edge:
+            case EdgeAugmentation.MASK:
+                return torch.full((edge_index.size(1),), self.p_edge)
+            case EdgeAugmentation.ADAPTIVE:
+                assert self.drop_weights is not None, 'Adaptive edge augmentations need edge weights'
+                w = self.drop_weights.float().cpu()
+                return (w / w.mean() * self.p_edge).clamp(max=self.threshold)
+            case EdgeAugmentation.TRAIN_CONNECTION:
+                mask_train = data.mask_train.cpu()
+                probs = torch.full((edge_index.size(1),), self.p_edge)
+                probs[mask_train[edge_index[0]] | mask_train[edge_index[1]]] = self.p_train_connection
+                return probs
+            case _:
+                raise ValueError(f'Edge augmentation {self.strat_edge} does not drop edges')
+
+    @jaxtyped(typechecker=typechecked)
+    def sample_column_masks(self, num_views: int, num_features: int, generator: Generator) -> Bool[Tensor, 'num_views num_features']:
+        """ Samples which feature columns each view keeps. """
+        drop = torch.bernoulli(self.column_drop_probabilities(num_features).expand(num_views, -1), generator=generator)
+        return ~drop.bool()
+
+    @jaxtyped(typechecker=typechecked)
+    def sample_edge_masks(self, num_views: int, data: Data, generator: Generator) -> Bool[Tensor, 'num_views num_edges']:
+        """ Samples which edges each view keeps. """
+        if not self.augments_edges:
+            return torch.ones((num_views, data.edge_index.size(1)), dtype=torch.bool)
+        drop = torch.bernoulli(self.edge_drop_probabilities(data).expand(num_views, -1), generator=generator)
+        return ~drop.bool()
+
+    @jaxtyped(typechecker=typechecked)
+    def sample_node_features(self, num_views: int, x: Float[Tensor, 'num_nodes num_features'],
+                             generator: Generator) -> Float[Tensor, 'num_views num_nodes num_features']:
+        """ Samples the augmented node features of each view. """
+        match self.strat_node:
+            case NodeAugmentation.MASK | NodeAugmentation.ADAPTIVE:
+                keep = self.sample_column_masks(num_views, x.size(1), generator).to(x.device)
+                return x.unsqueeze(0) * keep.unsqueeze(1)
+            case NodeAugmentation.NOISE:
+                noise = torch.randn((num_views, *x.size()), generator=generator).to(x.device)
+                return x.unsqueeze(0) + noise * self.p_node
+            case NodeAugmentation.DROPOUT:
+                keep = torch.bernoulli(torch.full((num_views, *x.size()), 1 - self.p_node), generator=generator).to(x.device)
+                return x.unsqueeze(0) * keep / (1 - self.p_node)
+            case _:
+                return x.unsqueeze(0).expand(num_views, -1, -1)
+
+    def sample_views(self, num_views: int, data: Data, generator: Generator) -> List[Data]:
+        """ Samples augmented views of a graph.
+
+        Args:
+            num_views (int): how many views to sample
+            data (Data): the graph to augment
+            generator (Generator): a rng
+
+        Returns:
+            List[Data]: the views, which are shallow views of `data` with augmented node features and edges
+        """
+        views = [data.view() for _ in range(num_views)]
+        if self.augments_nodes:
+            x = self.sample_node_features(num_views, data.x, generator)
+            views = [view.view(x=x[idx]) for idx, view in enumerate(views)]
+        if self.augments_edges:
+            edge_keep = self.sample_edge_masks(num_views, data, generator).to(data.edge_index.device)
+            # Registering the views lets models renormalize their adjacency incrementally
+            cache = get_normalized_adjacency_cache()
+            views = [view.view(edge_index=cache.register_subgraph(data.edge_index, edge_keep[idx], data.num_nodes))
+                     for idx, view in enumerate(views)]
+        return views
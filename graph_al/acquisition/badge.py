@@ -1,52 +1,34 @@
-from typing import Dict, Tuple
-from jaxtyping import Bool, jaxtyped
+from typing import Any, Dict, List, Tuple
+from jaxtyping import Bool, Float, jaxtyped
 from torch import Generator, Tensor
 from typeguard import typechecked
 from graph_al.acquisition.base import BaseAcquisitionStrategy
 from graph_al.acquisition.config import AcquisitionStrategyBadgeConfig
-from graph_al.acquisition.galaxy.graph import MultiLinearGraph
 from graph_al.data.base import Dataset
 from graph_al.model.base import BaseModel
 from graph_al.model.config import ModelConfig
 from graph_al.model.prediction import Prediction
 import torch
-import numpy as np
+from graph_al.utils.logging import get_logger
+from graph_al.utils.profiler import get_profiler
 
-from copy import copy as copy
-from copy import deepcopy as deepcopy
-from scipy import stats
 
-def distance(X1, X2, mu):
-    Y1, Y2 = mu
-    X1_vec, X1_norm_square = X1
-    X2_vec, X2_norm_square = X2
-    Y1_vec, Y1_norm_square = Y1
-    Y2_vec, Y2_norm_square = Y2
-    dist = X1_norm_square * X2_norm_square + Y1_norm_square * Y2_norm_square - 2 * (X1_vec @ Y1_vec) * (X2_vec @ Y2_vec)
-    # Numerical errors may cause the distance squared to be negative.
-    assert np.min(dist) / np.max(dist) > -1e-4
-    dist = np.sqrt(np.clip(dist, a_min=0, a_max=None))
-    return dist
+@jaxtyped(typechecker=typechecked)
+def gradient_embeddings(prediction: Prediction) -> Tuple[Float[Tensor, 'num_nodes num_classes'], Float[Tensor, 'num_nodes embedding_dim']]:
+    """ Factorizes the gradient embeddings of BADGE, i.e. the gradient of the loss w.r.t. the last layer when using the
+    predicted label. Each embedding is the outer product of both factors, which are never materialized.
 
-def init_centers(X1, X2, chosen, chosen_list,  mu, D2):
-    if len(chosen) == 0:
-        ind = np.argmax(X1[1] * X2[1])
-        mu = [((X1[0][ind], X1[1][ind]), (X2[0][ind], X2[1][ind]))]
-        D2 = distance(X1, X2, mu[0]).ravel().astype(float)
-        D2[ind] = 0
-    else:
-        newD = distance(X1, X2, mu[-1]).ravel().astype(float)
-        D2 = np.minimum(D2, newD)
-        D2[chosen_list] = 0
-        Ddist = (D2 ** 2) / sum(D2 ** 2)
-        customDist = stats.rv_discrete(name='custm', values=(np.arange(len(Ddist)), Ddist))
-        ind = customDist.rvs(size=1)[0]
-        while ind in chosen: ind = customDist.rvs(size=1)[0]
-        mu.append(((X1[0][ind], X1[1][ind]), (X2[0][ind], X2[1][ind])))
-    chosen.add(ind)
-    chosen_list.append(ind)
-    print(str(len(mu)) + '\t' + str(sum(D2)), flush=True)
-    return chosen, chosen_list, mu, D2
+    Args:
+        prediction (Prediction): the model prediction
+
+    Returns:
+        Float[Tensor, 'num_nodes num_classes']: the one-hot predicted label minus the predicted probabilities
+        Float[Tensor, 'num_nodes embedding_dim']: the embeddings of the last layer
+    """
+    assert prediction.embeddings is not None
+    probs = prediction.get_probabilities(propagated=True).mean(0)
+    factors = torch.nn.functional.one_hot(probs.argmax(-1), probs.size(-1)).to(probs.dtype) - probs
+    return factors, prediction.embeddings.mean(0)
 
 
 class AcquisitionStrategyBadge(BaseAcquisitionStrategy):
@@ -59,35 +41,74 @@ class AcquisitionStrategyBadge(BaseAcquisitionStrategy):
     
     def __init__(self, config: AcquisitionStrategyBadgeConfig):
         super().__init__(config)
-        
-    @jaxtyped(typechecker=typechecked)
-    def acquire_one(self, mask_acquired: Bool[Tensor, 'num_nodes'], prediction: Prediction | None, model: BaseModel, dataset: Dataset, model_config: ModelConfig, 
-            generator: Generator) -> Tuple[int, Dict[str, Tensor | None]]:
-        
-        
-        idxs_unlabeled = torch.where(self.pool(mask_acquired, model, dataset, generator))[0].cpu().numpy()
-        
-        assert prediction is not None
-        assert prediction.embeddings is not None
-        embs = prediction.embeddings.mean(0).cpu().numpy()[idxs_unlabeled]
-        probs = prediction.get_probabilities(propagated=True).mean(0).cpu().numpy()[idxs_unlabeled]
 
+    def kmeans_plus_plus(self, num: int, mask_acquired: Bool[Tensor, 'num_nodes'], prediction: Prediction, model: BaseModel,
+                         dataset: Dataset, generator: Generator) -> List[int]:
+        """ Selects `num` nodes from the pool by k-means++ seeding on the gradient embeddings: The first center has the
+        largest gradient norm, the following ones are sampled proportionally to their squared distance to the closest center.
+
+        Args:
+            num (int): how many nodes to select
+            mask_acquired (Bool[Tensor, 'num_nodes']): nodes that are already acquired in this iteration
+            prediction (Prediction): the model prediction
+            model (BaseModel): the classifier
+            dataset (Dataset): the dataset
+            generator (Generator): a rng
+
+        Returns:
+            List[int]: the selected nodes
+        """
+        factors, embeddings = gradient_embeddings(prediction)
         # the logic below reflects a speedup proposed by Zhang et al.
         # see Appendix D of https://arxiv.org/abs/2306.09910 for more details
-        m = len(idxs_unlabeled)
-        mu = None
-        D2 = None
-        chosen = set()
-        chosen_list = []
-        emb_norms_square = np.sum(embs ** 2, axis=-1)
-        max_inds = np.argmax(probs, axis=-1)
-
-        probs = -1 * probs
-        probs[np.arange(m), max_inds] += 1
-        prob_norms_square = np.sum(probs ** 2, axis=-1)
-        chosen, chosen_list, mu, D2 = init_centers((probs, prob_norms_square), (embs, emb_norms_square), chosen, chosen_list, mu, D2)
-        assert len(chosen_list) == 1
-        return int(idxs_unlabeled[chosen_list][0]), {}
+        factor_norms_square, embedding_norms_square = (factors ** 2).sum(-1), (embeddings ** 2).sum(-1)
+        norms_square = factor_norms_square * embedding_norms_square
         
+        mask_acquired = mask_acquired.clone()
+        mask_pool = self.pool(mask_acquired, model, dataset, generator).to(factors.device)
+        distances = None # the distance of each node to its closest center
+        acquired_idxs = []
+        for _ in range(num):
+            if self.balanced and distances is not None:
+                # The pool depends on the classes of the already acquired nodes
+                mask_pool = self.pool(mask_acquired, model, dataset, generator).to(factors.device)
+            idx_pool = torch.where(mask_pool)[0]
+            if idx_pool.size(0) == 0:
+                get_logger().warn(f'Trying to acquire {num} labels, but only {len(acquired_idxs)} are in the pool.')
+                break
+            if distances is None:
+                idx = int(idx_pool[torch.argmax(norms_square[idx_pool])].item())
+                distances = torch.full_like(norms_square, float('inf'))
+            else:
+                weights = distances[idx_pool] ** 2
+                if weights.sum() > 0:
+                    idx = int(idx_pool[torch.multinomial(weights, 1, generator=generator)].item())
+                else:
+                    # All pool nodes coincide with centers
+                    idx = int(idx_pool[torch.randint(idx_pool.size(0), (1,), generator=generator)].item())
+            
+            # Only the distance to the newest center can decrease the distances
+            distances_squared = norms_square + norms_square[idx] - 2 * (factors @ factors[idx]) * (embeddings @ embeddings[idx])
+            # Numerical errors may cause the distance squared to be negative.
+            distances = torch.minimum(distances, distances_squared.clamp(min=0).sqrt())
+            distances[idx] = 0
+            acquired_idxs.append(idx)
+            mask_acquired[idx] = True
+            mask_pool[idx] = False
+        return acquired_idxs
+
+    def acquire_batch(self, num: int, prediction: Prediction | None, model: BaseModel, dataset: Dataset, model_config: ModelConfig,
+                      generator: Generator) -> Tuple[List[int], Dict[str, Any]]:
+        """ Acquires all nodes of one iteration in a single k-means++ pass. """
+        assert prediction is not None
+        with get_profiler().phase('kmeans_plus_plus'):
+            acquired_idxs = self.kmeans_plus_plus(num, torch.zeros_like(dataset.data.mask_train_pool), prediction, model, dataset, generator)
+        return acquired_idxs, {}
         
-        
\ No newline at end of file
+    @jaxtyped(typechecker=typechecked)
+    def acquire_one(self, mask_acquired: Bool[Tensor, 'num_nodes'], prediction: Prediction | None, model: BaseModel, dataset: Dataset, model_config: ModelConfig, 
+            generator: Generator) -> Tuple[int, Dict[str, Tensor | None]]:
+        assert prediction is not None
+        acquired_idxs = self.kmeans_plus_plus(1, mask_acquired, prediction, model, dataset, generator)
+        assert len(acquired_idxs) == 1
+        return acquired_idxs[0], {}
@@ -1,10 +1,12 @@
 from abc import abstractmethod
 from graph_al.acquisition.config import AcquisitionStrategyConfig
 from graph_al.model.base import BaseModel
-from graph_al.data.base import Dataset
+from graph_al.data.base import Data, Dataset
+from graph_al.data.collate import collate_views_disjoint, split_views
 from graph_al.model.prediction import Prediction
 from graph_al.model.config import ModelConfig
 from graph_al.utils.logging import get_logger
+from graph_al.utils.profiler import get_profiler
 from graph_al.data.config import DatasetSplit
 from collections import defaultdict
 
@@ -24,6 +26,10 @@ from graph_al.utils.logging import get_logger
 from graph_al.model.trainer.build import get_trainer
 from graph_al.model.build import get_model
 from graph_al.acquisition.enum import NodeAugmentation, EdgeAugmentation
+from graph_al.acquisition.sgc_tta import SGCAugmentationEngine
+from graph_al.acquisition.augmentation import AugmentationSampler
+from graph_al.acquisition.tta_statistics import StreamingStatistics, TTAEarlyStopping
+from graph_al.model.sgc import SGC
 
 
 class BaseAcquisitionStrategy:
@@ -39,6 +45,7 @@ class BaseAcquisitionStrategy:
         self.probs_o_list = []
         self.probs_unfiltered_list = []
         self.probs_filtered_list = []
+        self.tta_num_views_used: List[int] = []
         if config.tta_enabled:
             print("TTA ENABLED")
             self.tta = True
@@ -56,6 +63,12 @@ class BaseAcquisitionStrategy:
             self.probs = config.tta.probs
             self.p_edge = config.tta.p_edge
             self.p_node = config.tta.p_node
+            self.tta_batch_size = config.tta.batch_size
+            self.tta_early_stopping = config.tta.early_stopping
+            self.tta_min_num = config.tta.min_num
+            self.tta_patience = config.tta.patience
+            self.tta_top_k = config.tta.top_k
+            self.tta_confidence = config.tta.confidence
             print("p_node: ", self.p_node)
             print("p_edge: ", self.p_edge)
         else:
@@ -77,6 +90,15 @@ class BaseAcquisitionStrategy:
         """ Resets the acquisition strategies state. """
         ...
 
+    def state_dict(self) -> Dict[str, Any]:
+        """ The state of the acquisition strategy that persists over acquisitions, e.g. for checkpointing.
+        Caches that are rebuilt on demand are not part of it, so by default the state is empty. """
+        return {}
+
+    def load_state_dict(self, state: Dict[str, Any]):
+        """ Restores a state returned by `state_dict`. """
+        ...
+
     def update(self, idxs_acquired: List[int], prediction: Prediction | None, dataset: Dataset, model: BaseModel):
         """ Updates the acquisition strategy state after acquisition.
 
@@ -106,58 +128,6 @@ class BaseAcquisitionStrategy:
         """
         ...
     
-    def augment_data_node(self, data, generator):
-        """
-        Augment the data using the model and generator.
-
-        Args:
-            data (torch_geometric.data.Data): The input data.
-            generator (torch.Generator): The random number generator.
-
-        Returns:
-            torch_geometric.data.Data: The augmented data.
-        """
-        x = data.x
-        match self.tta_strat_node:
-            case "dropout":
-                return torch.nn.functional.dropout(x, p=self.p_node, training=True)
-            case "mask":
-                return mask_feature(x, p=self.p_node, mode='col')[0]
-            case "noise":
-                noise_mask = torch.randn_like(x) * self.p_node
-                return x + noise_mask
-            case "adaptive":
-                return self.drop_feature_weighted_2(x, self.feature_weights, p=self.p_node).to(device=x.device)
-            case _:
-                return x
-    
-    def augment_data_edge(self, data, generator):
-        """
-        Augment the data using the model and generator.
-
-        Args:
-            data (torch_geometric.data.Data): The input data.
-            generator (torch.Generator): The random number generator.
-
-        Returns:
-            torch_geometric.data.Data: The augmented data.
-        """
-        edge_index = data.edge_index
-        match self.tta_strat_edge:
-            case "mask":
-                edge_index, edge_mask = dropout_edge(edge_index, p=self.p_edge)
-            case "adaptive":
-                edge_index = self.drop_edge_weighted(edge_index, self.drop_weights, p=self.p_edge, threshold=0.7).to(device=edge_index.device)
-            case "train_connection":
-                train_mask = data.mask_train[edge_index[0]] | data.mask_train[edge_index[1]]
-                edge_probs = torch.full((edge_index.size(1),), self.p_edge, device=edge_index.device)
-                edge_probs[train_mask] = 0.8
-                edge_to_drop = torch.bernoulli(edge_probs).to(torch.bool)
-                edge_index = edge_index[:, ~edge_to_drop]
-            case _:
-                edge_index = edge_index
-        return edge_index
-    
     def augment_data(self, data, generator):
         """
         Augment the data using the model and generator.
@@ -169,68 +139,93 @@ class BaseAcquisitionStrategy:
         Returns:
             torch_geometric.data.Data: The augmented data.
         """
-        
-        if self.tta_strat_node == "adaptive" and self.feature_weights is None:
+        with get_profiler().phase('augmentation'):
+            return self.augmentation_sampler().sample_views(1, data, generator)[0]
+    
+    def load_adaptive_weights(self):
+        """ Lazily loads the feature and edge weights for adaptive augmentations. """
+        if self.tta_strat_node == "adaptive" and getattr(self, 'feature_weights', None) is None:
             self.feature_weights = torch.load('feature_weights.pt')
-        if self.tta_strat_edge == "adaptive" and self.drop_weights is None:
+        if self.tta_strat_edge == "adaptive" and getattr(self, 'drop_weights', None) is None:
             self.drop_weights = torch.load('drop_weights.pt')
-        
-        data_clone = deepcopy(data)
-        data_clone.x = self.augment_data_node(data_clone, generator)
-        data_clone.edge_index = self.augment_data_edge(data_clone, generator)
-        return data_clone
-        
     
-    def tta_predict(self, model, model_config,dataset, generator, num=100):
+    def augmentation_sampler(self) -> AugmentationSampler:
+        """ Samples the augmented views of test time augmentation. """
+        self.load_adaptive_weights()
+        return AugmentationSampler(self.tta_strat_node, self.tta_strat_edge, self.p_node, self.p_edge,
+                                   feature_weights=getattr(self, 'feature_weights', None), drop_weights=getattr(self, 'drop_weights', None))
+    
+    def sgc_augmentation_engine(self, model: SGC, data: Data) -> SGCAugmentationEngine:
+        """ An engine that predicts augmented views with a SGC by exploiting its linearity. """
+        return SGCAugmentationEngine(model, data, self.augmentation_sampler())
+    
+    def tta_ranking_scores(self, prediction: Prediction, model: BaseModel, dataset: Dataset, generator: Generator,
+                           model_config: ModelConfig) -> Tensor | None:
+        """ Scores of all nodes derived from a (tta) prediction, nodes with lower scores are acquired first. Used to stop drawing
+        augmented views once the ranking is stable. If None, the strategy does not support early stopping. """
+        return None
+    
+    def tta_predict(self, model, model_config,dataset, generator, num=100, top_k: int = 1):
         
         prediction = model.predict(dataset.data, acquisition=True)
         
         self.probs_o_list.append(prediction.get_probabilities(propagated=True).detach().cpu())
-        pred_comm = torch.zeros_like(prediction.get_probabilities(propagated=True)).cuda()
-        pred_comm_filtered = torch.zeros_like(prediction.get_probabilities(propagated=True)).cuda()
+        # All aggregates live on the device of the model's prediction
+        pred_comm = torch.zeros_like(prediction.get_probabilities(propagated=True))
+        pred_comm_filtered = torch.zeros_like(prediction.get_probabilities(propagated=True))
         
-        pred_o = prediction.get_probabilities(propagated=True).argmax(dim=-1).cuda()
+        pred_o = prediction.get_probabilities(propagated=True).argmax(dim=-1)
         if self.probs:
             prediction.probabilities = prediction.get_probabilities(propagated=True)
             prediction.probabilities_unpropagated = prediction.get_probabilities(propagated=False)
-        cnt = torch.full_like(pred_o, (self.num+1), dtype=torch.float)
-        model_tmp = model
-        for _ in range(num):
-            data_clone = self.augment_data(dataset.data, generator)
-            from graph_al.model.sgc import SGC
-            if isinstance(model, SGC):
-
-                x = model.get_diffused_node_features(data_clone, cache= False)   
-                x = x.cuda()
-                data_clone.x = data_clone.x.cuda()
-                probs= model.predict_proba(x).unsqueeze(0)
-                probs_unprop= model.predict_proba(data_clone.x).unsqueeze(0)
-                logits = model.decision_function(x).unsqueeze(0)
-                logits_unprop= model.decision_function(data_clone.x).unsqueeze(0)
-                p_tmp = Prediction(probabilities=probs, probabilities_unpropagated=probs_unprop, logits=logits, logits_unpropagated=logits_unprop)
-
+        cnt = torch.full_like(pred_o, 1, dtype=torch.float)
+        sgc_engine = self.sgc_augmentation_engine(model, dataset.data) if isinstance(model, SGC) else None
+        sampler = self.augmentation_sampler()
+        early_stopping = None
+        score_statistics = StreamingStatistics()
+        if self.tta_early_stopping:
+            # The unaugmented prediction is part of the aggregate, so its scores are the first sample of the score statistics
+            scores = self.tta_ranking_scores(prediction, model, dataset, generator, model_config)
+            if scores is None:
+                get_logger().warning(f'{type(self).__name__} does not support early stopping of test time augmentation, '
+                                     f'all {num} views are drawn')
+            else:
+                early_stopping = TTAEarlyStopping(self.tta_top_k or top_k, self.tta_min_num, self.tta_patience, self.tta_confidence)
+                score_statistics.update(scores.unsqueeze(0))
+        num_views_used = 0
+        for num_views in self.tta_chunk_sizes(num):
+            # All tensors are of shape [num_views, num_samples, num_nodes, num_classes]
+            if sgc_engine is not None:
+                probs, probs_unprop, logits, logits_unprop = sgc_engine.predict_views(num_views, generator)
             else:
-                with torch.no_grad():
-                    p_tmp = model_tmp.predict(data_clone, acquisition=True)
-                    p_tmp.probabilities = p_tmp.get_probabilities(propagated=True)
-                    p_tmp.probabilities_unpropagated = p_tmp.get_probabilities(propagated=False)
+                with get_profiler().phase('augmentation'):
+                    views = sampler.sample_views(num_views, dataset.data, generator)
+                probs, probs_unprop, logits, logits_unprop = self.tta_predict_views(model, dataset.data, views)
                 
-            pred_comm += p_tmp.get_probabilities(propagated=True)
+            pred_comm += probs.sum(0)
+            view_mask = None
             if self.tta_filter:
-                pred = p_tmp.get_probabilities(propagated=True).argmax(dim=-1)
-                mask = pred != pred_o
-                p_tmp.logits[mask] = 0
-                p_tmp.probabilities[mask] = 0
-                p_tmp.logits_unpropagated[mask] = 0
-                p_tmp.probabilities_unpropagated[mask] = 0
-                cnt[mask] -= 1
-            pred_comm_filtered += p_tmp.get_probabilities(propagated=True)
+                mask = probs.argmax(dim=-1) != pred_o
+                view_mask = (~mask).all(1)
+                keep = (~mask).unsqueeze(-1)
+                logits, probs = logits * keep, probs * keep
+                logits_unprop, probs_unprop = logits_unprop * keep, probs_unprop * keep
+                cnt -= mask.sum(0)
+            cnt += num_views
+            num_views_used += num_views
+            pred_comm_filtered += probs.sum(0)
             
             if self.probs:
-                prediction.probabilities += p_tmp.get_probabilities(propagated=True)
-                prediction.probabilities_unpropagated += p_tmp.get_probabilities(propagated=False)
-            prediction.logits += p_tmp.get_logits(propagated=True)
-            prediction.logits_unpropagated += p_tmp.get_logits(propagated=False)
+                prediction.probabilities += probs.sum(0)
+                prediction.probabilities_unpropagated += probs_unprop.sum(0)
+            prediction.logits += logits.sum(0)
+            prediction.logits_unpropagated += logits_unprop.sum(0)
+            
+            if early_stopping is not None and self.tta_early_stop(early_stopping, score_statistics,
+                    (probs, probs_unprop, logits, logits_unprop), view_mask, num_views_used, model, dataset, generator, model_config):
+                get_logger().info(f'Stopped test time augmentation after {num_views_used} of {num} views')
+                break
+        self.tta_num_views_used.append(num_views_used)
 
         if self.tta_norm:
             if self.probs:
@@ -245,61 +240,124 @@ class BaseAcquisitionStrategy:
         # self.probs_filtered_list.append(pred_comm_filtered.detach().cpu())
 
         return prediction
-        
-    def drop_feature_weighted_2(self,x, w, p: float, threshold: float = 0.7):
-        w = w / w.mean() * p
-        w = w.where(w < threshold, torch.ones_like(w) * threshold)
-        drop_prob = w
+    
+    def tta_early_stop(self, early_stopping: TTAEarlyStopping, score_statistics: StreamingStatistics,
+                       views: Tuple[Tensor, Tensor, Tensor, Tensor], view_mask: Tensor | None, num_views_total: int, model: BaseModel,
+                       dataset: Dataset, generator: Generator, model_config: ModelConfig) -> bool:
+        """ Checks if drawing more augmented views in `tta_predict` can still change the ranking of the pool.
 
-        drop_mask = torch.bernoulli(drop_prob).to(torch.bool).to(x.device)
+        Both the ranking and its confidence intervals are derived from the scores of individual views: The pool is ranked by
+        their mean and the intervals use its standard error. For scores that are linear in the prediction, the mean equals the
+        score of the aggregated prediction.
 
-        x = x.clone()
-        x[:, drop_mask] = 0.
+        Args:
+            early_stopping (TTAEarlyStopping): the stopping criterion
+            score_statistics (StreamingStatistics): online statistics of the scores of individual views
+            views (Tuple[Tensor, Tensor, Tensor, Tensor]): the predictions of the latest views as returned by `tta_predict_views`
+            view_mask (Tensor | None): shape [num_views, num_nodes], which predictions of the latest views were not filtered
+            num_views_total (int): how many views were drawn so far
 
-        return x
+        Returns:
+            bool: whether to stop drawing views
+        """
+        view_scores = []
+        for probs, probs_unprop, logits, logits_unprop in zip(*views):
+            view_scores.append(self.tta_ranking_scores(Prediction(probabilities=probs, probabilities_unpropagated=probs_unprop,
+                logits=logits, logits_unpropagated=logits_unprop), model, dataset, generator, model_config))
+        score_statistics.update(torch.stack(view_scores), view_mask)
+        return early_stopping.step(score_statistics.mean, dataset.data.mask_train_pool, len(view_scores), num_views_total,
+                                   standard_error=score_statistics.standard_error)
     
-    def drop_edge_weighted(self,edge_index, edge_weights, p: float, threshold: float = 1.):
-        edge_weights = edge_weights / edge_weights.mean() * p
-        edge_weights = edge_weights.where(edge_weights < threshold, torch.ones_like(edge_weights) * threshold)
-        sel_mask = torch.bernoulli(1. - edge_weights).to(torch.bool).to(edge_index.device)
-
-        return edge_index[:, sel_mask]
+    def tta_chunk_sizes(self, num: int) -> List[int]:
+        """ Splits `num` augmented views into chunks that are predicted in one forward pass each. """
+        batch_size = self.tta_batch_size or 1
+        return [min(batch_size, num - start) for start in range(0, num, batch_size)]
     
+    @torch.no_grad()
+    def tta_predict_views(self, model: BaseModel, data: Data, views: List[Data]) -> Tuple[Tensor, Tensor, Tensor, Tensor]:
+        """ Predicts multiple augmented views at once by collating them into one disjoint union graph.
+
+        Args:
+            model (BaseModel): the model
+            data (Data): the graph the views were derived from
+            views (List[Data]): the augmented views
+
+        Returns:
+            Tensor: propagated probabilities, shape [num_views, num_samples, num_nodes, num_classes]
+            Tensor: unpropagated probabilities
+            Tensor: propagated logits
+            Tensor: unpropagated logits
+        """
+        num_views = len(views)
+        if num_views == 1:
+            p_tmp = model.predict(views[0], acquisition=True)
+        else:
+            p_tmp = model.predict(collate_views_disjoint(views, data), acquisition=True)
+        return tuple(split_views(tensor, num_views) for tensor in ( # type: ignore
+            p_tmp.get_probabilities(propagated=True), p_tmp.get_probabilities(propagated=False), 
+            p_tmp.get_logits(propagated=True), p_tmp.get_logits(propagated=False)))
+        
     def acquire(self, model: BaseModel, dataset: Dataset, num: int, model_config: ModelConfig, generator: Generator) -> Tuple[Int[Tensor, 'num'], Dict[str, Any]]:
-        """ Computes the nodes to acquire in this iteration. It iteratively calls `acquire_one`.
+        """ Computes the nodes to acquire in this iteration. It predicts once (with test time augmentation if enabled) and
+        delegates the selection to `acquire_batch`, which by default iteratively calls `acquire_one`.
         
         Returns:
             Tuple[Int[Tensor, 'num']: the indices of acquired nodes
-            Dict[str, int | float]: Metrics over the acquistion
+            Dict[str, int | float]: Metrics over the acquistion. Meta returned by `acquire_one` is stacked over the acquired
+                nodes, while strategies that override `acquire_batch` return it once per iteration (e.g. the
+                'acquisition_attribute' of attribute strategies has shape [num_nodes] instead of [num, num_nodes])
         """
-        acquired_idxs = []
-        acquired_meta = defaultdict(list)
-        mask_acquired_idxs = torch.zeros_like(dataset.data.mask_train_pool)
+        self.tta_num_views_used = []
 
     
+        profiler = get_profiler()
         if self.requires_model_prediction:
-            if self.tta:
-                prediction = self.tta_predict(model,model_config, dataset, generator,num = self.num)          
-            else:
-                with torch.no_grad():                    
-                    prediction = model.predict(dataset.data, acquisition=True)
-            prediction.logits *= self.scale
-            prediction.logits_unpropagated *= self.scale
+            with profiler.phase('prediction'):
+                if self.tta:
+                    prediction = self.tta_predict(model,model_config, dataset, generator,num = self.num, top_k=num)          
+                else:
+                    with torch.no_grad():                    
+                        prediction = model.predict(dataset.data, acquisition=True)
+                prediction.logits *= self.scale
+                prediction.logits_unpropagated *= self.scale
         else:
             prediction = None    
         
+        with profiler.phase('selection'):
+            acquired_idxs, acquired_meta = self.acquire_batch(num, prediction, model, dataset, model_config, generator)
+
+        if self.is_stateful:
+            self.update(acquired_idxs, prediction, dataset, model)
+        
+        if len(self.tta_num_views_used) > 0:
+            acquired_meta['tta_num_views'] = torch.tensor(self.tta_num_views_used)
+        return torch.tensor(acquired_idxs), acquired_meta
+    
+    def acquire_batch(self, num: int, prediction: Prediction | None, model: BaseModel, dataset: Dataset, model_config: ModelConfig,
+                      generator: Generator) -> Tuple[List[int], Dict[str, Any]]:
+        """ Acquires all labels of one iteration. By default, `acquire_one` is called iteratively.
+
+        Args:
+            num (int): how many labels to acquire
+            prediction (Prediction | None): an optional model prediction if the acquisition needs that
+            model (BaseModel): the classifier 
+            dataset (Dataset): the dataset
+            generator (Generator): a rng
+
+        Returns:
+            List[int]: the acquired node labels
+            Dict[str, Any]: meta information from this aggregation
+        """
+        acquired_idxs = []
+        acquired_meta = defaultdict(list)
+        mask_acquired_idxs = torch.zeros_like(dataset.data.mask_train_pool)
         for _ in range(num):
             idx, acquired_meta_iteration = self.acquire_one(mask_acquired_idxs, prediction, model, dataset, model_config, generator)
             for k, v in acquired_meta_iteration.items():
                 acquired_meta[k].append(v)
             acquired_idxs.append(idx)
             mask_acquired_idxs[idx] = True
-
-        if self.is_stateful:
-            self.update(acquired_idxs, prediction, dataset, model)
-        
-        
-        return torch.tensor(acquired_idxs), self._aggregate_acquired_meta(acquired_meta)
+        return acquired_idxs, self._aggregate_acquired_meta(acquired_meta)
     
     def _aggregate_acquired_meta(self, acquired_meta: Dict[str, Any]):
         # Filter out Nones
@@ -3,6 +3,7 @@ from hydra.core.config_store import ConfigStore
 from omegaconf import MISSING
 from graph_al.evaluation.config import MetricTemplate
 from graph_al.model.prediction import PredictionAttribute
+from graph_al.model.enum import RefitApproximation
 from graph_al.acquisition.enum import *
 from graph_al.evaluation.enum import DatasetSplit, MetricName
 from graph_al.acquisition.config_tta import TTAConfig
@@ -66,6 +67,11 @@ class CoresetConfig(AcquisitionStrategyConfig):
     propagated: bool = True # Use propagated or unpropagated embeddings
     distance: CoresetDistance = MISSING
     distance_norm: float = 2
+    backend: CoresetBackend = CoresetBackend.EXACT # how distances of pool nodes to their nearest center are computed
+    chunk_size: int = 4096 # how many nodes are compared at once, bounds memory to chunk_size x chunk_size distances
+    num_clusters: int | None = None # for approximate backends: number of partitions of the centers, if None sqrt(num_centers)
+    num_probes: int = 2 # for approximate backends: how many partitions are searched per node, trading speed for recall
+    num_kmeans_iterations: int = 10 # for approximate backends: iterations of k-means to partition the centers
     
 @dataclass
 class CoresetAPPRConfig(CoresetConfig):
@@ -73,7 +79,9 @@ class CoresetAPPRConfig(CoresetConfig):
     type_: AcquisitionStrategyType = AcquisitionStrategyType.CORESET
     distance: CoresetDistance = CoresetDistance.APPR
     alpha: float = 0.2 # teleport probability
-    k: int = 10 # num iterations
+    k: int = 10 # num iterations, only for the dense APPR matrix
+    ppr_tolerance: float | None = None # if given, use the sparse forward-push PPR of training nodes with this tolerance instead of the dense APPR matrix
+    ppr_top_k: int | None = None # only keep the k largest sparse PPR scores of each training node
 
 @dataclass
 class OracleConfig(AcquisitionStrategyConfig):
@@ -127,15 +135,29 @@ class AcquisitionStrategyByAPPRConfig(AcquisitionStrategyByDataAttributeConfig):
     alpha: float = 0.2
 
 @dataclass
-class AcquisitionStrategyGEEMConfig(AcquisitionStrategyConfig):
+class BatchedSolverConfig:
+    """ Configuration of strategies that refit a SGC to many label configurations, optionally with a batched solver. """
+    batched_solver: bool = False # Fit the logistic regressions of many label configurations at once with a vectorized solver instead of sklearn
+    solver_batch_size: int = 256 # How many label configurations are fit at once by the batched solver
+    refit_approximation: RefitApproximation = RefitApproximation.EXACT # How the batched solver refits the model to each label configuration
+    num_newton_steps: int = 10 # Newton steps of the `newton` refit approximation, about 10 are needed to match exact refits to ~1e-4
+    refit_approximation_error_samples: int = 0 # On how many label configurations to report the error of the refit approximation against exact refits
+
+@dataclass
+class AcquisitionStrategyGEEMConfig(AcquisitionStrategyConfig, BatchedSolverConfig):
     type_: AcquisitionStrategyType = AcquisitionStrategyType.GEEM
     multiprocessing: bool = False
     num_workers: int | None = None
     compute_risk_on_subset: int | None = None # On how many nodes is the risk evaluated as a subset
     subsample_pool : int | None = None # Radomly only consider a subset of the pool
+    successive_halving: bool = False # Prune candidates in rounds: score all on a small risk subset with approximate refits, re-score the best on larger subsets with exact refits
+    successive_halving_initial_subset: int = 64 # On how many nodes the risk is evaluated in the first round of successive halving
+    successive_halving_keep_fraction: float = 0.5 # Which fraction of candidates survives each round, the risk subset grows by its inverse
+    successive_halving_approximation: RefitApproximation = RefitApproximation.NEWTON # How the first round of successive halving refits the model
+    successive_halving_error_samples: int = 32 # On how many label configurations the error of approximate rounds is measured against exact refits and logged
 
 @dataclass
-class AcquisitionStrategyGEEMAttributeConfig(AcquisitionStrategyByAttributeConfig):
+class AcquisitionStrategyGEEMAttributeConfig(AcquisitionStrategyByAttributeConfig, BatchedSolverConfig):
     type_: AcquisitionStrategyType = AcquisitionStrategyType.GEEM_ATTRIBUTE
     multiprocessing: bool = False
     num_workers: int | None = None
@@ -144,7 +166,7 @@ class AcquisitionStrategyGEEMAttributeConfig(AcquisitionStrategyByAttributeConfi
     higher_is_better: bool = False
 
 @dataclass
-class AcquisitionStrategyApproximateUncertaintyConfig(AcquisitionStrategyByAttributeConfig):
+class AcquisitionStrategyApproximateUncertaintyConfig(AcquisitionStrategyByAttributeConfig, BatchedSolverConfig):
     type_: AcquisitionStrategyType = AcquisitionStrategyType.APPROXIMATE_UNCERTAINTY
     multiprocessing: bool = False
     num_workers: int | None = None
@@ -208,6 +230,11 @@ class AcquisitionStrategyTTAExpectedQueryScoreConfig(AcquisitionStrategyAdaptati
     p_edge: float = 0.3 # probability of edge dropout
     p_node: float = 0.3
     higher_is_better: bool = False
+    early_stopping: bool = False # whether to stop drawing views once the ranking of the pool is stable
+    min_num: int = 10 # minimal number of tta samples when stopping early
+    patience: int = 10 # for how many tta samples the ranking of the top nodes needs to be stable to stop early
+    top_k: int | None = None # how many of the top nodes need a stable ranking, if None `num_to_acquire_per_step`
+    confidence: float | None = 0.95 # also stop early if confidence intervals of the top nodes separate, if None only the ranking is used
     
 @dataclass
 class AcquisitionStrategyLatentDistanceConfig(AcquisitionStrategyByAttributeConfig):
@@ -227,6 +254,10 @@ class AcquisitionStrategyAugmentLatentConfig(AcquisitionStrategyConfig):
 class AcquisitionStrategyAGELikeConfig(AcquisitionStrategyConfig):
     """ Configuration for acquiring based on AGE, i.e. centrality, entropy and representativeness"""
     num_clusters: int = 6
+    pagerank_damping: float = 0.85 # probability of following an edge instead of teleporting in the pagerank centrality
+    pagerank_tolerance: float = 1e-6 # convergence tolerance of the power iteration of the pagerank centrality
+    kmeans_batch_size: int | None = None # if given, cluster with MiniBatchKMeans on batches of this size instead of KMeans
+    kmeans_warm_start: bool = False # initialize the clustering with the centroids of the previous acquisition step
     
 @dataclass
 class AcquisitionStrategyAGEConfig(AcquisitionStrategyAGELikeConfig):
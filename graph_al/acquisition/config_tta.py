@@ -10,4 +10,10 @@ class TTAConfig:
     filter: bool = False # whether to filter the tta 
     probs: bool = True # whether to use the probabilities of the tta samples or logits
     p_edge: float = 0.3 # probability of edge dropout
-    p_node: float = 0.3
\ No newline at end of file
+    p_node: float = 0.3
+    batch_size: int | None = None # how many augmented views are collated into one forward pass, if None views are predicted one by one
+    early_stopping: bool = False # whether to stop drawing views once the ranking of the pool is stable
+    min_num: int = 10 # minimal number of tta samples when stopping early
+    patience: int = 10 # for how many tta samples the ranking of the top nodes needs to be stable to stop early
+    top_k: int | None = None # how many of the top nodes need a stable ranking, if None the number of acquired nodes
+    confidence: float | None = 0.95 # also stop early if confidence intervals of the top nodes separate, if None only the ranking is used
@@ -5,12 +5,14 @@ from graph_al.model.base import BaseModel
 from graph_al.model.prediction import Prediction
 from graph_al.model.config import ModelConfig
 from graph_al.utils.logging import get_logger
+from graph_al.acquisition.coreset_backend import get_coreset_distance_backend
 
 from jaxtyping import Float, Int, jaxtyped, Bool, Shaped
 from typeguard import typechecked
 from torch import Tensor
 from typing import Dict, Tuple, Any
 
+import numpy as np
 import torch
 
 class AcquisitionStrategyCoreset(BaseAcquisitionStrategy):
@@ -27,11 +29,22 @@ class AcquisitionStrategyCoreset(BaseAcquisitionStrategy):
         self.propagated = config.propagated
         self.distance_metric = config.distance
         self.distance_norm = config.distance_norm
+        self.distance_backend = get_coreset_distance_backend(config)
+        self.reset()
+    
+    @property
+    def is_stateful(self) -> bool:
+        return True # keeps the min-distance of each pool node to the centers
+    
+    def reset(self):
+        super().reset()
+        self._min_distance: Tensor | None = None # min-distance of each node to all centers
+        self._mask_centers: Tensor | None = None # which nodes are centers
+        self._mask_targets: Tensor | None = None # for which nodes the min-distance is kept
+        self._distance_key: Any = None # identifies the features the distances were computed from
         
     @jaxtyped(typechecker=typechecked)
-    def _latent_features_distance(self, mask_train: Bool[Tensor, 'num_nodes'], 
-                  mask_train_pool: Bool[Tensor, 'num_nodes'], 
-                  prediction: Prediction | None) -> Float[Tensor, 'num_nodes_train num_nodes_train_pool']:
+    def _latent_features(self, prediction: Prediction | None) -> Float[Tensor, 'num_nodes d']:
         if prediction is None:
             raise RuntimeError(f'Latent feature distance requires model predictions')
         if self.propagated:
@@ -42,31 +55,59 @@ class AcquisitionStrategyCoreset(BaseAcquisitionStrategy):
         if x is None:
             raise RuntimeError(f'Model does not predict attribute requested by Coreset {self.distance_metric}')
         assert len(x.size()) == 3 # num_samples, num_nodes, d
-        x = x.mean(0) # TODO: this is probably a bad idea for models that have more than 1 sample
-        return torch.cdist(x[mask_train], x[mask_train_pool], p=self.distance_norm)
+        return x.mean(0) # TODO: this is probably a bad idea for models that have more than 1 sample
     
     @jaxtyped(typechecker=typechecked)
-    def _input_features_distance(self, mask_train: Bool[Tensor, 'num_nodes'], 
-                  mask_train_pool: Bool[Tensor, 'num_nodes'], 
-                  dataset: Dataset) -> Float[Tensor, 'num_nodes_train num_nodes_train_pool']:
-        x = dataset.data.x
-        return torch.cdist(x[mask_train], x[mask_train_pool], p=self.distance_norm) 
-        
-    @jaxtyped(typechecker=typechecked)
-    def _distance(self, mask_train: Bool[Tensor, 'num_nodes'], 
+    def _nearest_center_distance(self, mask_train: Bool[Tensor, 'num_nodes'], 
                   mask_train_pool: Bool[Tensor, 'num_nodes'],
                   model: BaseModel, dataset: Dataset, prediction: Prediction | None,
-                  generator: torch.Generator) -> Float[Tensor, 'num_nodes_train num_nodes_train_pool']:
-        """ computes the distance metric used for the coreset algorithm """
+                  generator: torch.Generator) -> Float[Tensor, 'num_nodes_train_pool']:
+        """ computes the distance of each pool node to its closest train node with the distance metric used for the coreset algorithm """
         
         match self.distance_metric:
             case CoresetDistance.LATENT_FEATURES:
-                return self._latent_features_distance(mask_train, mask_train_pool, prediction)
+                x = self._latent_features(prediction)
             case CoresetDistance.INPUT_FEATURES:
-                return self._input_features_distance(mask_train, mask_train_pool, dataset)
+                x = dataset.data.x
             case _:
                 raise ValueError(f'Unsupported coreset distance {self.distance_metric}')
-        
+        return self.distance_backend.min_distance(x[mask_train], x[mask_train_pool], generator)
+    
+    def distance_key(self, dataset: Dataset, prediction: Prediction | None) -> Any:
+        """ Identifies the features distances are computed from. If it changes (e.g. after retraining), distances are recomputed. """
+        match self.distance_metric:
+            case CoresetDistance.LATENT_FEATURES:
+                if prediction is None:
+                    return None
+                return prediction.embeddings if self.propagated else prediction.embeddings_unpropagated
+            case _:
+                return dataset.data.x
+    
+    @torch.no_grad()
+    @jaxtyped(typechecker=typechecked)
+    def _update_min_distance(self, mask_centers: Bool[Tensor, 'num_nodes'], model: BaseModel, dataset: Dataset, 
+                             prediction: Prediction | None, generator: torch.Generator) -> Float[Tensor, 'num_nodes']:
+        """ Updates the min-distance of each pool node to all centers, such that only distances to new centers are computed. """
+        key = self.distance_key(dataset, prediction)
+        mask_targets = dataset.data.mask_train_pool
+        if self._min_distance is None or self._mask_centers is None or self._mask_targets is None or key is not self._distance_key \
+                or (self._mask_centers & ~mask_centers).any() or (mask_targets & ~self._mask_targets).any():
+            # Features changed or centers were removed: Rebuild the state
+            self._min_distance = None
+            self._mask_centers = torch.zeros_like(mask_centers)
+            self._mask_targets = mask_targets.clone()
+            self._distance_key = key
+        mask_new_centers = mask_centers & ~self._mask_centers
+        if mask_new_centers.any():
+            distance = self._nearest_center_distance(mask_new_centers, self._mask_targets, model, dataset, prediction, generator)
+            if self._min_distance is None:
+                self._min_distance = torch.full((mask_centers.size(0),), float('inf'), device=distance.device, dtype=distance.dtype)
+            idx_targets = torch.where(self._mask_targets)[0].to(distance.device)
+            self._min_distance[idx_targets] = torch.minimum(self._min_distance[idx_targets], distance)
+            self._mask_centers |= mask_new_centers
+        assert self._min_distance is not None
+        return self._min_distance
+    
     @torch.no_grad()
     def acquire_one(self, mask_acquired: Bool[Tensor, 'num_nodes'], prediction: Prediction | None, model: BaseModel, 
                     dataset: Dataset, model_config: ModelConfig, generator: torch.Generator) -> Tuple[int, Dict[str, Tensor | None]]:
@@ -82,10 +123,11 @@ class AcquisitionStrategyCoreset(BaseAcquisitionStrategy):
         else:
             # Select the instance from the pool that has the maximal min-distance to all train nodes
             # i.e. the one thats furthest away to all of them
-            distance = self._distance(mask_train_or_acquired, mask_pool, model, dataset, prediction, generator)
-            min_dist = distance.min(0)[0]
-            sampled_idx = idx_pool[min_dist.argmax().item()].item()
-        return int(sampled_idx), {'train_to_train_pool_distances' : distance}
+            min_dist = self._update_min_distance(mask_train_or_acquired, model, dataset, prediction, generator)
+            min_dist_pool = min_dist[idx_pool.to(min_dist.device)]
+            distance = min_dist_pool.max().cpu()
+            sampled_idx = idx_pool[min_dist_pool.argmax().item()].item()
+        return int(sampled_idx), {'coreset_distance' : distance}
         
 class AcquisitionStrategyCoresetAPPR(AcquisitionStrategyCoreset):
     """ Aquisition strategy that uses coreset on approximate Personalized Page Rank scores as a distance. """
@@ -94,14 +136,37 @@ class AcquisitionStrategyCoresetAPPR(AcquisitionStrategyCoreset):
         super().__init__(config)
         self.k = config.k
         self.alpha = config.alpha
+        self.ppr_tolerance = config.ppr_tolerance
+        self.ppr_top_k = config.ppr_top_k
+    
+    def distance_key(self, dataset: Dataset, prediction: Prediction | None) -> Any:
+        return dataset.data.edge_index
     
     @jaxtyped(typechecker=typechecked)
-    def _distance(self, mask_train: Bool[Tensor, 'num_nodes'], 
+    def _nearest_center_distance(self, mask_train: Bool[Tensor, 'num_nodes'], 
                   mask_train_pool: Bool[Tensor, 'num_nodes'],
-                  model: BaseModel, dataset: Dataset, prediction: Prediction,
-                  generator: torch.Generator) -> Float[Tensor, 'num_nodes_train num_nodes_train_pool']:
+                  model: BaseModel, dataset: Dataset, prediction: Prediction | None,
+                  generator: torch.Generator) -> Float[Tensor, 'num_nodes_train_pool']:
+        if self.ppr_tolerance is not None:
+            # Only compute the ppr vectors of training nodes and their entries of pool nodes
+            ppr = dataset.data.sparse_ppr(teleport_probability=self.alpha, tolerance=self.ppr_tolerance)
+            idx_pool = torch.where(mask_train_pool)[0].cpu().numpy()
+            ppr_train_pool = ppr.get_rows(torch.where(mask_train)[0].cpu().numpy(), top_k=self.ppr_top_k)[:, idx_pool]
+            # Scale like the dense matrix, whose columns sum to 1 / num_nodes
+            ppr_pool = ppr_train_pool.max(0).toarray().ravel() / ppr.num_nodes
+            reached = ppr_pool > 0
+            distance = np.zeros_like(ppr_pool)
+            distance[reached] = -np.log(ppr_pool[reached])
+            if not reached.all():
+                # The push from no training node reaches these nodes, i.e. their ppr is below the push threshold,
+                # which is proportional to the degree. They are farther than all reached nodes, the ones with
+                # the lowest degree the farthest.
+                bound = -np.log(ppr.push_threshold[idx_pool[~reached]] / ppr.num_nodes)
+                offset = distance[reached].max() if reached.any() else 0.0
+                distance[~reached] = offset + 1.0 + bound - bound.min()
+            return torch.from_numpy(distance).float()
         log_appr_matrix = dataset.data.log_appr_matrix(teleport_probability=self.alpha, num_iterations=self.k).T
         # We transpose as we want the importance of a pool node to a training node
-        # The distance matrix returned has train nodes on dim=0 and pool nodes on dim=1
+        # The distance matrix has train nodes on dim=0 and pool nodes on dim=1
         # Also: High ppr scores mean low distance, so we use the inverse
-        return -log_appr_matrix[mask_train.cpu()][:, mask_train_pool.cpu()]
\ No newline at end of file
+        return (-log_appr_matrix[mask_train.cpu()][:, mask_train_pool.cpu()]).min(0)[0]
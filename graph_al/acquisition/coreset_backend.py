@@ -0,0 +1,124 @@
+import math
+import torch
+import torch_scatter
+from torch import Tensor, Generator
+from typing import Tuple
+
+from jaxtyping import jaxtyped, Float, Int
+from typeguard import typechecked
+
+from graph_al.acquisition.config import CoresetConfig
+from graph_al.acquisition.enum import CoresetBackend
+
+
+@jaxtyped(typechecker=typechecked)
+def chunked_min_distance(x_centers: Float[Tensor, 'num_centers d'], x_targets: Float[Tensor, 'num_targets d'], p: float = 2,
+                         chunk_size: int = 4096) -> Float[Tensor, 'num_targets']:
+    """ Distance of each target to its nearest center, without materializing more than chunk_size x chunk_size distances. """
+    min_distance = torch.full((x_targets.size(0),), float('inf'), device=x_targets.device, dtype=x_targets.dtype)
+    for start in range(0, x_targets.size(0), chunk_size):
+        targets = x_targets[start : start + chunk_size]
+        for start_centers in range(0, x_centers.size(0), chunk_size):
+            distance = torch.cdist(x_centers[start_centers : start_centers + chunk_size], targets, p=p)
+            min_distance[start : start + chunk_size] = torch.minimum(min_distance[start : start + chunk_size], distance.min(0)[0])
+    return min_distance
+
+@jaxtyped(typechecker=typechecked)
+def nearest_centroids(x: Float[Tensor, 'n d'], centroids: Float[Tensor, 'k d'], num: int = 1,
+                      chunk_size: int = 4096) -> Int[Tensor, 'n num']:
+    """ Indices of the `num` nearest centroids of each point. """
+    return torch.cat([torch.cdist(x[start : start + chunk_size], centroids).topk(num, dim=1, largest=False).indices
+                      for start in range(0, x.size(0), chunk_size)], dim=0)
+
+@jaxtyped(typechecker=typechecked)
+def kmeans(x: Float[Tensor, 'n d'], num_clusters: int, num_iterations: int, generator: Generator,
+           chunk_size: int = 4096) -> Tuple[Float[Tensor, 'num_clusters d'], Int[Tensor, 'n']]:
+    """ Lloyd's algorithm initialized with random points.
+
+    Returns:
+        Tensor: the centroids
+        Tensor: the cluster assignment of each point
+    """
+    centroids = x[torch.randperm(x.size(0), generator=generator)[:num_clusters].to(x.device)]
+    assignment = nearest_centroids(x, centroids, chunk_size=chunk_size)[:, 0]
+    for _ in range(num_iterations):
+        counts = torch_scatter.scatter_add(torch.ones_like(assignment, dtype=x.dtype), assignment, dim=0, dim_size=num_clusters)
+        sums = torch_scatter.scatter_add(x, assignment, dim=0, dim_size=num_clusters)
+        # Empty clusters keep their centroid
+        centroids = torch.where(counts[:, None] > 0, sums / counts.clamp(min=1)[:, None], centroids)
+        assignment_new = nearest_centroids(x, centroids, chunk_size=chunk_size)[:, 0]
+        if torch.equal(assignment_new, assignment):
+            break
+        assignment = assignment_new
+    return centroids, assignment
+
+
+class CoresetDistanceBackend:
+    """ Computes the distance of nodes to their nearest center for coreset.
+
+    Args:
+        config (CoresetConfig): the coreset configuration
+    """
+
+    def __init__(self, config: CoresetConfig):
+        self.p = config.distance_norm
+        self.chunk_size = config.chunk_size
+
+    @jaxtyped(typechecker=typechecked)
+    def min_distance(self, x_centers: Float[Tensor, 'num_centers d'], x_targets: Float[Tensor, 'num_targets d'],
+                     generator: Generator) -> Float[Tensor, 'num_targets']:
+        """ Distance of each target to its nearest center. """
+        return chunked_min_distance(x_centers, x_targets, p=self.p, chunk_size=self.chunk_size)
+
+
+class CoresetKMeansDistanceBackend(CoresetDistanceBackend):
+    """ Approximates the distance of nodes to their nearest center by partitioning the centers with k-means.
+
+    Each node is only compared to the centers in the `num_probes` partitions with the closest centroids. More
+    probes and fewer partitions increase the recall of the nearest center, at the cost of speed. As coreset
+    picks the node furthest away from all centers, missing the nearest center overestimates the distance.
+    """
+
+    def __init__(self, config: CoresetConfig):
+        super().__init__(config)
+        self.num_clusters = config.num_clusters
+        self.num_probes = config.num_probes
+        self.num_kmeans_iterations = config.num_kmeans_iterations
+
+    @jaxtyped(typechecker=typechecked)
+    def min_distance(self, x_centers: Float[Tensor, 'num_centers d'], x_targets: Float[Tensor, 'num_targets d'],
+                     generator: Generator) -> Float[Tensor, 'num_targets']:
+        num_clusters = self.num_clusters or math.ceil(math.sqrt(x_centers.size(0)))
+        if self.num_probes >= min(num_clusters, x_centers.size(0)):
+            return super().min_distance(x_centers, x_targets, generator)
+        centroids, assignment = kmeans(x_centers, num_clusters, self.num_kmeans_iterations, generator, chunk_size=self.chunk_size)
+        probes = nearest_centroids(x_targets, centroids, num=self.num_probes, chunk_size=self.chunk_size)
+
+        # Group the targets by the partitions they probe
+        probed_clusters = probes.flatten()
+        probing_targets = torch.arange(x_targets.size(0), device=probes.device).repeat_interleave(self.num_probes)
+        order = torch.argsort(probed_clusters)
+        counts = torch.bincount(probed_clusters, minlength=num_clusters).tolist()
+
+        min_distance = torch.full((x_targets.size(0),), float('inf'), device=x_targets.device, dtype=x_targets.dtype)
+        for cluster, idx_targets in enumerate(torch.split(probing_targets[order], counts)):
+            idx_centers = torch.where(assignment == cluster)[0]
+            if idx_targets.size(0) == 0 or idx_centers.size(0) == 0:
+                continue
+            min_distance[idx_targets] = torch.minimum(min_distance[idx_targets], chunked_min_distance(
+                x_centers[idx_centers], x_targets[idx_targets], p=self.p, chunk_size=self.chunk_size))
+        # Targets that only probed partitions without centers fall back to exact distances
+        idx_missing = torch.where(torch.isinf(min_distance))[0]
+        if idx_missing.size(0) > 0:
+            min_distance[idx_missing] = super().min_distance(x_centers, x_targets[idx_missing], generator)
+        return min_distance
+
+
+def get_coreset_distance_backend(config: CoresetConfig) -> CoresetDistanceBackend:
+    match config.backend:
+        case CoresetBackend.EXACT:
+            return CoresetDistanceBackend(config)
+        case CoresetBackend.KMEANS:
+            return CoresetKMeansDistanceBackend(config)
+        case _:
+            raise ValueError(f'Unsupported coreset backend {config.backend}')
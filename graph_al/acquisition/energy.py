@@ -1,6 +1,7 @@
 from graph_al.acquisition.config import AcquireByLogitEnergyConfig
 from graph_al.data.base import Dataset
 from graph_al.model.base import BaseModel
+from graph_al.model.config import ModelConfig
 from graph_al.model.prediction import Prediction
 from graph_al.acquisition.prediction_attribute import AcquisitionStrategyByPredictionAttribute
 
@@ -20,7 +21,8 @@ class AcquisitionStrategyByLogitEnergy(AcquisitionStrategyByPredictionAttribute)
         self.temperature = config.temperature
         
     @jaxtyped(typechecker=typechecked)
-    def get_attribute(self, prediction: Prediction | None, model: BaseModel, dataset: Dataset, generator: torch.Generator) -> Shaped[Tensor, 'num_nodes']:
+    def get_attribute(self, prediction: Prediction | None, model: BaseModel, dataset: Dataset, generator: torch.Generator,
+                      model_config: ModelConfig) -> Shaped[Tensor, 'num_nodes']:
         if prediction is None:
             raise RuntimeError('Energy expected a prediction')
         logits = prediction.logits if self.propagated else prediction.logits_unpropagated
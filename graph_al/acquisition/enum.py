@@ -78,6 +78,12 @@ class CoresetDistance(StrEnum):
     INPUT_FEATURES = 'input_features'
     APPR = 'appr' 
 
+@unique
+class CoresetBackend(StrEnum):
+    
+    EXACT = 'exact' # exact distances, computed in chunks of bounded memory
+    KMEANS = 'kmeans' # approximate nearest centers by searching only the closest k-means partitions of all centers
+
 @unique
 class OracleAcquisitionUncertaintyType(StrEnum):
     EPISTEMIC = 'epistemic'
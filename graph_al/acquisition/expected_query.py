@@ -39,69 +39,8 @@ class AcquisitionStrategyExpectedQuery(AcquisitionStrategyByAttribute):
         self.tta_scale = config.scale
         self.tta_norm = config.tta.norm
         self.num = config.tta.num
-
-        
-        
-    def augment_data_node(self, data, generator):
-        """
-        Augment the data using the model and generator.
-
-        Args:
-            data (torch_geometric.data.Data): The input data.
-            generator (torch.Generator): The random number generator.
-
-        Returns:
-            torch_geometric.data.Data: The augmented data.
-        """
-        x = data.x
-        match self.tta_strat_node:
-            case "dropout":
-                return torch.nn.functional.dropout(x, p=0.3, training=True)
-            case "mask":
-                return mask_feature(x, p=0.3, mode='col')[0]
-            case "noise":
-                noise_mask = torch.randn_like(x) * 0.3
-                return x + noise_mask
-
-    def augment_data_edge(self, data, generator):
-        """
-        Augment the data using the model and generator.
-
-        Args:
-            data (torch_geometric.data.Data): The input data.
-            generator (torch.Generator): The random number generator.
-
-        Returns:
-            torch_geometric.data.Data: The augmented data.
-        """
-        edge_index = data.edge_index
-        match self.tta_strat_edge:
-            case "mask":
-                edge_index, edge_mask = dropout_edge(edge_index, p=0.3)
-            case "train_connection":
-                train_mask = data.mask_train[edge_index[0]] | data.mask_train[edge_index[1]]
-                edge_probs = torch.full((edge_index.size(1),), 0.3, device=edge_index.device)
-                edge_probs[train_mask] = 0.8
-                edge_to_drop = torch.bernoulli(edge_probs).to(torch.bool)
-                edge_index = edge_index[:, ~edge_to_drop]
-        return edge_index
-    
-    
-    def augment_data(self, data, generator):
-        """
-        Augment the data using the model and generator.
-
-        Args:
-            data (torch_geometric.data.Data): The input data.
-            generator (torch.Generator): The random number generator.
-
-        Returns:
-            torch_geometric.data.Data: The augmented data.
-        """
-        data_clone = deepcopy(data)
-        data_clone.x = self.augment_data_node(data_clone, generator)
-        data_clone.edge_index = self.augment_data_edge(data_clone, generator)
-        return data_clone
+        self.p_node = config.tta.p_node
+        self.p_edge = config.tta.p_edge
     
     @jaxtyped(typechecker=typechecked)
     def get_attribute(self, prediction: Prediction | None, model: BaseModel, dataset: Dataset, generator: Generator,
@@ -119,5 +58,3 @@ class AcquisitionStrategyExpectedQuery(AcquisitionStrategyByAttribute):
         mask_predict = dataset.data.get_mask(DatasetSplit.TRAIN_POOL)
         proxy[~mask_predict] = float('inf')
         return proxy
-        
-       
@@ -1,4 +1,4 @@
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple
 from jaxtyping import Bool, Int, jaxtyped
 from typing import Any
 from torch import Generator, Tensor
@@ -6,7 +6,7 @@ from typeguard import typechecked
 from graph_al.acquisition.base import BaseAcquisitionStrategy
 from graph_al.acquisition.config import AcquisitionStrategyGalaxyConfig
 from graph_al.acquisition.galaxy.graph import MultiLinearGraph
-from graph_al.acquisition.galaxy.linear_graph import create_linear_graphs
+from graph_al.acquisition.galaxy.linear_graph import create_linear_graphs, sort_by_margin
 from graph_al.acquisition.galaxy.s2algorithm import bisection_query
 from graph_al.data.base import Dataset
 from graph_al.data.enum import DatasetSplit
@@ -15,7 +15,6 @@ from graph_al.model.config import ModelConfig
 from graph_al.model.prediction import Prediction
 import torch
 import numpy as np
-from graph_al.utils.logging import get_logger
 
 class AcquisitionStrategyGalaxy(BaseAcquisitionStrategy):
     """Implementation of the GALAXY startegy.
@@ -25,54 +24,63 @@ class AcquisitionStrategyGalaxy(BaseAcquisitionStrategy):
     
     def __init__(self, config: AcquisitionStrategyGalaxyConfig):
         super().__init__(config)
-        self.graphs: MultiLinearGraph | None = None
-        self.idx_to_graphs_idx = None
-        self.graph_idx_to_idx = None
         self.order = config.order
+        self.reset()
+
+    def reset(self):
+        super().reset()
+        self.graphs: MultiLinearGraph | None = None
+        self.graph_idx_to_idx: np.ndarray | None = None
+        self._scores: np.ndarray | None = None
+
+    def state_dict(self) -> Dict[str, Any]:
+        if self.graphs is None:
+            return super().state_dict()
+        return super().state_dict() | {'graph_idx_to_idx' : self.graph_idx_to_idx, 'scores' : self._scores,
+            'sorted_idxs' : self.graphs.sorted_idxs, 'labels' : self.graphs.labels, 'queried' : self.graphs.queried}
+
+    def load_state_dict(self, state: Dict[str, Any]):
+        super().load_state_dict(state)
+        if 'sorted_idxs' in state:
+            self.graphs = MultiLinearGraph(state['sorted_idxs'], state['labels'], self.order)
+            self.graphs.queried[:] = state['queried']
+            self.graph_idx_to_idx, self._scores = state['graph_idx_to_idx'], state['scores']
         
-        
-    def _build_graphs(self, prediction: Prediction, dataset: Dataset, generator: Generator):
+    def _build_graphs(self, prediction: Prediction, dataset: Dataset):
         # In contrast to the original implementation, we keep a test and validation set
         # so we build the graph only on the train pool
-        self.graph_idx_to_idx = []
-        self.idx_to_graphs_idx = {}
-        non_eval_idxs = torch.where(~(dataset.data.get_mask(DatasetSplit.VAL) |
-                                dataset.data.get_mask(DatasetSplit.TEST)))[0].tolist()
+        graph_idx_to_idx = torch.where(~(dataset.data.get_mask(DatasetSplit.VAL) |
+                                dataset.data.get_mask(DatasetSplit.TEST)))[0].cpu().numpy()
+        scores = prediction.get_probabilities(propagated=True).mean(0).cpu().numpy()[graph_idx_to_idx]
+        labels = dataset.data.y.cpu().numpy()[graph_idx_to_idx]
         
-        for graph_idx, idx in enumerate(non_eval_idxs):
-            self.graph_idx_to_idx.append(idx)
-            self.idx_to_graphs_idx[idx] = graph_idx
+        if self.graphs is None or self.graph_idx_to_idx is None or self._scores is None \
+            or not np.array_equal(self.graph_idx_to_idx, graph_idx_to_idx) or not np.array_equal(self.graphs.labels, labels):
+            self.graphs = create_linear_graphs(scores, labels, self.order)
+        elif not np.array_equal(self._scores, scores):
+            # Only the order of the nodes along the chains changes
+            self.graphs.set_sorted_idxs(sort_by_margin(scores, self.graphs.sorted_idxs.shape[0]))
+        self.graph_idx_to_idx, self._scores = graph_idx_to_idx, scores
         
-        scores = prediction.get_probabilities(propagated=True).mean(0).cpu().numpy()[np.array(self.graph_idx_to_idx)]
-        labels = dataset.data.y.cpu().numpy()[np.array(self.graph_idx_to_idx)]
-        
-        self.graphs = create_linear_graphs(
-            scores,
-            labels,
-            'graph',
-            self.order,
-        )
-        
-        for idx in torch.where(dataset.data.get_mask(DatasetSplit.TRAIN))[0]:
-            self.graphs.label(self.idx_to_graphs_idx[int(idx.item())])
+        self.graphs.n_order = self.order
+        self.graphs.s2_iteration = 0
+        self.graphs.queried[:] = dataset.data.get_mask(DatasetSplit.TRAIN).cpu().numpy()[graph_idx_to_idx]
        
-    @jaxtyped(typechecker=typechecked)
-    def acquire(self, model: BaseModel, dataset: Dataset, num: int, model_config: ModelConfig, generator: Generator) -> Tuple[Int[Tensor, ' num'], Dict[str, Any]]:
-        # rebuild the graphs that are used for acquisition
-        prediction = model.predict(dataset.data, acquisition=True)
-        self._build_graphs(prediction, dataset, generator)
-        return super().acquire(model, dataset, num, model_config, generator)
+    def acquire_batch(self, num: int, prediction: Prediction | None, model: BaseModel, dataset: Dataset, model_config: ModelConfig,
+                      generator: Generator) -> Tuple[List[int], Dict[str, Any]]:
+        # update the graphs that are used for acquisition
+        assert prediction is not None, "Galaxy requires a model prediction."
+        self._build_graphs(prediction, dataset)
+        return super().acquire_batch(num, prediction, model, dataset, model_config, generator)
         
     @jaxtyped(typechecker=typechecked)
     def acquire_one(self, mask_acquired: Bool[Tensor, 'num_nodes'], prediction: Prediction | None, model: BaseModel, dataset: Dataset, model_config: ModelConfig, 
             generator: Generator) -> Tuple[int, Dict[str, Tensor | None]]:
         assert self.graphs is not None, "Graphs are not initialized."
         assert self.graph_idx_to_idx is not None, "Graph idx to idx is not initialized."
-        query_idx, alter_idx = bisection_query(self.graphs)
+        query_idx = bisection_query(self.graphs)
         if query_idx is None:
-            query_idx = alter_idx
+            not_queried = self.graphs.not_queried
+            query_idx = int(not_queried[torch.randint(len(not_queried), (1,), generator=generator).item()])
         self.graphs.label(query_idx)
-        return self.graph_idx_to_idx[query_idx], {}
-        
-        
-        
\ No newline at end of file
+        return int(self.graph_idx_to_idx[query_idx]), {}
@@ -1,11 +1,12 @@
 from copy import deepcopy
-from graph_al.acquisition.config import AcquisitionStrategyGEEMConfig
+from graph_al.acquisition.config import AcquisitionStrategyGEEMConfig, BatchedSolverConfig
 from graph_al.data.base import Data, Dataset
 from graph_al.data.config import DatasetSplit
 from graph_al.model.base import BaseModel
 from graph_al.model.prediction import Prediction
 from graph_al.acquisition.base import BaseAcquisitionStrategy
 from graph_al.model.config import ModelConfig
+from graph_al.model.enum import RefitApproximation
 
 from jaxtyping import Shaped, jaxtyped, Bool
 from typeguard import typechecked
@@ -13,12 +14,12 @@ from typing import Dict, List, Tuple
 from torch import Tensor
 
 import itertools
-from functools import partial
 import torch
 import numpy as np
 from tqdm import tqdm
-from multiprocessing import Pool, cpu_count
 from graph_al.utils.logging import get_logger
+from graph_al.utils.seed import draw_seed
+from graph_al.utils.worker_pool import get_worker_pool
 
 from graph_al.utils.utils import batched
 from graph_al.utils.timer import Timer
@@ -38,6 +39,15 @@ class AcquisitionStrategyGraphExpectedErrorMinimization(BaseAcquisitionStrategy)
         self.num_workers = config.num_workers
         self.compute_risk_on_subset = config.compute_risk_on_subset
         self.subsample_pool = config.subsample_pool
+        self.solver_config: BatchedSolverConfig = config
+        assert config.batched_solver or config.refit_approximation == RefitApproximation.EXACT, f'Refit approximations need the batched solver'
+        self.successive_halving = config.successive_halving
+        self.successive_halving_initial_subset = config.successive_halving_initial_subset
+        self.successive_halving_keep_fraction = config.successive_halving_keep_fraction
+        self.successive_halving_approximation = config.successive_halving_approximation
+        self.successive_halving_error_samples = config.successive_halving_error_samples
+        assert not self.successive_halving or config.batched_solver, f'Successive halving needs the batched solver'
+        assert 0 < self.successive_halving_keep_fraction < 1, f'Successive halving needs to keep a fraction in (0, 1) of candidates'
         
     def acquire_one(self, mask_acquired: Bool[Tensor, 'num_nodes'], prediction: Prediction | None, model: BaseModel, dataset: Dataset,
             model_config: ModelConfig, generator: torch.Generator) -> Tuple[int, Dict[str, Tensor | None]]:
@@ -56,42 +66,134 @@ class AcquisitionStrategyGraphExpectedErrorMinimization(BaseAcquisitionStrategy)
             mask_predict_nodes = np.zeros_like(mask_predict_nodes)
             mask_predict_nodes[idxs_predict_nodes] = True
 
+        if self.successive_halving:
+            idx, risk, meta = self.successive_halving_acquire(np.where(mask_predict_nodes)[0], probabilities, model, dataset)
+            return idx, {'risk' : risk, 'probabilities' : probabilities} | meta
+        risk, meta = compute_expected_risk(mask_predict_nodes, model, dataset, generator, self.solver_config, multiprocessing=self.multiprocessing,
+                                           num_workers=self.num_workers, compute_risk_on_subset=self.compute_risk_on_subset, verbose=self.verbose)
+        proxy = (risk * probabilities).sum(1)
+        return int(proxy.argmin().item()), {'risk' : risk, 'probabilities' : probabilities} | meta
+    
+    def successive_halving_acquire(self, idxs_candidates: np.ndarray, probabilities: Shaped[Tensor, 'num_nodes num_classes'],
+            model: BaseModel, dataset: Dataset) -> Tuple[int, Shaped[Tensor, 'num_nodes num_classes'], Dict[str, Tensor]]:
+        """ Finds the node with minimal expected risk with successive halving [1].
+        
+        The first round scores all candidates on a small random subset of risk nodes with approximate refits. Each round keeps
+        the best `successive_halving_keep_fraction` of candidates and re-scores them with exact refits on a larger subset,
+        until only one candidate is left or the risk is computed on all nodes of `compute_risk_on_subset`. The risk subsets are nested.
+        The error of approximate refits is measured on `successive_halving_error_samples` label configurations and logged.
+        
+        Args:
+            idxs_candidates (np.ndarray): the candidate nodes
+            probabilities (Shaped[Tensor, 'num_nodes num_classes']): the predicted probabilities to take the expectation over labels
+            model (BaseModel): the model
+            dataset (Dataset): the dataset
+            
+        Returns:
+            int: the acquired node
+            Shaped[Tensor, 'num_nodes num_classes']: the risk of each candidate and label in the last round it was scored in
+            Dict[str, Tensor]: number of candidates, size of the risk subset, whether approximate refits were used and the
+                maximal confidence error of the refits (NaN if not measured) in each round
+        
+        References:
+        [1]: https://arxiv.org/abs/1502.07943
+        """
+        mask_train = dataset.data.get_mask(DatasetSplit.TRAIN).cpu().numpy()
+        idxs_risk = np.where(~mask_train)[0]
+        np.random.shuffle(idxs_risk)
+        if self.compute_risk_on_subset is not None:
+            idxs_risk = idxs_risk[:self.compute_risk_on_subset]
+        
         risk = torch.full_like(probabilities, np.inf)
-
-        if self.multiprocessing:
-            args = list(itertools.product(np.where(mask_predict_nodes)[0], range(dataset.data.num_classes)))
-            args = list(zip(args, [generator.seed() for _ in range(len(args))]))
-            chunk_size = int(np.ceil(len(args) / (self.num_workers or cpu_count())))
-            batched_args = [(x, deepcopy(model), deepcopy(dataset)) for x in batched(chunk_size, args)]
-            job = partial(compute_risk_job, verbose=self.verbose, compute_risk_on_subset=self.compute_risk_on_subset)
-            with Pool(processes=self.num_workers) as pool:
-                results = pool.starmap(job, batched_args)
-            for result in results:
-                for (i, c), risk_i_c in result:
-                    risk[i, c] = risk_i_c # type: ignore
-            assert torch.isfinite(risk[mask_predict_nodes]).all()
-        else:
-            args = [((i, c), generator.seed()) for i, c in itertools.product(np.where(mask_predict_nodes)[0], range(dataset.data.num_classes))]
-            result = compute_risk_job(args, deepcopy(model), deepcopy(dataset), verbose=self.verbose, compute_risk_on_subset=self.compute_risk_on_subset)
+        subset_size = min(self.successive_halving_initial_subset, idxs_risk.shape[0])
+        refit_approximation = self.successive_halving_approximation
+        num_candidates, subset_sizes, approximated, approximation_errors = [], [], [], []
+        for round_idx in itertools.count():
+            mask_risk = np.zeros_like(mask_train)
+            mask_risk[idxs_risk[:subset_size]] = True
+            jobs = list(itertools.product(idxs_candidates, range(dataset.data.num_classes)))
+            result, approximation_error = compute_risk_job_batched(jobs, model, dataset, batch_size=self.solver_config.solver_batch_size,
+                verbose=self.verbose, refit_approximation=refit_approximation, num_newton_steps=self.solver_config.num_newton_steps,
+                num_error_samples=self.successive_halving_error_samples, mask_risk=mask_risk)
             for (i, c), risk_i_c in result:
                 risk[i, c] = risk_i_c # type: ignore
-            assert torch.isfinite(risk[mask_predict_nodes]).all()
-
-        proxy = (risk * probabilities).sum(1)
-        return int(proxy.argmin().item()), {'risk' : risk, 'probabilities' : probabilities}
+            proxy = (risk[idxs_candidates] * probabilities[idxs_candidates]).sum(1)
+            num_candidates.append(idxs_candidates.shape[0])
+            subset_sizes.append(subset_size)
+            approximated.append(refit_approximation != RefitApproximation.EXACT)
+            approximation_errors.append(approximation_error.get('confidence_error_max', 0.0 if refit_approximation == RefitApproximation.EXACT else float('nan')))
+            
+            message = f'Successive halving round {round_idx}: Scored {idxs_candidates.shape[0]} candidate(s) on {subset_size} risk nodes ' \
+                      f'with {refit_approximation} refits'
+            if approximated[-1]:
+                message += f' (max. confidence error {approximation_errors[-1]:.2e})'
+            finished = idxs_candidates.shape[0] == 1 or (subset_size == idxs_risk.shape[0] and refit_approximation == RefitApproximation.EXACT)
+            if finished:
+                get_logger().info(f'{message}, acquiring the best')
+                break
+            num_keep = max(1, int(np.ceil(idxs_candidates.shape[0] * self.successive_halving_keep_fraction)))
+            get_logger().info(f'{message}, keeping {num_keep} with proxy risk <= {proxy.sort().values[num_keep - 1].item():.5f}')
+            idxs_candidates = idxs_candidates[proxy.argsort()[:num_keep].numpy()]
+            subset_size = min(int(np.ceil(subset_size / self.successive_halving_keep_fraction)), idxs_risk.shape[0])
+            refit_approximation = RefitApproximation.EXACT
+        
+        meta = {
+            'successive_halving_num_candidates' : torch.tensor(num_candidates),
+            'successive_halving_subset_sizes' : torch.tensor(subset_sizes),
+            'successive_halving_approximated' : torch.tensor(approximated),
+            'successive_halving_approximation_error' : torch.tensor(approximation_errors),
+        }
+        return int(idxs_candidates[proxy.argmin().item()]), risk, meta
     
 
-def compute_risk_job(jobs: List[Tuple[Tuple[int, int], int]], model: BaseModel, dataset: Dataset, verbose: bool=False,
-        compute_risk_on_subset: int | None = None) -> List[Tuple[Tuple[int, int], float]]:
-    from graph_al.model.sgc import SGC
-    from sklearn.linear_model import LogisticRegression
+def compute_expected_risk(mask_predict_nodes: np.ndarray, model: BaseModel, dataset: Dataset, generator: torch.Generator,
+        solver_config: BatchedSolverConfig, multiprocessing: bool = False, num_workers: int | None = None,
+        compute_risk_on_subset: int | None = None, verbose: bool = False) -> Tuple[Shaped[Tensor, 'num_nodes num_classes'], Dict[str, Tensor]]:
+    """ Computes the expected risk after labeling each node in `mask_predict_nodes` with each class for GEEM. The
+    regressions are refit with the batched solver, on the worker pool or sequentially.
+
+    Returns:
+        Shaped[Tensor, 'num_nodes num_classes']: the risk of each node and label, infinite for nodes that are not in `mask_predict_nodes`
+        Dict[str, Tensor]: the error of the refit approximation of the batched solver, if any
+    """
+    risk = torch.full((dataset.num_nodes, dataset.data.num_classes), np.inf, device=dataset.data.x.device)
+    meta = {}
+    if solver_config.batched_solver:
+        args = list(itertools.product(np.where(mask_predict_nodes)[0], range(dataset.data.num_classes)))
+        result, approximation_error = compute_risk_job_batched(args, model, dataset, batch_size=solver_config.solver_batch_size,
+            verbose=verbose, compute_risk_on_subset=compute_risk_on_subset, refit_approximation=solver_config.refit_approximation,
+            num_newton_steps=solver_config.num_newton_steps, num_error_samples=solver_config.refit_approximation_error_samples)
+        meta |= {f'refit_approximation_{name}' : torch.tensor(value) for name, value in approximation_error.items()}
+    elif multiprocessing:
+        args = list(itertools.product(np.where(mask_predict_nodes)[0], range(dataset.data.num_classes)))
+        args = list(zip(args, [draw_seed(generator) for _ in range(len(args))]))
+        result = compute_risk_job_parallel(args, model, dataset, num_workers=num_workers, verbose=verbose,
+                                           compute_risk_on_subset=compute_risk_on_subset)
+    else:
+        args = [((i, c), draw_seed(generator)) for i, c in itertools.product(np.where(mask_predict_nodes)[0], range(dataset.data.num_classes))]
+        result = compute_risk_job(args, deepcopy(model), deepcopy(dataset), verbose=verbose, compute_risk_on_subset=compute_risk_on_subset)
+    for (i, c), risk_i_c in result:
+        risk[i, c] = risk_i_c # type: ignore
+    assert torch.isfinite(risk[mask_predict_nodes]).all()
+    return risk, meta
 
+
+def risk_job_arrays(model: BaseModel, dataset: Dataset, compute_risk_on_subset: int | None = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """ The diffused features, labels, training mask and mask of nodes to compute the risk on for GEEM.
+    
+    Returns:
+        np.ndarray: diffused node features
+        np.ndarray: labels
+        np.ndarray: mask of training nodes
+        np.ndarray: mask of nodes on which the risk is computed
+    """
+    from graph_al.model.sgc import SGC
     assert isinstance(model, SGC), 'currently, we only support SGC for threaded GEEM'
 
     batch = dataset.data
     mask_train = batch.get_mask(DatasetSplit.TRAIN).cpu().numpy()
     x = model.get_diffused_node_features(batch).cpu().numpy()
-    y = dataset.data.y.cpu().numpy()
+    y = batch.y.cpu().numpy()
 
     mask_risk = ~mask_train
     if compute_risk_on_subset is not None: # For efficiency reasons, compute the risk only on a subset
@@ -100,29 +202,113 @@ def compute_risk_job(jobs: List[Tuple[Tuple[int, int], int]], model: BaseModel,
         idxs_risk = idxs_risk[:compute_risk_on_subset]
         mask_risk = np.zeros_like(mask_risk)
         mask_risk[idxs_risk] = True
+    return x, y, mask_train, mask_risk
+
+
+def compute_risks(jobs: List[Tuple[Tuple[int, int], int]], x: np.ndarray, y: np.ndarray, mask_train: np.ndarray, mask_risk: np.ndarray,
+        num_classes: int, C: float, solver: str, balanced: bool, verbose: bool=False) -> List[Tuple[Tuple[int, int], float]]:
+    """ Computes the expected risk after labeling node i with class c for each job ((i, c), seed) by refitting a logistic regression. 
+    `x`, `y`, `mask_train` and `mask_risk` are not modified. """
+    from sklearn.linear_model import LogisticRegression
 
+    y, mask_train = y.copy(), mask_train.copy()
     risks = []
     for (i, c), seed in tqdm(jobs, desc='Parallel computing expected risk', disable=not verbose):
         assert not mask_train[i]
-        label_i_true, y[i], mask_train[i] = dataset.data.y[i], c, True
+        label_i_true, y[i], mask_train[i] = y[i], c, True
         if np.unique(y[mask_train]).shape[0] == 1:
             # Weird "bug" in LogisticRegression that it can not fit with only one class
             # The prediction of the logistic regression classifier should be 1.0 for this one class
-            probabilities = np.zeros((dataset.num_nodes, dataset.data.num_classes))
+            probabilities = np.zeros((x.shape[0], num_classes))
             probabilities[:, c] = 1.0
         else:
-            regression = LogisticRegression(C=model.inverse_regularization_strength, solver=model.solver, # type: ignore
-                class_weight='balanced' if model.balanced else None)
+            regression = LogisticRegression(C=C, solver=solver, # type: ignore
+                class_weight='balanced' if balanced else None)
             regression.fit(x[mask_train], y[mask_train])
             probabilities = regression.predict_proba(x)
             del regression
 
-        risks.append(((i, c), 1 - probabilities[mask_risk].max(axis=1).mean()))
+        risks.append(((i, c), float(1 - probabilities[mask_risk].max(axis=1).mean())))
         y[i], mask_train[i] = label_i_true, False
     if verbose:
         print()
     return risks
 
 
+def compute_risk_job(jobs: List[Tuple[Tuple[int, int], int]], model: BaseModel, dataset: Dataset, verbose: bool=False,
+        compute_risk_on_subset: int | None = None) -> List[Tuple[Tuple[int, int], float]]:
+    x, y, mask_train, mask_risk = risk_job_arrays(model, dataset, compute_risk_on_subset=compute_risk_on_subset)
+    return compute_risks(jobs, x, y, mask_train, mask_risk, dataset.data.num_classes, C=model.inverse_regularization_strength, # type: ignore
+                         solver=model.solver, balanced=model.balanced, verbose=verbose) # type: ignore
+
+
+def compute_risk_job_parallel(jobs: List[Tuple[Tuple[int, int], int]], model: BaseModel, dataset: Dataset, num_workers: int | None = None,
+        verbose: bool=False, compute_risk_on_subset: int | None = None) -> List[Tuple[Tuple[int, int], float]]:
+    """ Like `compute_risk_job`, but distributes the jobs over the persistent worker pool. The features, labels and masks
+    are put into shared memory, so only the jobs are sent to the workers. """
+    x, y, mask_train, mask_risk = risk_job_arrays(model, dataset, compute_risk_on_subset=compute_risk_on_subset)
+    pool = get_worker_pool(num_workers)
+    chunk_size = max(1, int(np.ceil(len(jobs) / pool.num_workers)))
+    results = pool.starmap(compute_risks, [(chunk,) for chunk in batched(chunk_size, jobs)],
+        x=pool.share('geem/x', x), y=pool.share('geem/y', y), mask_train=pool.share('geem/mask_train', mask_train),
+        mask_risk=pool.share('geem/mask_risk', mask_risk), num_classes=dataset.data.num_classes,
+        C=model.inverse_regularization_strength, solver=model.solver, balanced=model.balanced, verbose=verbose) # type: ignore
+    return [risk for result in results for risk in result]
+
 
+def compute_risk_job_batched(jobs: List[Tuple[int, int]], model: BaseModel, dataset: Dataset, batch_size: int = 256,
+        verbose: bool=False, compute_risk_on_subset: int | None = None,
+        refit_approximation: RefitApproximation = RefitApproximation.EXACT, num_newton_steps: int = 10,
+        num_error_samples: int = 0, mask_risk: np.ndarray | None = None) -> Tuple[List[Tuple[Tuple[int, int], float]], Dict[str, float]]:
+    """ Like `compute_risk_job`, but fits the regressions of `batch_size` label configurations at once with a batched solver. 
+    All regressions start from the one fit to the current labels and are refit exactly or approximately.
+    If `mask_risk` is given, the risk is computed on these nodes instead of a random subset.
+    
+    Returns:
+        List[Tuple[Tuple[int, int], float]]: the risk of each job
+        Dict[str, float]: the error of the refit approximation against exact refits on `num_error_samples` jobs
+    """
+    from graph_al.model.sgc import SGC
+    from graph_al.model.logistic_regression import batched_logistic_regression, label_configurations, refit_approximation_error
+
+    assert isinstance(model, SGC), 'currently, we only support SGC for batched GEEM'
+
+    batch = dataset.data
+    mask_train = batch.get_mask(DatasetSplit.TRAIN).cpu()
+    x = model.get_diffused_node_features(batch).cpu()
+    y = batch.y.cpu()
+
+    if mask_risk is None:
+        mask_risk = ~mask_train.numpy()
+        if compute_risk_on_subset is not None: # For efficiency reasons, compute the risk only on a subset
+            idxs_risk = np.where(mask_risk)[0]
+            np.random.shuffle(idxs_risk)
+            idxs_risk = idxs_risk[:compute_risk_on_subset]
+            mask_risk = np.zeros_like(mask_risk)
+            mask_risk[idxs_risk] = True
+    mask_risk = torch.from_numpy(mask_risk)
+
+    regression = batched_logistic_regression(model)
+    regression.fit(x, y[None], mask_train[None], batch.num_classes)
+    coef, intercept = regression.coef_[0], regression.intercept_[0]
+
+    risks = []
+    for batch_jobs in tqdm(list(batched(batch_size, jobs)), desc='Batched computing expected risk', disable=not verbose):
+        idxs, labels = torch.tensor(batch_jobs, dtype=torch.long).T
+        assert not mask_train[idxs].any()
+        y_batch, mask_train_batch = label_configurations(y, mask_train, idxs, labels)
+        regression.refit(refit_approximation, x, y_batch, mask_train_batch, batch.num_classes, coef, intercept, y, mask_train,
+                         num_newton_steps=num_newton_steps)
+        probabilities = regression.predict_proba(x[mask_risk])
+        risk = 1 - probabilities.max(-1).values.mean(-1)
+        risks += [((int(i), int(c)), float(risk_i_c)) for (i, c), risk_i_c in zip(batch_jobs, risk)]
 
+    approximation_error = {}
+    if num_error_samples > 0 and refit_approximation != RefitApproximation.EXACT:
+        idxs_sample = np.random.choice(len(jobs), size=min(num_error_samples, len(jobs)), replace=False)
+        idxs, labels = torch.tensor([jobs[idx] for idx in idxs_sample], dtype=torch.long).T
+        y_batch, mask_train_batch = label_configurations(y, mask_train, idxs, labels)
+        approximation_error = refit_approximation_error(regression, refit_approximation, x, y_batch, mask_train_batch, batch.num_classes,
+                                                        coef, intercept, y, mask_train, mask_risk, num_newton_steps=num_newton_steps)
+        get_logger().info(f'Error of the {refit_approximation} refit approximation on {idxs.size(0)} label configurations: {approximation_error}')
+    return risks, approximation_error
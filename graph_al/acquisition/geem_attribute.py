@@ -1,6 +1,4 @@
 from copy import deepcopy
-from functools import partial
-from multiprocessing import Pool, cpu_count
 from typing import Dict, List, Tuple
 
 import itertools
@@ -12,13 +10,16 @@ from typeguard import typechecked
 from torch import Tensor,Generator
 
 from graph_al.acquisition.attribute import AcquisitionStrategyByAttribute
-from graph_al.acquisition.config import AcquisitionStrategyGEEMAttributeConfig
+from graph_al.acquisition.config import AcquisitionStrategyGEEMAttributeConfig, BatchedSolverConfig
+from graph_al.acquisition.geem import compute_expected_risk
 from graph_al.data.base import Data, Dataset
 from graph_al.data.config import DatasetSplit
 from graph_al.model.base import BaseModel
 from graph_al.model.config import ModelConfig
+from graph_al.model.enum import RefitApproximation
 from graph_al.model.prediction import Prediction
 from graph_al.utils.logging import get_logger
+from graph_al.utils.seed import draw_seed
 from graph_al.utils.timer import Timer
 from graph_al.utils.utils import batched
 
@@ -38,6 +39,8 @@ class AcquisitionStrategyGEEMAttribute(AcquisitionStrategyByAttribute):
         self.num_workers = config.num_workers
         self.compute_risk_on_subset = config.compute_risk_on_subset
         self.subsample_pool = config.subsample_pool
+        self.solver_config: BatchedSolverConfig = config
+        assert config.batched_solver or config.refit_approximation == RefitApproximation.EXACT, f'Refit approximations need the batched solver'
         
     @jaxtyped(typechecker=typechecked)
     def get_attribute(self, prediction: Prediction | None, model: BaseModel, dataset: Dataset, generator: Generator,
@@ -56,73 +59,7 @@ class AcquisitionStrategyGEEMAttribute(AcquisitionStrategyByAttribute):
             mask_predict_nodes = np.zeros_like(mask_predict_nodes)
             mask_predict_nodes[idxs_predict_nodes] = True
 
-        risk = torch.full_like(probabilities, np.inf)
-
-        if self.multiprocessing:
-            args = list(itertools.product(np.where(mask_predict_nodes)[0], range(dataset.data.num_classes)))
-            args = list(zip(args, [generator.seed() for _ in range(len(args))]))
-            chunk_size = int(np.ceil(len(args) / (self.num_workers or cpu_count())))
-            batched_args = [(x, deepcopy(model), deepcopy(dataset)) for x in batched(chunk_size, args)]
-            job = partial(compute_risk_job, verbose=self.verbose, compute_risk_on_subset=self.compute_risk_on_subset)
-            with Pool(processes=self.num_workers) as pool:
-                results = pool.starmap(job, batched_args)
-            for result in results:
-                for (i, c), risk_i_c in result:
-                    risk[i, c] = risk_i_c # type: ignore
-            assert torch.isfinite(risk[mask_predict_nodes]).all()
-        else:
-            args = [((i, c), generator.seed()) for i, c in itertools.product(np.where(mask_predict_nodes)[0], range(dataset.data.num_classes))]
-            result = compute_risk_job(args, deepcopy(model), deepcopy(dataset), verbose=self.verbose, compute_risk_on_subset=self.compute_risk_on_subset)
-            for (i, c), risk_i_c in result:
-                risk[i, c] = risk_i_c # type: ignore
-            assert torch.isfinite(risk[mask_predict_nodes]).all()
-
+        risk, _ = compute_expected_risk(mask_predict_nodes, model, dataset, generator, self.solver_config, multiprocessing=self.multiprocessing,
+                                        num_workers=self.num_workers, compute_risk_on_subset=self.compute_risk_on_subset, verbose=self.verbose)
         proxy = (risk * probabilities).sum(1)
         return proxy
-    
-
-def compute_risk_job(jobs: List[Tuple[Tuple[int, int], int]], model: BaseModel, dataset: Dataset, verbose: bool=False,
-        compute_risk_on_subset: int | None = None) -> List[Tuple[Tuple[int, int], float]]:
-    from graph_al.model.sgc import SGC
-    from sklearn.linear_model import LogisticRegression
-
-    assert isinstance(model, SGC), 'currently, we only support SGC for threaded GEEM'
-
-    batch = dataset.data
-    mask_train = batch.get_mask(DatasetSplit.TRAIN).numpy()
-    x = model.get_diffused_node_features(batch).numpy()
-    y = dataset.data.y.numpy()
-
-    mask_risk = ~mask_train
-    if compute_risk_on_subset is not None: # For efficiency reasons, compute the risk only on a subset
-        idxs_risk = np.where(mask_risk)[0]
-        np.random.shuffle(idxs_risk)
-        idxs_risk = idxs_risk[:compute_risk_on_subset]
-        mask_risk = np.zeros_like(mask_risk)
-        mask_risk[idxs_risk] = True
-
-    risks = []
-    for (i, c), seed in tqdm(jobs, desc='Parallel computing expected risk', disable=not verbose):
-        assert not mask_train[i]
-        label_i_true, y[i], mask_train[i] = dataset.data.y[i], c, True
-        if np.unique(y[mask_train]).shape[0] == 1:
-            # Weird "bug" in LogisticRegression that it can not fit with only one class
-            # The prediction of the logistic regression classifier should be 1.0 for this one class
-            probabilities = np.zeros((dataset.num_nodes, dataset.data.num_classes))
-            probabilities[:, c] = 1.0
-        else:
-            regression = LogisticRegression(C=model.inverse_regularization_strength, solver=model.solver, # type: ignore
-                class_weight='balanced' if model.balanced else None)
-            regression.fit(x[mask_train], y[mask_train])
-            probabilities = regression.predict_proba(x)
-            del regression
-
-        risks.append(((i, c), 1 - probabilities[mask_risk].max(axis=1).mean()))
-        y[i], mask_train[i] = label_i_true, False
-    if verbose:
-        print()
-    return risks
-
-
-
-
@@ -38,10 +38,9 @@ class AcquisitionStrategyLeaveOut(AcquisitionStrategyByAttribute):
                         model_config: ModelConfig) -> Tensor:
         node_risks = []
         for node in range(dataset.num_nodes):
-            data_clone = deepcopy(dataset.data)
-            edges = data_clone.edge_index
+            edges = dataset.data.edge_index
             mask = (edges[0] != node) & (edges[1] != node)
-            data_clone.edge_index = edges[:, mask]
+            data_clone = dataset.data.view(edge_index=edges[:, mask])
             pred_tmp = model.predict(data_clone,acquisition=True)
             risk = 1 - pred_tmp.get_probabilities(propagated=True)[0].max(dim=1)[0].mean()
             node_risks.append(risk)
@@ -31,3 +31,8 @@ class AcquisitionStrategyByPredictionAttribute(AcquisitionStrategyByAttribute):
         if prediction is None:
             raise ValueError(f'Can not derive prediction attribute if no prediction is given')
         return prediction.get_attribute(self.attribute, self.propagated)
+    
+    def tta_ranking_scores(self, prediction: Prediction, model: BaseModel, dataset: Dataset, generator: Generator,
+                           model_config: ModelConfig) -> Tensor | None:
+        attribute = self.get_attribute(prediction, model, dataset, generator, model_config)
+        return -attribute if self.higher_is_better else attribute
@@ -0,0 +1,128 @@
+import torch
+import torch.nn.functional as F
+from torch import Tensor, Generator
+from typing import Tuple
+
+from jaxtyping import jaxtyped, Float, Bool
+from typeguard import typechecked
+
+from graph_al.data.base import Data
+from graph_al.model.sgc import SGC
+from graph_al.acquisition.enum import NodeAugmentation
+from graph_al.acquisition.augmentation import AugmentationSampler
+
+
+class SGCAugmentationEngine:
+    """ Predicts augmented views of a graph with a SGC by exploiting that p = sigma(A^k X W^T + b) is linear in X.
+
+    Instead of diffusing the augmented (high-dimensional) node features of each view, features are first projected
+    onto the logit space and only the projections A^k (X W^T) are diffused. Column masks are applied to the weights
+    of the linear layer and use the diffused features of the clean graph, i.e. they need no diffusion at all. Additive
+    Gaussian noise is sampled directly in the logit space with covariance W W^T. Only views with
+    dropped edges or element-wise feature dropout need to be diffused, which is done in one pass for all views of a chunk.
+
+    Args:
+        model (SGC): the fitted model
+        data (Data): the graph that is augmented
+        sampler (AugmentationSampler): samples the augmentation masks
+    """
+
+    def __init__(self, model: SGC, data: Data, sampler: AugmentationSampler):
+        self.model = model
+        self.data = data
+        self.sampler = sampler
+        self.strat_node = sampler.strat_node
+        self.p_node = sampler.p_node
+        self.frozen_prediction = model._frozen_prediction if isinstance(model._frozen_prediction, int) else None
+        if self.frozen_prediction is not None:
+            return
+
+        model.set_model()
+        self.weight = model.model.linear.weight.detach().T # num_features, num_classes
+        self.bias = model.model.linear.bias.detach()
+        self.device = self.weight.device
+        self.x = data.x.to(self.device)
+        self.edge_index = data.edge_index.to(self.device)
+        self.projected = self.x @ self.weight # num_nodes, num_classes
+
+        self.augments_edges = sampler.augments_edges
+        match self.strat_node:
+            case NodeAugmentation.MASK | NodeAugmentation.ADAPTIVE:
+                if not self.augments_edges:
+                    self.diffused = model.get_diffused_node_features(data, cache=model.cached).to(self.device)
+            case NodeAugmentation.NOISE:
+                # Noise E W^T with E ~ N(0, I) has rows distributed as N(0, W W^T), which we sample from a factor L L^T = W W^T
+                eigenvalues, eigenvectors = torch.linalg.eigh(self.weight.T @ self.weight)
+                self.noise_factor = eigenvectors * eigenvalues.clamp(min=0).sqrt()
+            case NodeAugmentation.DROPOUT:
+                ...
+            case _:
+                if not self.augments_edges:
+                    self.projected_diffused = self.diffuse(self.projected, self.edge_index)
+
+    @torch.no_grad()
+    @jaxtyped(typechecker=typechecked)
+    def diffuse(self, x: Float[Tensor, 'num_nodes num_features'], edge_index: Tensor) -> Float[Tensor, 'num_nodes num_features']:
+        """ Diffuses features with the same normalized adjacency as the SGC. """
+        return self.model.get_diffused_node_features(Data(x=x, edge_index=edge_index), cache=False)
+
+    @jaxtyped(typechecker=typechecked)
+    def _collate_edges(self, edge_keep: Bool[Tensor, 'num_views num_edges']) -> Tensor:
+        """ Edges of a disjoint union of all views, where view k only keeps the edges in `edge_keep[k]` """
+        num_views, num_nodes = edge_keep.size(0), self.x.size(0)
+        offsets = torch.arange(num_views, device=self.device).view(num_views, 1, 1) * num_nodes
+        edge_index = (self.edge_index.unsqueeze(0) + offsets).transpose(0, 1) # 2, num_views, num_edges
+        return edge_index[:, edge_keep.to(self.device)]
+
+    @torch.no_grad()
+    def predict_views(self, num_views: int, generator: Generator) -> Tuple[Tensor, Tensor, Tensor, Tensor]:
+        """ Samples and predicts augmented views.
+
+        Args:
+            num_views (int): how many views to sample
+            generator (Generator): a rng
+
+        Returns:
+            Tensor: propagated probabilities, shape [num_views, 1, num_nodes, num_classes]
+            Tensor: unpropagated probabilities
+            Tensor: propagated logits
+            Tensor: unpropagated logits
+        """
+        if self.frozen_prediction is not None:
+            probs = torch.zeros((num_views, 1, self.data.num_nodes, self.data.num_classes), device=self.data.x.device)
+            probs[..., self.frozen_prediction] = 1.0
+            return probs, probs, probs, probs
+
+        num_nodes, num_features = self.x.size()
+        column_weights = None
+        # 1. Unpropagated logits (without bias) of each view
+        match self.strat_node:
+            case NodeAugmentation.MASK | NodeAugmentation.ADAPTIVE:
+                column_keep = self.sampler.sample_column_masks(num_views, num_features, generator)
+                column_weights = self.weight.unsqueeze(0) * column_keep.to(self.device).unsqueeze(-1)
+                unpropagated = torch.einsum('nd,kdc->knc', self.x, column_weights)
+            case NodeAugmentation.NOISE:
+                noise = torch.randn((num_views, num_nodes, self.weight.size(1)), generator=generator).to(self.device)
+                unpropagated = self.projected.unsqueeze(0) + self.p_node * (noise @ self.noise_factor.T)
+            case NodeAugmentation.DROPOUT:
+                unpropagated = self.sampler.sample_node_features(num_views, self.x, generator) @ self.weight
+            case _:
+                unpropagated = self.projected.unsqueeze(0).expand(num_views, -1, -1)
+
+        # 2. Propagated logits (without bias) of each view
+        if self.augments_edges:
+            edge_keep = self.sampler.sample_edge_masks(num_views, self.data, generator)
+            propagated = self.diffuse(unpropagated.reshape(num_views * num_nodes, -1),
+                                      self._collate_edges(edge_keep)).reshape(num_views, num_nodes, -1)
+        elif column_weights is not None:
+            propagated = torch.einsum('nd,kdc->knc', self.diffused, column_weights)
+        elif self.strat_node in (NodeAugmentation.NOISE, NodeAugmentation.DROPOUT):
+            # Views share the same edges: Stack them along the feature dimension for one diffusion
+            stacked = unpropagated.transpose(0, 1).reshape(num_nodes, -1)
+            propagated = self.diffuse(stacked, self.edge_index).reshape(num_nodes, num_views, -1).transpose(0, 1)
+        else:
+            propagated = self.projected_diffused.unsqueeze(0).expand(num_views, -1, -1)
+
+        logits, logits_unpropagated = propagated + self.bias, unpropagated + self.bias
+        probs, probs_unpropagated = F.softmax(logits, dim=-1), F.softmax(logits_unpropagated, dim=-1)
+        return tuple(tensor.unsqueeze(1) for tensor in (probs, probs_unpropagated, logits, logits_unpropagated)) # type: ignore
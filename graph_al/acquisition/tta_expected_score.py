@@ -18,6 +18,8 @@ from graph_al.model.prediction import Prediction
 from graph_al.model.sgc import SGC
 from graph_al.model.build import get_model
 from graph_al.acquisition.attribute import AcquisitionStrategyByAttribute
+from graph_al.acquisition.sgc_tta import SGCAugmentationEngine
+from graph_al.acquisition.tta_statistics import StreamingStatistics, TTAEarlyStopping
 from graph_al.acquisition.config import AcquisitionStrategyTTAExpectedQueryScoreConfig
 from graph_al.utils.logging import get_logger
 from graph_al.utils.timer import Timer
@@ -40,6 +42,11 @@ class AcquisitionStrategyTTAExpectedQueryScore(AcquisitionStrategyByAttribute):
         self.tta_filter = config.filter
         self.p_edge = config.p_edge
         self.p_node = config.p_node
+        self.tta_early_stopping = config.early_stopping
+        self.tta_min_num = config.min_num
+        self.tta_patience = config.patience
+        self.tta_top_k = config.top_k or config.num_to_acquire_per_step
+        self.tta_confidence = config.confidence
         print("p_node: ", self.p_node)
         print("p_edge: ", self.p_edge)
         from graph_al.acquisition.build import get_acquisition_strategy
@@ -53,37 +60,47 @@ class AcquisitionStrategyTTAExpectedQueryScore(AcquisitionStrategyByAttribute):
         
         proxy = self.embedded_strategy.get_attribute(prediction, model, dataset, generator, model_config)
         pred_o = prediction.get_probabilities(propagated=True).argmax(dim=-1)
-        cnt = torch.full_like(proxy, (self.num+1), dtype=torch.float)
+        sgc_engine = self.sgc_augmentation_engine(model, dataset.data) if isinstance(model, SGC) else None
+        # Scores are aggregated online, non-finite scores (e.g. of nodes outside the pool) are kept as is
+        statistics = StreamingStatistics()
+        finite = proxy.isfinite()
+        statistics.update(proxy.unsqueeze(0), finite.unsqueeze(0))
+        early_stopping = TTAEarlyStopping(self.tta_top_k, self.tta_min_num, self.tta_patience,
+                                          self.tta_confidence) if self.tta_early_stopping else None
+        sign = -1 if self.embedded_strategy.higher_is_better else 1
+        if self.higher_is_better:
+            sign = -sign
 
+        num_views_used = 0
         for i in range(self.num):
-            prediction_tta = self.tta_predict_single(model, model_config, dataset, generator,pred_o)
+            prediction_tta = self.tta_predict_single(model, model_config, dataset, generator,pred_o, sgc_engine=sgc_engine)
             score = self.embedded_strategy.get_attribute(prediction_tta, model, dataset, generator, model_config)
+            mask = finite.clone()
             if self.tta_filter:
                 pred = prediction_tta.get_probabilities(propagated=True).argmax(dim=-1)
-                mask = (pred != pred_o)[0]
-                score[mask] = 0
-                cnt[mask] -= 1
-            proxy += score 
-        proxy /= cnt   
+                mask &= (pred == pred_o)[0]
+            statistics.update(score.unsqueeze(0), mask.unsqueeze(0))
+            num_views_used += 1
+            if early_stopping is not None and early_stopping.step(sign * statistics.mean, dataset.data.mask_train_pool,
+                    1, num_views_used, standard_error=statistics.standard_error):
+                get_logger().info(f'Stopped test time augmentation after {num_views_used} of {self.num} views')
+                break
+        self.tta_num_views_used.append(num_views_used)
+        proxy = torch.where(finite, statistics.mean, proxy)
         if self.embedded_strategy.higher_is_better:
             proxy = -proxy
         return proxy
     
     
     
-    def tta_predict_single(self, model, model_config,dataset, generator,pred_o):
+    def tta_predict_single(self, model, model_config,dataset, generator,pred_o, sgc_engine: SGCAugmentationEngine | None = None):
         
-        data_clone = self.augment_data(dataset.data, generator)
-        from graph_al.model.sgc import SGC
-        if isinstance(model, SGC):
-            x = model.get_diffused_node_features(data_clone, cache= False).cpu().numpy()        
-            probs= model.logistic_regression.predict_proba(x)
-            probs_unprop= model.logistic_regression.predict_proba(data_clone.x.cpu().numpy())
-            logits = model.logistic_regression.decision_function(x)
-            logits_unprop= model.logistic_regression.decision_function(data_clone.x.cpu().numpy())
+        if sgc_engine is not None:
+            probs, probs_unprop, logits, logits_unprop = (tensor[0] for tensor in sgc_engine.predict_views(1, generator))
             p_tmp = Prediction(probabilities=probs, probabilities_unpropagated=probs_unprop, logits=logits, logits_unpropagated=logits_unprop)
 
         else:
+            data_clone = self.augment_data(dataset.data, generator)
             with torch.no_grad():
                 p_tmp = model.predict(data_clone, acquisition=True)
                 p_tmp.probabilities = p_tmp.get_probabilities(propagated=True)
@@ -99,80 +116,3 @@ class AcquisitionStrategyTTAExpectedQueryScore(AcquisitionStrategyByAttribute):
         #     p_tmp.probabilities_unpropagated[mask] = 0
 
         return p_tmp
-        
-        
-    def augment_data_edge(self, data, generator):
-        """
-        Augment the data using the model and generator.
-
-        Args:
-            data (torch_geometric.data.Data): The input data.
-            generator (torch.Generator): The random number generator.
-
-        Returns:
-            torch_geometric.data.Data: The augmented data.
-        """
-        edge_index = data.edge_index
-        match self.tta_strat_edge:
-            case "mask":
-                edge_index, edge_mask = dropout_edge(edge_index, p=self.p_edge)
-            case "adaptive":
-                edge_index = self.drop_edge_weighted(edge_index, self.drop_weights, p=self.p_edge, threshold=0.7).to(device=edge_index.device)
-            case "train_connection":
-                train_mask = data.mask_train[edge_index[0]] | data.mask_train[edge_index[1]]
-                edge_probs = torch.full((edge_index.size(1),), self.p_edge, device=edge_index.device)
-                edge_probs[train_mask] = 0.8
-                edge_to_drop = torch.bernoulli(edge_probs).to(torch.bool)
-                edge_index = edge_index[:, ~edge_to_drop]
-            case _:
-                edge_index = edge_index
-        return edge_index
-    
-    
-    def augment_data_node(self, data, generator):
-        """
-        Augment the data using the model and generator.
-
-        Args:
-            data (torch_geometric.data.Data): The input data.
-            generator (torch.Generator): The random number generator.
-
-        Returns:
-            torch_geometric.data.Data: The augmented data.
-        """
-        x = data.x
-        match self.tta_strat_node:
-            case "dropout":
-                return torch.nn.functional.dropout(x, p=self.p_node, training=True)
-            case "mask":
-                return mask_feature(x, p=self.p_node, mode='col')[0]
-            case "noise":
-                noise_mask = torch.randn_like(x) * self.p_node
-                return x + noise_mask
-            case "adaptive":
-                return self.drop_feature_weighted_2(x, self.feature_weights, p=self.p_node).to(device=x.device)
-            case _:
-                return x
-    
-    def augment_data(self, data, generator):
-        """
-        Augment the data using the model and generator.
-
-        Args:
-            data (torch_geometric.data.Data): The input data.
-            generator (torch.Generator): The random number generator.
-
-        Returns:
-            torch_geometric.data.Data: The augmented data.
-        """
-        
-        if self.tta_strat_node == "adaptive" and self.feature_weights is None:
-            self.feature_weights = torch.load('feature_weights.pt')
-        if self.tta_strat_edge == "adaptive" and self.drop_weights is None:
-            self.drop_weights = torch.load('drop_weights.pt')
-        
-        data_clone = deepcopy(data)
-        data_clone.x = self.augment_data_node(data_clone, generator)
-        data_clone.edge_index = self.augment_data_edge(data_clone, generator)
-        return data_clone
-       
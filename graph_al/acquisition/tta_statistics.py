@@ -0,0 +1,115 @@
+import torch
+from torch import Tensor
+
+from jaxtyping import jaxtyped, Shaped, Bool, Float
+from typeguard import typechecked
+
+
+class StreamingStatistics:
+    """ Online mean and variance of per-node quantities over augmented views (Welford's algorithm).
+
+    Chunks of views are merged with the parallel update of Chan et al., such that predicting views one by one
+    or in chunks gives the same statistics. Each value can be individually excluded (e.g. filtered views) with a mask.
+    """
+
+    def __init__(self):
+        self.count: Tensor | None = None
+        self.mean: Tensor | None = None
+        self.m2: Tensor | None = None
+
+    @jaxtyped(typechecker=typechecked)
+    def update(self, values: Shaped[Tensor, 'num_views num_nodes ...'], mask: Bool[Tensor, 'num_views num_nodes'] | None = None):
+        """ Adds the values of a chunk of views.
+
+        Args:
+            values (Tensor): values of each view, shape [num_views, num_nodes, ...]
+            mask (Tensor | None): which values to include, shape [num_views, num_nodes]. If None, all are included.
+        """
+        values = values.float()
+        if mask is None:
+            mask = torch.ones(values.size()[:2], dtype=torch.bool, device=values.device)
+        weight = mask.to(values.device).float().view(*mask.size(), *([1] * (values.dim() - 2)))
+        batch_count = weight.sum(0)
+        batch_mean = (values * weight).sum(0) / batch_count.clamp(min=1)
+        batch_m2 = (((values - batch_mean) ** 2) * weight).sum(0)
+        if self.count is None or self.mean is None or self.m2 is None:
+            self.count, self.mean, self.m2 = batch_count, batch_mean, batch_m2
+            return
+        count = self.count + batch_count
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * batch_count / count.clamp(min=1)
+        self.m2 = self.m2 + batch_m2 + delta ** 2 * self.count * batch_count / count.clamp(min=1)
+        self.count = count
+
+    @property
+    def variance(self) -> Tensor:
+        """ Unbiased sample variance. """
+        assert self.count is not None and self.m2 is not None, 'No values were added yet'
+        return self.m2 / (self.count - 1).clamp(min=1)
+
+    @property
+    def standard_error(self) -> Tensor:
+        """ Standard error of the mean. """
+        assert self.count is not None
+        return (self.variance / self.count.clamp(min=1)).sqrt()
+
+
+class TTAEarlyStopping:
+    """ Decides when to stop drawing augmented views because more views will not change which nodes are acquired.
+
+    Drawing stops once the ranking of the `top_k` best pool nodes has not changed over the last `patience` views, or
+    once the confidence intervals of the `top_k` best pool nodes are separated from the ones of the remaining pool.
+
+    Args:
+        top_k (int): how many of the best nodes need to be stable
+        min_num (int): the minimal number of views to draw
+        patience (int): for how many views the ranking needs to be stable
+        confidence (float | None): confidence level of the intervals, if None, intervals are not used
+    """
+
+    def __init__(self, top_k: int, min_num: int, patience: int, confidence: float | None = None):
+        self.top_k = top_k
+        self.min_num = min_num
+        self.patience = patience
+        if confidence is None:
+            self.z = None
+        else:
+            self.z = torch.distributions.Normal(0.0, 1.0).icdf(torch.tensor((1 + confidence) / 2)).item()
+        self.top: Tensor | None = None
+        self.num_stable = 0
+
+    @jaxtyped(typechecker=typechecked)
+    def step(self, scores: Float[Tensor, 'num_nodes'], mask_pool: Bool[Tensor, 'num_nodes'], num_views: int, num_views_total: int,
+             standard_error: Float[Tensor, 'num_nodes'] | None = None) -> bool:
+        """ Updates the ranking after drawing views.
+
+        Args:
+            scores (Tensor): the current estimate of the acquisition scores, lower is acquired first
+            mask_pool (Tensor): which nodes can be acquired
+            num_views (int): how many views were drawn since the last step
+            num_views_total (int): how many views were drawn overall
+            standard_error (Tensor | None): standard errors of the scores for confidence intervals
+
+        Returns:
+            bool: whether to stop drawing views
+        """
+        idx_pool = torch.where(mask_pool.to(scores.device))[0]
+        top_k = min(self.top_k, idx_pool.size(0))
+        order = idx_pool[torch.argsort(scores[idx_pool])]
+        top = order[:top_k]
+        if self.top is not None and torch.equal(top, self.top):
+            self.num_stable += num_views
+        else:
+            self.num_stable = 0
+        self.top = top
+
+        if num_views_total < self.min_num:
+            return False
+        if top_k == idx_pool.size(0) or self.num_stable >= self.patience:
+            return True
+        if self.z is not None and standard_error is not None:
+            upper = (scores[top] + self.z * standard_error[top]).max()
+            lower = (scores[order[top_k:]] - self.z * standard_error[order[top_k:]]).min()
+            if upper < lower:
+                return True
+        return False
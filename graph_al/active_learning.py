@@ -1,3 +1,4 @@
+import time
 import torch
 from graph_al.acquisition.base import BaseAcquisitionStrategy
 
@@ -6,9 +7,11 @@ from graph_al.data.base import Dataset
 from graph_al.model.base import Ensemble, BaseModel
 from graph_al.model.trainer.config import TrainerConfig
 from graph_al.utils.logging import get_logger
+from graph_al.utils.profiler import get_profiler
 from graph_al.model.trainer.build import get_trainer
 from graph_al.acquisition.build import get_acquisition_strategy
 from graph_al.evaluation.result import Result
+from graph_al.evaluation.enum import MetricName, MetricTemplate
 from graph_al.model.trainer.evaluation.evaluate import evaluate
 
 from jaxtyping import jaxtyped, Int
@@ -47,17 +50,22 @@ def train_model(config: TrainerConfig, model: BaseModel, dataset: Dataset, gener
     Returns:
         Result: the result
     """
-    if dataset.data.num_train == 0:
-        trainer = get_trainer(config, model, dataset, generator)
-    elif isinstance(model, Ensemble):
-        for _member in model.models:
-            member: BaseModel = _member # type: ignore
-            trainer = get_trainer(config, member, dataset, generator)
-            trainer.fit(member, dataset, generator, acquisition_step)
-        trainer = get_trainer(config, model, dataset, generator)
-    else:
-        trainer = get_trainer(config, model, dataset, generator)
-        trainer.fit(model, dataset, generator, acquisition_step)
+    start = time.perf_counter()
+    with get_profiler().phase('training'):
+        if dataset.data.num_train == 0:
+            trainer = get_trainer(config, model, dataset, generator)
+        elif isinstance(model, Ensemble):
+            for _member in model.models:
+                member: BaseModel = _member # type: ignore
+                trainer = get_trainer(config, member, dataset, generator)
+                trainer.fit(member, dataset, generator, acquisition_step)
+            trainer = get_trainer(config, model, dataset, generator)
+        else:
+            trainer = get_trainer(config, model, dataset, generator)
+            trainer.fit(model, dataset, generator, acquisition_step)
+    training_time = time.perf_counter() - start
     # Run evaluation after fitting
-    metrics = evaluate(config.evaluation, model, trainer, dataset, generator)
+    with get_profiler().phase('evaluation'):
+        metrics = evaluate(config.evaluation, model, trainer, dataset, generator)
+    metrics[MetricTemplate(name=MetricName.TRAINING_TIME)] = training_time
     return Result(metrics, dataset.data.class_counts_train.cpu(), acquisition_step=acquisition_step)
\ No newline at end of file
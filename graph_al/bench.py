@@ -0,0 +1,222 @@
+""" Benchmarks one acquisition step of every acquisition strategy on synthetic CSBM graphs of increasing size.
+
+Usage:
+    python -m graph_al.bench --output bench.json --baseline bench_baseline.json
+
+The report lists the time of one acquisition step per strategy and graph size, the empirical scaling exponent
+of each strategy (the slope of log time over log number of nodes) and, if a baseline report is given, the
+slowdown relative to it. The benchmark runs on cpu and does not need network access.
+
+`bench_baseline.json` in the repository root was recorded with the default settings. Timings depend on the machine,
+so record a baseline on the same machine before comparing against it.
+"""
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import traceback
+from pathlib import Path
+from typing import Any, Dict, List
+
+import hydra
+import numpy as np
+import pandas as pd
+import torch
+from hydra import compose, initialize_config_dir
+from omegaconf import OmegaConf
+
+from graph_al.config import Config
+from graph_al.acquisition.build import get_acquisition_strategy
+from graph_al.acquisition.base import mask_not_in_val
+from graph_al.active_learning import initial_acquisition, train_model
+from graph_al.model.build import get_model
+from graph_al.scheduler import load_dataset, derived_generator, resolve_acquisition_config, _STREAM_SPLIT, _STREAM_TRAJECTORY
+from graph_al.utils.logging import get_logger
+
+CONFIG_DIR = Path(__file__).parent.parent / 'config'
+
+# Strategies that can not run on a plain CSBM with a GCN, e.g. because they need a specific model
+DEFAULT_EXCLUDED_STRATEGIES = ('oracle', 'seal', 'best_split', 'best_split_ordered')
+
+
+def all_strategies() -> List[str]:
+    """ Names of all acquisition strategy configurations. """
+    return sorted(path.stem for path in (CONFIG_DIR / 'acquisition_strategy').glob('*.yaml'))
+
+def benchmark_config(strategy: str, num_nodes: int, args: argparse.Namespace, output_dir: str) -> Config:
+    """ Composes the configuration of a run on a CSBM with `num_nodes` nodes. """
+    if not OmegaConf.has_resolver('eval'):
+        OmegaConf.register_new_resolver('eval', lambda expression: eval(expression, {'np' : np}))
+    with initialize_config_dir(config_dir=str(CONFIG_DIR.absolute()), version_base=None):
+        config_dict = compose('main', overrides=[
+            f'data={args.data}', f'data.num_nodes={num_nodes}', f'data.name={args.data}_{num_nodes}',
+            f'model={args.model}', f'acquisition_strategy={strategy}', f'seed={args.seed}',
+            f'acquisition_strategy.num_to_acquire_per_step={args.num_to_acquire}',
+            'progress_bar=False', 'print_summary=False', 'wandb.disable=True', f'output_base_dir={output_dir}',
+        ] + list(args.overrides))
+    OmegaConf.resolve(config_dict)
+    config: Config = hydra.utils.instantiate(config_dict, _convert_='object')
+    # Test time augmentation is only timed if requested with `acquisition_strategy.tta_enabled=true`
+    resolve_acquisition_config(config)
+    return config
+
+def benchmark_acquisition_step(config: Config, num_repeats: int) -> Dict[str, Any]:
+    """ Times one acquisition step after the initial acquisition and training.
+
+    Each repetition uses a freshly built acquisition strategy and the same rng state, so they do the same work.
+
+    Returns:
+        Dict[str, Any]: the timings in seconds
+    """
+    assert config.seed is not None
+    dataset = load_dataset(config)
+    acquisition_strategy = get_acquisition_strategy(config.acquisition_strategy, dataset)
+    initial_acquisition_strategy = get_acquisition_strategy(config.initial_acquisition_strategy, dataset)
+    dataset.split(generator=derived_generator(config.seed, _STREAM_SPLIT, 0),
+                  mask_not_in_val=mask_not_in_val(acquisition_strategy, initial_acquisition_strategy))
+    generator = derived_generator(config.seed, _STREAM_TRAJECTORY, 0, 0)
+    model = get_model(config.model, dataset, generator)
+    dataset.reset_train_idxs()
+    initial_acquisition(initial_acquisition_strategy, config, model, dataset, generator)
+    model.reset_cache()
+    train_model(config.model.trainer, model, dataset, generator, acquisition_step=0)
+    model = model.eval()
+    rng_state = generator.get_state()
+
+    times = []
+    for _ in range(num_repeats):
+        acquisition_strategy = get_acquisition_strategy(config.acquisition_strategy, dataset)
+        acquisition_strategy.reset()
+        generator.set_state(rng_state)
+        start = time.perf_counter()
+        with torch.no_grad():
+            acquisition_strategy.acquire(model, dataset, config.acquisition_strategy.num_to_acquire_per_step, config.model, generator)
+        times.append(time.perf_counter() - start)
+    return {
+        'num_edges' : int(dataset.data.edge_index.size(1)),
+        'time_median' : float(np.median(times)),
+        'time_min' : float(np.min(times)),
+        'time_max' : float(np.max(times)),
+    }
+
+def scaling_exponents(timings: pd.DataFrame) -> Dict[str, float]:
+    """ Fits time ~ num_nodes^exponent for each strategy with at least two successful sizes. """
+    exponents = {}
+    for strategy, group in timings.dropna(subset=['time_median']).groupby('strategy'):
+        if group['num_nodes'].nunique() < 2:
+            continue
+        exponents[str(strategy)] = float(np.polyfit(np.log(group['num_nodes']), np.log(group['time_median']), 1)[0])
+    return exponents
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any], max_slowdown: float,
+                        min_time: float = 0.0) -> List[Dict[str, Any]]:
+    """ Compares the median timings of a report to a baseline report.
+
+    Args:
+        report (Dict[str, Any]): the current report
+        baseline (Dict[str, Any]): the baseline report
+        max_slowdown (float): ratio of current and baseline time above which a timing is flagged as a regression
+        min_time (float): timings that are faster than this in both reports are too noisy to be flagged
+
+    Returns:
+        List[Dict[str, Any]]: one comparison per strategy and size that are in both reports
+    """
+    baseline_times = {(row['strategy'], row['num_nodes']) : row['time_median'] for row in baseline['timings']
+                      if row.get('time_median') is not None}
+    comparison = []
+    for row in report['timings']:
+        key = (row['strategy'], row['num_nodes'])
+        if row.get('time_median') is None or key not in baseline_times:
+            continue
+        slowdown = row['time_median'] / max(baseline_times[key], 1e-12)
+        comparison.append({
+            'strategy' : row['strategy'],
+            'num_nodes' : row['num_nodes'],
+            'time_median' : row['time_median'],
+            'baseline_time_median' : baseline_times[key],
+            'slowdown' : slowdown,
+            'regression' : slowdown > max_slowdown and max(row['time_median'], baseline_times[key]) >= min_time,
+        })
+    return comparison
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """ Runs the benchmark for all strategies and sizes and builds the report. """
+    strategies = args.strategies or [strategy for strategy in all_strategies() if strategy not in DEFAULT_EXCLUDED_STRATEGIES]
+    rows = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for strategy in strategies:
+            for num_nodes in sorted(args.sizes):
+                row: Dict[str, Any] = {'strategy' : strategy, 'num_nodes' : num_nodes}
+                try:
+                    config = benchmark_config(strategy, num_nodes, args, output_dir)
+                    row.update(benchmark_acquisition_step(config, args.num_repeats))
+                except Exception as e:
+                    get_logger().warning(f'Benchmark of {strategy} with {num_nodes} nodes failed: {e}')
+                    if args.verbose:
+                        traceback.print_exc()
+                    row.update({'num_edges' : None, 'time_median' : None, 'time_min' : None, 'time_max' : None,
+                                'error' : f'{type(e).__name__}: {e}'})
+                print(f'{strategy:>40} {num_nodes:>8} nodes: ' + (f'{row["time_median"]:.4f}s' if row['time_median'] is not None else row['error']))
+                rows.append(row)
+
+    timings = pd.DataFrame(rows)
+    report: Dict[str, Any] = {
+        'environment' : {
+            'python' : platform.python_version(),
+            'torch' : torch.__version__,
+            'platform' : platform.platform(),
+            'processor' : platform.processor(),
+            'num_threads' : torch.get_num_threads(),
+        },
+        'settings' : {'data' : args.data, 'model' : args.model, 'seed' : args.seed, 'sizes' : sorted(args.sizes),
+                      'num_repeats' : args.num_repeats, 'num_to_acquire' : args.num_to_acquire,
+                      'overrides' : list(args.overrides)},
+        'timings' : rows,
+        'scaling_exponents' : scaling_exponents(timings),
+    }
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            report['baseline_comparison'] = compare_to_baseline(report, json.load(f), args.max_slowdown, args.min_time)
+    return report
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmarks one acquisition step of each acquisition strategy on CSBM graphs.')
+    parser.add_argument('--strategies', nargs='*', default=None, help='Acquisition strategy configurations, all by default')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[100, 200, 400, 800], help='Number of nodes of the CSBM graphs')
+    parser.add_argument('--model', default='gcn', help='Model configuration')
+    parser.add_argument('--data', default='csbm_1000_4', help='CSBM data configuration whose number of nodes is varied')
+    parser.add_argument('--seed', type=int, default=1337)
+    parser.add_argument('--num-repeats', type=int, default=3, help='Timed repetitions of each acquisition step')
+    parser.add_argument('--num-to-acquire', type=int, default=1, help='Nodes acquired in the acquisition step')
+    parser.add_argument('--output', type=Path, default=Path('bench.json'), help='Json report, a csv of the timings is written next to it')
+    parser.add_argument('--baseline', type=Path, default=None, help='Json report to compare against')
+    parser.add_argument('--max-slowdown', type=float, default=1.5, help='Slowdown relative to the baseline that counts as a regression')
+    parser.add_argument('--min-time', type=float, default=0.01, help='Timings below this many seconds are never flagged as regressions')
+    parser.add_argument('--verbose', action='store_true', help='Print the tracebacks of failing strategies')
+    parser.add_argument('overrides', nargs='*', help='Additional hydra overrides, e.g. model.trainer.max_epochs=100')
+    return parser.parse_args(argv)
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    # The benchmark always runs on cpu
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    report = run_benchmark(args)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    pd.DataFrame(report['timings']).to_csv(args.output.with_suffix('.csv'), index=False)
+
+    for strategy, exponent in sorted(report['scaling_exponents'].items()):
+        print(f'{strategy:>40}: time ~ num_nodes^{exponent:.2f}')
+    regressions = [row for row in report.get('baseline_comparison', []) if row['regression']]
+    for row in regressions:
+        print(f'Regression of {row["strategy"]} with {row["num_nodes"]} nodes: {row["slowdown"]:.2f}x slower than the baseline')
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
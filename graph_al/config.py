@@ -44,6 +44,10 @@ class Config:
     initial_acquisition_strategy: AcquisitionStrategyConfig = field(default_factory=AcquisitionStrategyConfig)
     
     retrain_after_acquisition: bool = True
+    num_workers: int = 1 # How many trajectories (dataset splits x model initializations) to run in parallel processes
+    num_threads_per_worker: int | None = None # Torch threads of each worker, if None the cores are divided among workers
+    profile: bool = False # Record wall time, cpu time and memory of the phases of each acquisition step
+    checkpoint_dir: str | None = None # If given, trajectories are checkpointed after each acquisition step and resumed from there
     wandb: WandbConfig = field(default_factory=WandbConfig)
     
 
@@ -11,7 +11,9 @@ import itertools
 
 from graph_al.data.config import DataConfig, DatasetSplit
 from graph_al.utils.sampling import sample_from_mask
-from graph_al.utils.ppr import approximate_ppr_matrix, approximate_ppr_scores
+from graph_al.utils.ppr import SparsePPR, approximate_ppr_matrix, approximate_ppr_scores
+from graph_al.utils.adjacency import normalized_adjacency
+from graph_al.utils.centrality import pagerank
 from graph_al.utils.logging import get_logger
 from graph_al.data.transform import normalize_features
 from graph_al.data.enum import *
@@ -94,6 +96,38 @@ class BaseDataset:
 class Data(TorchGeometricData):
     """ A data instance. """
 
+    # Prefixes of lazily cached attributes and whether they depend on the node features (first) or edges (second)
+    _cached_attribute_dependencies = {
+        'diffused_node_features_' : (True, True),
+        'appr_scores_' : (False, True),
+        'log_appr_matrix_' : (False, True),
+        'sparse_ppr_' : (False, True),
+        'pagerank_' : (False, True),
+    }
+
+    def view(self, x: Tensor | None = None, edge_index: Tensor | None = None) -> 'Data':
+        """ A lightweight view on this instance that shares all tensors with it, except for the (optionally) swapped
+        node features and edges. As opposed to a deep copy, labels, masks and cached attributes are not copied. Cached
+        attributes that depend on swapped tensors are not visible in the view.
+
+        Args:
+            x (Tensor | None): the node features of the view. If `None`, the node features are shared.
+            edge_index (Tensor | None): the edges of the view. If `None`, the edges are shared.
+
+        Returns:
+            Data: the view
+        """
+        view = copy(self)
+        if x is not None:
+            view.x = x
+        if edge_index is not None:
+            view.edge_index = edge_index
+        for key in [key for key, _ in view]:
+            for prefix, (depends_on_x, depends_on_edges) in self._cached_attribute_dependencies.items():
+                if key.startswith(prefix) and ((depends_on_x and x is not None) or (depends_on_edges and edge_index is not None)):
+                    delattr(view, key)
+        return view
+
     @jaxtyped(typechecker=typechecked)
     def add_to_train_idxs(self, idxs: Int[Tensor, 'num_acquired']):
         """ Adds new indices to training indices. """
@@ -213,7 +247,7 @@ class Data(TorchGeometricData):
         edge_index, edge_weight = self.edge_index, getattr(self, 'edge_weight', None)
         x = self.x
         if normalize:
-            edge_index, edge_weight = tgnn.conv.gcn_conv.gcn_norm(  # yapf: disable
+            edge_index, edge_weight = normalized_adjacency(  # yapf: disable
                 edge_index, edge_weight, x.size(0),
                 improved=improved, add_self_loops=add_self_loops)
         elif edge_weight is None:
@@ -285,6 +319,44 @@ class Data(TorchGeometricData):
             setattr(self, key, log_appr_matrix)
         return log_appr_matrix
 
+    def get_pagerank(self, damping: float=0.85, tolerance: float=1e-6, cache: bool = True) -> Float[Tensor, 'num_nodes']:
+        """ Lazily computes pagerank centralities of all nodes on the sparse adjacency matrix
+        
+        Args:
+            damping (float): Probability of following an edge instead of teleporting
+            tolerance (float): Convergence tolerance of the power iteration
+        
+        Returns:
+            Float[Tensor, 'num_nodes']: The pagerank score for each node
+        """
+        key = f'pagerank_{damping:.4f}_{tolerance:.2e}'
+        pagerank_scores = getattr(self, key, None) if cache else None
+        if pagerank_scores is not None:
+            return pagerank_scores # type: ignore
+        
+        pagerank_scores = pagerank(self.edge_index, self.num_nodes, damping=damping, tolerance=tolerance)
+        if cache:
+            setattr(self, key, pagerank_scores)
+        return pagerank_scores
+
+    def sparse_ppr(self, teleport_probability: float=0.2, tolerance: float=1e-4) -> SparsePPR:
+        """ Lazily creates the sparse personalized page rank engine, which computes and caches ppr vectors per source node on demand
+        
+        Args:
+            teleport_probability (float): Teleport probability
+            tolerance (float): Tolerance of the forward push
+        
+        Returns:
+            SparsePPR: The engine that computes ppr vectors of requested source nodes
+        """
+        key = f'sparse_ppr_{teleport_probability:.4f}_{tolerance:.2e}'
+        sparse_ppr = getattr(self, key, None)
+        if sparse_ppr is None:
+            sparse_ppr = SparsePPR(self.edge_index, self.stochastic_adjacency_edge_weights, teleport_probability=teleport_probability,
+                                   tolerance=tolerance, num_nodes=self.num_nodes)
+            setattr(self, key, sparse_ppr)
+        return sparse_ppr
+
     @jaxtyped(typechecker=typechecked)
     def is_pseudo_labeled(self, 
                           probabilities: Float[Tensor, 'num_nodes num_classes'], delta: float = 0.6) -> Bool[Tensor, 'num_nodes']:
@@ -0,0 +1,47 @@
+import torch
+from torch import Tensor
+from typing import List
+
+from jaxtyping import jaxtyped, Shaped
+from typeguard import typechecked
+
+from graph_al.data.base import Data
+from graph_al.utils.adjacency import get_normalized_adjacency_cache
+
+# Node-level attributes that are repeated for each view in a disjoint union, such that models
+# that depend on labels or masks (e.g. the class prior of GPN) see a consistent graph
+_NODE_LEVEL_ATTRIBUTES = ('y', 'mask_train', 'mask_val', 'mask_test', 'mask_train_pool')
+
+@typechecked
+def collate_views_disjoint(views: List[Data], template: Data) -> Data:
+    """ Collates multiple (augmented) views of the same graph into one disjoint union graph.
+
+    Unlike `torch_geometric.data.Batch.from_data_list`, only node features, edges and
+    the node-level attributes of `template` are collated. Cached attributes (e.g. diffused
+    node features) are not copied into the union.
+
+    Args:
+        views (List[Data]): the views to collate, all of them must have the same number of nodes
+        template (Data): the graph the views were derived from
+
+    Returns:
+        Data: the disjoint union of all views, nodes of view `k` are at `k * num_nodes, ..., (k + 1) * num_nodes - 1`
+    """
+    num_views, num_nodes = len(views), template.num_nodes
+    edge_index = torch.cat([view.edge_index + idx * num_nodes for idx, view in enumerate(views)], dim=1)
+    # The union only lives for one prediction, so its normalization must not evict long-lived graphs from the cache
+    get_normalized_adjacency_cache().register_view(edge_index)
+    union = Data(x=torch.cat([view.x for view in views], dim=0), edge_index=edge_index,
+                 num_classes=template.num_classes)
+    for attribute in _NODE_LEVEL_ATTRIBUTES:
+        value = getattr(template, attribute, None)
+        if value is not None:
+            setattr(union, attribute, value.repeat(num_views))
+    return union
+
+@jaxtyped(typechecker=typechecked)
+def split_views(tensor: Shaped[Tensor, 'num_samples num_nodes_collated ...'], num_views: int) -> Shaped[Tensor, 'num_views num_samples num_nodes ...']:
+    """ Splits a prediction on a disjoint union of `num_views` views into per-view predictions. """
+    num_samples, num_nodes_collated = tensor.size(0), tensor.size(1)
+    split = tensor.reshape(num_samples, num_views, num_nodes_collated // num_views, *tensor.size()[2:])
+    return split.transpose(0, 1)
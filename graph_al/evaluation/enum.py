@@ -25,6 +25,8 @@ class MetricName(StrEnum):
     ACQUIRED_CLASS_DISTRIBUTION = 'acquired_class_distribution'
     # The acquired class counts
     ACQUIRED_CLASS_COUNTS = 'acquired_class_counts'
+    # Wall-clock time of training the model in seconds
+    TRAINING_TIME = 'training_time'
     
     # GPN specific
     UCE_LOSS = 'uce'
@@ -3,8 +3,11 @@ from graph_al.model.config import APPNPConfig
 from graph_al.data.base import Dataset, Data
 from graph_al.model.prediction import Prediction
 from graph_al.utils.utils import apply_to_optional_tensors
+from graph_al.utils.adjacency import normalized_adjacency
 
 import torch_geometric.nn as tgnn
+from torch_geometric.nn.conv.gcn_conv import gcn_norm
+from torch_geometric.typing import Adj
 import torch
 from torch import Tensor
 from jaxtyping import Float, Int, jaxtyped
@@ -31,8 +34,11 @@ class APPNP(BaseModelMonteCarloDropout):
             self.layers.append(nn.Linear(in_dim, out_dim))
             in_dim = out_dim
             
+        # The adjacency is normalized with the shared cache, see `normalize_adjacency`
+        self.add_self_loops = config.add_self_loops
+        self.cached = config.cached
         self.propagate = tgnn.APPNP(config.k, config.alpha, dropout=self.dropout,
-                                    cached=config.cached, add_self_loops=config.add_self_loops)
+                                    cached=config.cached, add_self_loops=False, normalize=False)
     @property
     def prediction_changes_at_eval(self) -> bool:
         return self.dropout > 0
@@ -41,6 +47,25 @@ class APPNP(BaseModelMonteCarloDropout):
         self.propagate._cached_edge_index = None
         self.propagate._cached_adj_t = None
 
+    def normalize_adjacency(self, x: Tensor, edge_index: Adj, edge_weight: Tensor | None) -> Tuple[Adj, Tensor | None]:
+        """ Normalizes the adjacency like `tgnn.APPNP` does, including its caching, but gets edge indices from the shared cache. """
+        propagate = self.propagate
+        if isinstance(edge_index, Tensor):
+            if propagate._cached_edge_index is None:
+                edge_index, edge_weight = normalized_adjacency(edge_index, edge_weight, x.size(0), add_self_loops=self.add_self_loops, dtype=x.dtype)
+                if self.cached:
+                    propagate._cached_edge_index = (edge_index, edge_weight)
+            else:
+                edge_index, edge_weight = propagate._cached_edge_index
+        else:
+            if propagate._cached_adj_t is None:
+                edge_index = gcn_norm(edge_index, edge_weight, x.size(0), add_self_loops=self.add_self_loops, dtype=x.dtype)
+                if self.cached:
+                    propagate._cached_adj_t = edge_index
+            else:
+                edge_index = propagate._cached_adj_t
+        return edge_index, edge_weight
+
     def reset_parameters(self, generator: torch.Generator):
         for layer in self.layers:
             conv: nn.Linear = layer # type: ignore
@@ -54,6 +79,7 @@ class APPNP(BaseModelMonteCarloDropout):
                                                                      Float[Tensor, 'num_nodes num_classes'],
                                                                      Float[Tensor, 'num_nodes num_classes']]:
         x, edge_index, edge_weight = batch.x, batch.edge_index, batch.edge_weight
+        edge_index, edge_weight = self.normalize_adjacency(x, edge_index, edge_weight)
         embeddings, embeddings_unpropagated = None, None
         for layer_idx, layer in enumerate(self.layers):
             x = layer(x)
@@ -17,17 +17,17 @@ import itertools
 from scipy.special import logsumexp
 import scipy.sparse as sp
 from tqdm import tqdm
-from multiprocessing import Pool, cpu_count
-from functools import partial
+from multiprocessing import cpu_count
 import math
 from dataclasses import asdict
 from copy import deepcopy
 
 from jaxtyping import jaxtyped, Float, Int, Bool, UInt64
 from typeguard import typechecked
-from typing import Tuple, Any
+from typing import Dict, Tuple, Any
 
 from graph_al.utils.utils import batched
+from graph_al.utils.worker_pool import SharedArray, SharedObject, WorkerPool, get_worker_pool
 
 class BayesOptimal(BaseModel):
 
@@ -287,6 +287,11 @@ class BayesOptimal(BaseModel):
         assignments, marginal_log_likelihoods = zip(*cache.items())
         return np.array(assignments), np.array(marginal_log_likelihoods)
     
+    def _shared_job_arguments(self, pool: WorkerPool, x: np.ndarray, y: np.ndarray) -> Dict[str, SharedArray | SharedObject]:
+        """ Puts the classifier, features and labels into the shared memory of the worker pool. """
+        return dict(classifier=pool.share_object('bayes_optimal/classifier', self), x=pool.share('bayes_optimal/x', x),
+                    y=pool.share('bayes_optimal/y', y))
+
     @jaxtyped(typechecker=typechecked)
     def get_likelihood_cache(self, x: Float[np.ndarray, 'num_nodes feature_dim'],
                          y: Int[np.ndarray, 'num_nodes'], likelihood_config: BayesianLikelihoodConfig) -> Tuple[Int[np.ndarray, 'num_assignments num_nodes'], Float[np.ndarray, 'num_assignments']]:
@@ -307,9 +312,9 @@ class BayesOptimal(BaseModel):
                 num_assignments_per_workers = max(1, num_assignments // (self.num_workers or cpu_count()))
                 iterator = [(start, min(num_assignments_per_workers, num_assignments - start)) 
                             for start in range(0, num_assignments, num_assignments_per_workers)]
-                job = partial(compute_all_conditional_log_likelihoods_job, y=y.copy(), x=x.copy(), classifier=deepcopy(self), likelihood_config=deepcopy(likelihood_config))
-                with Pool(processes=self.num_workers) as pool:
-                    results = pool.starmap(job, iterator)
+                pool = get_worker_pool(self.num_workers)
+                results = pool.starmap(compute_all_conditional_log_likelihoods_job, iterator, **self._shared_job_arguments(pool, x, y),
+                                       likelihood_config=deepcopy(likelihood_config))
                 assignments, log_likelihoods = zip(*results)
                 assignments, log_likelihoods = np.concatenate(assignments, axis=0), np.concatenate(log_likelihoods, axis=0)
             else:
@@ -438,12 +443,12 @@ class BayesOptimal(BaseModel):
                 seeds[:, :] = seeds[:, [0]] # Per node (row) use the same seed (-> same sampled assignments)
             
             if self.multiprocessing:
-                job = partial(approximate_log_likelihood_job, y=y.copy(), mask_fixed=mask_fixed.copy(), seeds=seeds.copy(), x=x.copy(), classifier=deepcopy(self),
-                    likelihood_config=deepcopy(likelihood_config))
-                with Pool(processes=self.num_workers) as pool:
-                    results = pool.starmap(job, iterator)
-                    for i, c, log_likelihood_ic in results:
-                        log_likelihood[i, c] = log_likelihood_ic
+                pool = get_worker_pool(self.num_workers)
+                results = pool.starmap(approximate_log_likelihood_job, iterator, **self._shared_job_arguments(pool, x, y),
+                                       mask_fixed=pool.share('bayes_optimal/mask_fixed', mask_fixed), seeds=seeds.copy(),
+                                       likelihood_config=deepcopy(likelihood_config))
+                for i, c, log_likelihood_ic in results:
+                    log_likelihood[i, c] = log_likelihood_ic
             else:
                 for i, c in iterator: 
                     j, k, log_likelihood_jk = approximate_log_likelihood_job(i, c, classifier=self, mask_fixed=mask_fixed.copy(),
@@ -515,9 +520,9 @@ class BayesOptimal(BaseModel):
             num_assignments_per_workers = max(1, num_assignments // (self.num_workers or cpu_count()))
             iterator = [(start, min(num_assignments_per_workers, num_assignments - start)) 
                         for start in range(0, num_assignments, num_assignments_per_workers)]
-            job = partial(compute_argmax_joint_likelihood_job, y=y.copy(), mask_fixed=mask_fixed.copy(), x=x.copy(), classifier=deepcopy(self))
-            with Pool(processes=self.num_workers) as pool:
-                results = pool.starmap(job, iterator)
+            pool = get_worker_pool(self.num_workers)
+            results = pool.starmap(compute_argmax_joint_likelihood_job, iterator, **self._shared_job_arguments(pool, x, y),
+                                   mask_fixed=pool.share('bayes_optimal/mask_fixed', mask_fixed), likelihood_config=deepcopy(likelihood_config))
             log_likelihoods, assignments = zip(*results)
             assignment = assignments[np.array(log_likelihoods).argmax()]
         else:
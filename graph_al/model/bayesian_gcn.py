@@ -7,6 +7,7 @@ from graph_al.utils.utils import apply_to_optional_tensors
 
 import torch_geometric.nn as tgnn
 from torch_geometric.nn.conv.gcn_conv import gcn_norm
+from graph_al.utils.adjacency import normalized_adjacency
 import torch
 from torch import Tensor
 from jaxtyping import Float, Int, jaxtyped
@@ -94,9 +95,9 @@ class BayesianGCNConv(tgnn.GCNConv):
             if isinstance(edge_index, Tensor):
                 cache = self._cached_edge_index
                 if cache is None:
-                    edge_index, edge_weight = gcn_norm(  # yapf: disable
+                    edge_index, edge_weight = normalized_adjacency(  # yapf: disable
                         edge_index, edge_weight, x.size(self.node_dim),
-                        self.improved, self.add_self_loops, self.flow, x.dtype)
+                        self.improved, self.add_self_loops, x.dtype)
                     if self.cached:
                         self._cached_edge_index = (edge_index, edge_weight)
                 else:
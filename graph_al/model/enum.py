@@ -42,6 +42,13 @@ class LogisticRegressionSolver(StrEnum):
     LIBLINEAR = 'liblinear'
     SAG = 'sag'
 
+@unique
+class RefitApproximation(StrEnum):
+    """ How logistic regressions that differ from a fitted one in one label are refit """
+    EXACT = 'exact' # fit until convergence
+    NEWTON = 'newton' # a few Newton steps from the fitted regression
+    INFLUENCE = 'influence' # one Newton step with the Hessian of the fitted regression, which is shared by all refits
+
 @unique
 class PredictionAttribute(StrEnum):
     """ Several prediction attributes """
@@ -4,8 +4,10 @@ from graph_al.model.config import GCNConfig
 from graph_al.data.base import Dataset, Data
 from graph_al.model.prediction import Prediction
 from graph_al.utils.utils import apply_to_optional_tensors
+from graph_al.utils.adjacency import normalized_adjacency
 
 import torch_geometric.nn as tgnn
+from torch_geometric.typing import Adj
 import torch
 from torch import Tensor
 from jaxtyping import Float, Int, jaxtyped
@@ -13,6 +15,29 @@ from typeguard import typechecked
 import torch.nn as nn
 import torch.nn.functional as F
 
+class CachedGCNConv(tgnn.GCNConv):
+    """ GCN convolution that gets the normalized adjacency from the shared cache instead of recomputing it on every call.
+    Sparse adjacencies are normalized by `tgnn.GCNConv` itself. """
+    
+    def forward(self, x: Tensor, edge_index: Adj, edge_weight: Tensor | None = None) -> Tensor:
+        if not (self.normalize and isinstance(edge_index, Tensor) and self.flow == 'source_to_target'):
+            return super().forward(x, edge_index, edge_weight)
+        cache = self._cached_edge_index
+        if cache is None:
+            edge_index, edge_weight = normalized_adjacency(  # yapf: disable
+                edge_index, edge_weight, x.size(self.node_dim),
+                self.improved, self.add_self_loops, x.dtype)
+            if self.cached:
+                self._cached_edge_index = (edge_index, edge_weight)
+        else:
+            edge_index, edge_weight = cache[0], cache[1]
+
+        x = self.lin(x)
+        out = self.propagate(edge_index, x=x, edge_weight=edge_weight, size=None)
+        if self.bias is not None:
+            out = out + self.bias
+        return out
+    
 class GCN(BaseModelMonteCarloDropout):
     """ GCN model. """
     
@@ -22,7 +47,7 @@ class GCN(BaseModelMonteCarloDropout):
         self.layers = nn.ModuleList()
         in_dim = dataset.num_input_features
         for out_dim in list(config.hidden_dims) + [dataset.data.num_classes]:
-            self.layers.append(tgnn.GCNConv(in_dim, out_dim, improved=config.improved,
+            self.layers.append(CachedGCNConv(in_dim, out_dim, improved=config.improved,
                                             cached=config.cached, add_self_loops=config.add_self_loops))
             in_dim = out_dim
         
@@ -34,7 +59,7 @@ class GCN(BaseModelMonteCarloDropout):
 
     def reset_parameters(self, generator = None):
         for layer in self.layers:
-            conv: tgnn.GCNConv = layer # type: ignore
+            conv: CachedGCNConv = layer # type: ignore
             conv.reset_parameters()
     
     @jaxtyped(typechecker=typechecked)
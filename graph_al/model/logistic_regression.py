@@ -0,0 +1,434 @@
+import torch
+from torch import Tensor
+from functools import partial
+from typing import Callable, Dict, Tuple
+
+from jaxtyping import jaxtyped, Float, Int, Bool
+from typeguard import typechecked
+
+from graph_al.model.enum import LogisticRegressionSolver, RefitApproximation
+from graph_al.model.sgc import SGC
+from graph_al.utils.logging import get_logger
+
+
+@jaxtyped(typechecker=typechecked)
+def balanced_class_weights(y: Int[Tensor, 'batch num_samples'], sample_mask: Bool[Tensor, 'batch num_samples'],
+                           num_classes: int) -> Float[Tensor, 'batch num_classes']:
+    """ Class weights like sklearn's `class_weight='balanced'`: n_samples / (n_classes_present * count(class)). """
+    counts = torch.zeros(y.size(0), num_classes, dtype=torch.float64, device=y.device)
+    counts.scatter_add_(1, y.clamp(min=0), sample_mask.to(torch.float64))
+    num_present = (counts > 0).sum(1, keepdim=True)
+    return torch.where(counts > 0, counts.sum(1, keepdim=True) / (num_present * counts.clamp(min=1)), torch.zeros_like(counts))
+
+
+class BatchedLogisticRegression:
+    """ Fits many multinomial logistic regressions with shared features at once.
+
+    Each element of the batch is one label configuration, i.e. labels and a mask of training samples over the same
+    features. The objective of each element is the one of sklearn's `LogisticRegression` with a multinomial loss
+    (e.g. solver 'lbfgs'): C * sum_i w_i * CE(x_i, y_i) + 1/2 ||W||^2, with an unpenalized intercept and sample weights
+    w_i from `class_weight`. Classes that do not appear in the training samples of an element get zero probability,
+    like sklearn, which only fits the classes it observes. If only two classes are observed, sklearn fits a binary
+    regression instead, which is matched by doubling the penalty (see `_penalty`). All elements are optimized with a
+    vectorized L-BFGS.
+
+    Args:
+        C (float): inverse regularization strength
+        balanced (bool): whether to use balanced class weights, i.e. sklearn's `class_weight='balanced'`
+        max_iter (int): maximal number of L-BFGS iterations
+        tol (float): stop when the largest absolute gradient of the (sample weight normalized) objective is below this
+        history_size (int): number of curvature pairs of L-BFGS
+    """
+
+    def __init__(self, C: float = 1.0, balanced: bool = False, max_iter: int = 100, tol: float = 1e-4,
+                 history_size: int = 10, max_line_search_steps: int = 25):
+        self.C = C
+        self.balanced = balanced
+        self.max_iter = max_iter
+        self.tol = tol
+        self.history_size = history_size
+        self.max_line_search_steps = max_line_search_steps
+
+    def _penalty(self, mask_classes: Bool[Tensor, 'batch num_classes']) -> Float[Tensor, 'batch']:
+        """ Strength of the l2 penalty of each element.
+
+        With two observed classes, sklearn fits a binary regression with a single weight vector w and the penalty 1/2 ||w||^2.
+        It is equivalent to the multinomial regression with w = W_1 - W_0, whose optimum is symmetric (W_0 = -W_1). There,
+        the penalty 1/2 ||w||^2 equals ||W_0||^2 + ||W_1||^2, i.e. twice the multinomial penalty.
+        """
+        is_binary = mask_classes.sum(1) == 2
+        return torch.where(is_binary, 2.0, 1.0).to(torch.float64) / self.C
+
+    def _loss_and_gradient(self, params: Float[Tensor, 'batch num_params'], x: Float[Tensor, 'num_samples num_features'],
+                           targets: Float[Tensor, 'batch num_samples num_classes'], sample_weight: Float[Tensor, 'batch num_samples'],
+                           mask_classes: Bool[Tensor, 'batch num_classes']) -> Tuple[Float[Tensor, 'batch'], Float[Tensor, 'batch num_params']]:
+        """ Objective of each element normalized by its total sample weight, like sklearn does internally. """
+        batch_size, num_classes = mask_classes.size()
+        params = params.view(batch_size, num_classes, -1)
+        weight, bias = params[..., :-1], params[..., -1]
+        logits = torch.einsum('nd,bcd->bnc', x, weight) + bias[:, None, :]
+        logits = logits.masked_fill(~mask_classes[:, None, :], -float('inf'))
+        log_probs = torch.log_softmax(logits, dim=-1).masked_fill(~mask_classes[:, None, :], 0.0)
+        scale = 1 / sample_weight.sum(1).clamp(min=1e-12)
+        loss = -(sample_weight * (targets * log_probs).sum(-1)).sum(1) * scale
+        penalty = self._penalty(mask_classes)
+        loss += (weight ** 2).sum((1, 2)) * scale * penalty / 2
+
+        grad_logits = (log_probs.exp() * mask_classes[:, None, :] - targets) * (sample_weight * scale[:, None])[..., None]
+        grad_weight = torch.einsum('bnc,nd->bcd', grad_logits, x) + weight * (scale * penalty)[:, None, None]
+        grad = torch.cat([grad_weight, grad_logits.sum(1)[..., None]], dim=-1) * mask_classes[..., None]
+        return loss, grad.view(batch_size, -1)
+
+    @jaxtyped(typechecker=typechecked)
+    def fit(self, x: Float[Tensor, 'num_nodes num_features'], y: Int[Tensor, 'batch num_nodes'],
+            mask_train: Bool[Tensor, 'batch num_nodes'], num_classes: int,
+            coef_init: Float[Tensor, '*batch_init num_classes num_features'] | None = None,
+            intercept_init: Float[Tensor, '*batch_init num_classes'] | None = None) -> 'BatchedLogisticRegression':
+        """ Fits one logistic regression per label configuration.
+
+        Args:
+            x (Float[Tensor, 'num_nodes num_features']): the features shared by all configurations
+            y (Int[Tensor, 'batch num_nodes']): the labels of each configuration, only relevant where `mask_train` is set
+            mask_train (Bool[Tensor, 'batch num_nodes']): the training samples of each configuration
+            num_classes (int): the number of classes
+            coef_init (Float[Tensor, '*batch_init num_classes num_features'] | None): optional warm start of the weights
+            intercept_init (Float[Tensor, '*batch_init num_classes'] | None): optional warm start of the intercepts
+
+        Returns:
+            BatchedLogisticRegression: self, with `coef_`, `intercept_` and `classes_mask_`
+        """
+        params, *args = self._prepare(x, y, mask_train, num_classes, coef_init, intercept_init)
+        self.n_iter_ = self._minimize(params, *args)
+        return self._set_parameters(params, args[-1])
+
+    def _prepare(self, x: Float[Tensor, 'num_nodes num_features'], y: Int[Tensor, 'batch num_nodes'],
+                 mask_train: Bool[Tensor, 'batch num_nodes'], num_classes: int,
+                 coef_init: Float[Tensor, '*batch_init num_classes num_features'] | None = None,
+                 intercept_init: Float[Tensor, '*batch_init num_classes'] | None = None,
+                 mask_samples: Bool[Tensor, 'num_nodes'] | None = None) -> Tuple[Tensor, Tensor, Tensor, Tensor, Tensor]:
+        """ Initial parameters, features, one-hot targets, sample weights and observed classes of each configuration.
+        Only samples that are used in any configuration (or `mask_samples`) enter the objective. """
+        batch_size, num_features = y.size(0), x.size(1)
+        mask_samples = mask_train.any(0) if mask_samples is None else mask_samples | mask_train.any(0)
+        idxs_samples = torch.where(mask_samples)[0]
+        x_train = x[idxs_samples].to(torch.float64)
+        y_train, mask = y[:, idxs_samples], mask_train[:, idxs_samples]
+
+        if self.balanced:
+            class_weight = balanced_class_weights(y_train, mask, num_classes)
+            sample_weight = class_weight.gather(1, y_train.clamp(min=0)) * mask
+        else:
+            sample_weight = mask.to(torch.float64)
+        targets = torch.zeros(batch_size, y_train.size(1), num_classes, dtype=torch.float64, device=x.device)
+        targets.scatter_(2, y_train.clamp(min=0)[..., None], 1.0)
+        targets *= mask[..., None]
+        mask_classes = targets.sum(1) > 0
+
+        params = torch.zeros(batch_size, num_classes, num_features + 1, dtype=torch.float64, device=x.device)
+        if coef_init is not None:
+            params[..., :-1] = coef_init.to(params)
+        if intercept_init is not None:
+            params[..., -1] = intercept_init.to(params)
+        params = (params * mask_classes[..., None]).view(batch_size, -1)
+        return params, x_train, targets, sample_weight, mask_classes
+
+    def _set_parameters(self, params: Float[Tensor, 'batch num_params'], mask_classes: Bool[Tensor, 'batch num_classes']) -> 'BatchedLogisticRegression':
+        params = params.view(*mask_classes.size(), -1)
+        self.coef_, self.intercept_ = params[..., :-1], params[..., -1]
+        self.classes_mask_ = mask_classes
+        return self
+
+    def _hessian_vector_product(self, params: Float[Tensor, 'batch_params num_params'], vectors: Float[Tensor, 'batch num_params'],
+                                x: Float[Tensor, 'num_samples num_features'], sample_weight: Float[Tensor, 'batch_params num_samples'],
+                                mask_classes: Bool[Tensor, 'batch_params num_classes']) -> Float[Tensor, 'batch num_params']:
+        """ Products of the Hessians of the (normalized) objectives with `vectors`. A single set of parameters
+        (i.e. one Hessian) can be shared by all vectors. """
+        num_classes = mask_classes.size(1)
+        params, vectors = params.view(params.size(0), num_classes, -1), vectors.view(vectors.size(0), num_classes, -1)
+        logits = torch.einsum('nd,bcd->bnc', x, params[..., :-1]) + params[..., -1][:, None, :]
+        probs = torch.softmax(logits.masked_fill(~mask_classes[:, None, :], -float('inf')), dim=-1)
+        logits_vectors = torch.einsum('nd,bcd->bnc', x, vectors[..., :-1]) + vectors[..., -1][:, None, :]
+        scale = 1 / sample_weight.sum(1).clamp(min=1e-12)
+        grad_logits = probs * (logits_vectors - (probs * logits_vectors).sum(-1, keepdim=True))
+        grad_logits = grad_logits * (sample_weight * scale[:, None])[..., None]
+        product_weight = torch.einsum('bnc,nd->bcd', grad_logits, x) + vectors[..., :-1] * (scale * self._penalty(mask_classes))[:, None, None]
+        product = torch.cat([product_weight, grad_logits.sum(1)[..., None]], dim=-1) * mask_classes[..., None]
+        return product.view(vectors.size(0), -1)
+
+    def _hessian(self, params: Float[Tensor, 'num_params'], x: Float[Tensor, 'num_samples num_features'],
+                 sample_weight: Float[Tensor, 'num_samples'], mask_classes: Bool[Tensor, 'num_classes']) -> Float[Tensor, 'num_params num_params']:
+        """ The Hessian of the (normalized) objective of a single element. Rows of classes that are not observed are
+        the identity, so the Hessian stays invertible. """
+        num_classes = mask_classes.size(0)
+        params = params.view(num_classes, -1)
+        x = torch.cat([x, torch.ones_like(x[:, :1])], dim=1)
+        probs = torch.softmax((x @ params.T).masked_fill(~mask_classes[None, :], -float('inf')), dim=-1)
+        scale = 1 / sample_weight.sum().clamp(min=1e-12)
+        # sum_n w_n (diag(p_n) - p_n p_n^T) (x) x_n x_n^T, with the Kronecker product over classes and features
+        weighted = (probs * (sample_weight * scale)[:, None])[..., None] * x[:, None, :]
+        hessian = -weighted.flatten(1).T @ (probs[..., None] * x[:, None, :]).flatten(1)
+        blocks = torch.einsum('ncd,ne->cde', weighted, x)
+        hessian = hessian.view(num_classes, x.size(1), num_classes, x.size(1))
+        hessian[torch.arange(num_classes), :, torch.arange(num_classes), :] += blocks
+        penalty = torch.full((x.size(1),), (scale * self._penalty(mask_classes[None])[0]).item(), dtype=x.dtype, device=x.device)
+        penalty[-1] = 0 # the intercept is not penalized
+        hessian = hessian.reshape(num_classes * x.size(1), -1)
+        hessian += torch.diag(penalty.repeat(num_classes) + (~mask_classes).repeat_interleave(x.size(1)).to(x.dtype))
+        return hessian
+
+    def _conjugate_gradient(self, hessian_vector_product: Callable[[Tensor], Tensor], rhs: Float[Tensor, 'batch num_params'],
+                            max_iter: int, tol: float = 1e-10) -> Float[Tensor, 'batch num_params']:
+        """ Solves H z = rhs for each element of the batch with the conjugate gradient method. """
+        solution = torch.zeros_like(rhs)
+        residual, direction = rhs.clone(), rhs.clone()
+        residual_norm = (residual * residual).sum(1)
+        for _ in range(max_iter):
+            if residual_norm.max() <= tol:
+                break
+            product = hessian_vector_product(direction)
+            step = residual_norm / (direction * product).sum(1).clamp(min=1e-30)
+            solution += step[:, None] * direction
+            residual -= step[:, None] * product
+            residual_norm_new = (residual * residual).sum(1)
+            direction = residual + (residual_norm_new / residual_norm.clamp(min=1e-30))[:, None] * direction
+            residual_norm = residual_norm_new
+        return solution
+
+    @jaxtyped(typechecker=typechecked)
+    def fit_newton(self, x: Float[Tensor, 'num_nodes num_features'], y: Int[Tensor, 'batch num_nodes'],
+                   mask_train: Bool[Tensor, 'batch num_nodes'], num_classes: int,
+                   coef_init: Float[Tensor, '*batch_init num_classes num_features'],
+                   intercept_init: Float[Tensor, '*batch_init num_classes'], num_steps: int = 10,
+                   max_cg_iter: int = 50) -> 'BatchedLogisticRegression':
+        """ Approximates the fit by a few (truncated) Newton steps from warm-start parameters. When the warm start is
+        the fit to labels that differ in few nodes, it is already close to the optimum. Steps towards labels that the
+        warm start considers unlikely are damped by the line search though, so about 10 steps are needed to match exact fits.
+
+        Args:
+            num_steps (int): how many Newton steps to take
+            max_cg_iter (int): iterations of the conjugate gradient method that solves for each Newton step
+            (other arguments like `fit`)
+
+        Returns:
+            BatchedLogisticRegression: self, with `coef_`, `intercept_` and `classes_mask_`
+        """
+        params, x_train, targets, sample_weight, mask_classes = self._prepare(x, y, mask_train, num_classes, coef_init, intercept_init)
+        args = (x_train, targets, sample_weight, mask_classes)
+        loss, grad = self._loss_and_gradient(params, *args)
+        for _ in range(num_steps):
+            hessian_vector_product = partial(self._hessian_vector_product, params.clone(), x=x_train, sample_weight=sample_weight,
+                                             mask_classes=mask_classes)
+            direction = -self._conjugate_gradient(hessian_vector_product, grad, max_cg_iter)
+            # Far from the optimum, e.g. for an outlier label, full Newton steps overshoot
+            step, loss, grad, accepted = self._line_search(params, direction, loss, grad, torch.ones_like(loss, dtype=torch.bool), *args)
+            params += (step * accepted)[:, None] * direction
+        self.n_iter_ = torch.full((y.size(0),), num_steps, dtype=torch.long, device=params.device)
+        return self._set_parameters(params, mask_classes)
+
+    @jaxtyped(typechecker=typechecked)
+    def fit_influence(self, x: Float[Tensor, 'num_nodes num_features'], y: Int[Tensor, 'batch num_nodes'],
+                      mask_train: Bool[Tensor, 'batch num_nodes'], num_classes: int,
+                      coef: Float[Tensor, 'num_classes num_features'], intercept: Float[Tensor, 'num_classes'],
+                      y_fitted: Int[Tensor, 'num_nodes'], mask_train_fitted: Bool[Tensor, 'num_nodes']) -> 'BatchedLogisticRegression':
+        """ Approximates the fit with influence functions, i.e. one Newton step from a regression that was fit to
+        `y_fitted` and `mask_train_fitted`, using its Hessian for all configurations. The Hessian is factorized once
+        and the factorization is applied to the gradients of all configurations.
+
+        Args:
+            coef (Float[Tensor, 'num_classes num_features']): the weights of the fitted regression
+            intercept (Float[Tensor, 'num_classes']): the intercept of the fitted regression
+            y_fitted (Int[Tensor, 'num_nodes']): the labels the regression was fitted to
+            mask_train_fitted (Bool[Tensor, 'num_nodes']): the training samples the regression was fitted to
+            (other arguments like `fit`)
+
+        Returns:
+            BatchedLogisticRegression: self, with `coef_`, `intercept_` and `classes_mask_`
+        """
+        mask_samples = mask_train.any(0) | mask_train_fitted
+        params, x_train, targets, sample_weight, mask_classes = self._prepare(x, y, mask_train, num_classes, coef, intercept,
+                                                                              mask_samples=mask_samples)
+        params_fitted, _, _, sample_weight_fitted, mask_classes_fitted = self._prepare(x, y_fitted[None], mask_train_fitted[None],
+                                                                                       num_classes, coef[None], intercept[None],
+                                                                                       mask_samples=mask_samples)
+        args = (x_train, targets, sample_weight, mask_classes)
+        loss, grad = self._loss_and_gradient(params, *args)
+        hessian = self._hessian(params_fitted[0], x_train, sample_weight_fitted[0], mask_classes_fitted[0])
+        # Shifting all intercepts by the same constant does not change the objective, so the Hessian is only semi-definite
+        jitter = 1e-10 * hessian.diagonal().abs().max().clamp(min=1.0)
+        cholesky = torch.linalg.cholesky(hessian + jitter * torch.eye(hessian.size(0), dtype=hessian.dtype, device=hessian.device))
+        # The objectives are normalized by the total sample weight, which differs between configurations
+        rhs = grad * (sample_weight.sum(1) / sample_weight_fitted.sum(1))[:, None]
+        direction = -torch.cholesky_solve(rhs.T, cholesky).T * mask_classes.repeat_interleave(x.size(1) + 1, dim=1)
+        # The linearization overshoots for labels that the fitted regression considers unlikely
+        step, _, _, accepted = self._line_search(params, direction, loss, grad, torch.ones_like(loss, dtype=torch.bool), *args)
+        params += (step * accepted)[:, None] * direction
+        self.n_iter_ = torch.ones(y.size(0), dtype=torch.long, device=params.device)
+        return self._set_parameters(params, mask_classes)
+
+    def refit(self, approximation: RefitApproximation, x: Float[Tensor, 'num_nodes num_features'], y: Int[Tensor, 'batch num_nodes'],
+              mask_train: Bool[Tensor, 'batch num_nodes'], num_classes: int, coef: Float[Tensor, 'num_classes num_features'],
+              intercept: Float[Tensor, 'num_classes'], y_fitted: Int[Tensor, 'num_nodes'], mask_train_fitted: Bool[Tensor, 'num_nodes'],
+              num_newton_steps: int = 10) -> 'BatchedLogisticRegression':
+        """ Refits the regression that was fit to `y_fitted` and `mask_train_fitted` to each label configuration. """
+        match approximation:
+            case RefitApproximation.EXACT:
+                return self.fit(x, y, mask_train, num_classes, coef_init=coef, intercept_init=intercept)
+            case RefitApproximation.NEWTON:
+                return self.fit_newton(x, y, mask_train, num_classes, coef, intercept, num_steps=num_newton_steps)
+            case RefitApproximation.INFLUENCE:
+                return self.fit_influence(x, y, mask_train, num_classes, coef, intercept, y_fitted, mask_train_fitted)
+            case _:
+                raise ValueError(f'Unsupported refit approximation {approximation}')
+
+    def _line_search(self, params: Float[Tensor, 'batch num_params'], direction: Float[Tensor, 'batch num_params'],
+                     loss: Float[Tensor, 'batch'], grad: Float[Tensor, 'batch num_params'], active: Bool[Tensor, 'batch'],
+                     *args) -> Tuple[Tensor, Tensor, Tensor, Tensor]:
+        """ Backtracking line search with the Armijo condition, all elements step in parallel.
+
+        Returns:
+            Tensor: the step size of each element
+            Tensor: the loss after the step
+            Tensor: the gradient after the step
+            Tensor: which elements found a step with sufficient decrease
+        """
+        slope = (grad * direction).sum(1)
+        step = torch.ones_like(loss)
+        accepted = ~active
+        loss_new, grad_new = loss.clone(), grad.clone()
+        for _ in range(self.max_line_search_steps):
+            loss_try, grad_try = self._loss_and_gradient(params + step[:, None] * direction, *args)
+            satisfied = ~accepted & (loss_try <= loss + 1e-4 * step * slope)
+            loss_new = torch.where(satisfied, loss_try, loss_new)
+            grad_new = torch.where(satisfied[:, None], grad_try, grad_new)
+            accepted |= satisfied
+            if accepted.all():
+                break
+            step = torch.where(accepted, step, step / 2)
+        return step, loss_new, grad_new, accepted
+
+    def _minimize(self, params: Float[Tensor, 'batch num_params'], *args) -> Int[Tensor, 'batch']:
+        """ Vectorized L-BFGS with a backtracking (Armijo) line search that updates `params` in-place.
+
+        Elements of the batch that converged are frozen, while the others continue.
+
+        Returns:
+            Int[Tensor, 'batch']: the number of iterations of each element
+        """
+        batch_size = params.size(0)
+        loss, grad = self._loss_and_gradient(params, *args)
+        history_s, history_y, history_rho = [], [], []
+        active = grad.abs().amax(1) > self.tol
+        num_iterations = torch.zeros(batch_size, dtype=torch.long, device=params.device)
+
+        for _ in range(self.max_iter):
+            if not active.any():
+                break
+            # Two-loop recursion for the search direction
+            q = grad.clone()
+            alphas = []
+            for s, y, rho in zip(reversed(history_s), reversed(history_y), reversed(history_rho)):
+                alpha = rho * (s * q).sum(1)
+                q -= alpha[:, None] * y
+                alphas.append(alpha)
+            if len(history_s) > 0:
+                s, y = history_s[-1], history_y[-1]
+                gamma = torch.where(history_rho[-1] > 0, (s * y).sum(1) / (y * y).sum(1).clamp(min=1e-30), torch.ones_like(loss))
+            else:
+                gamma = 1 / grad.norm(dim=1).clamp(min=1.0)
+            direction = gamma[:, None] * q
+            for s, y, rho, alpha in zip(history_s, history_y, history_rho, reversed(alphas)):
+                beta = rho * (y * direction).sum(1)
+                direction += s * (alpha - beta)[:, None]
+            direction = -direction * active[:, None]
+            step, loss_new, grad_new, accepted = self._line_search(params, direction, loss, grad, active, *args)
+            # Elements without a sufficient decrease can not make progress anymore
+            moved = active & accepted
+            step = step * moved
+
+            s = step[:, None] * direction
+            y = grad_new - grad
+            sy = (s * y).sum(1)
+            params += s
+            loss_decrease = (loss - loss_new) / torch.maximum(loss.abs(), loss_new.abs()).clamp(min=1.0)
+            loss, grad = loss_new, grad_new
+            num_iterations += moved
+
+            # Skip curvature pairs that violate positive definiteness
+            history_s.append(s)
+            history_y.append(y)
+            history_rho.append(torch.where(sy > 1e-10, 1 / sy.clamp(min=1e-10), torch.zeros_like(sy)))
+            if len(history_s) > self.history_size:
+                history_s.pop(0), history_y.pop(0), history_rho.pop(0)
+            active = moved & (grad.abs().amax(1) > self.tol) & (loss_decrease > 1e-12)
+        return num_iterations
+
+    @jaxtyped(typechecker=typechecked)
+    def decision_function(self, x: Float[Tensor, 'num_nodes num_features']) -> Float[Tensor, 'batch num_nodes num_classes']:
+        """ Logits of each configuration, -inf for classes that were not observed. """
+        logits = torch.einsum('nd,bcd->bnc', x.to(self.coef_), self.coef_) + self.intercept_[:, None, :]
+        return logits.masked_fill(~self.classes_mask_[:, None, :], -float('inf'))
+
+    @jaxtyped(typechecker=typechecked)
+    def predict_proba(self, x: Float[Tensor, 'num_nodes num_features']) -> Float[Tensor, 'batch num_nodes num_classes']:
+        return torch.softmax(self.decision_function(x), dim=-1)
+
+
+def batched_logistic_regression(model: SGC) -> BatchedLogisticRegression:
+    """ A batched solver with the regularization and class weights of a SGC.
+
+    The batched solver optimizes the multinomial objective of sklearn's lbfgs solver. With liblinear, the SGC fits
+    one-vs-rest regressions with a penalized intercept instead, so the refits optimize a different model than the SGC.
+    """
+    if model.solver == LogisticRegressionSolver.LIBLINEAR:
+        get_logger().warning(f'The batched solver fits multinomial regressions, but the SGC uses the one-vs-rest solver '
+                             f'{model.solver}. Set model.solver=LBFGS for refits that are consistent with the model.')
+    return BatchedLogisticRegression(C=model.inverse_regularization_strength, balanced=model.balanced)
+
+
+@jaxtyped(typechecker=typechecked)
+def label_configurations(y: Int[Tensor, 'num_nodes'], mask_train: Bool[Tensor, 'num_nodes'], idxs: Int[Tensor, 'batch'],
+                         labels: Int[Tensor, 'batch'], observed: bool = True) -> Tuple[Int[Tensor, 'batch num_nodes'], Bool[Tensor, 'batch num_nodes']]:
+    """ Label configurations that each differ from `y` and `mask_train` in one node.
+
+    Args:
+        y (Int[Tensor, 'num_nodes']): the labels
+        mask_train (Bool[Tensor, 'num_nodes']): the training mask
+        idxs (Int[Tensor, 'batch']): which node to change in each configuration
+        labels (Int[Tensor, 'batch']): the label of the changed node in each configuration
+        observed (bool): whether the changed node is added to (True) or removed from (False) the training samples
+
+    Returns:
+        Int[Tensor, 'batch num_nodes']: the labels of each configuration
+        Bool[Tensor, 'batch num_nodes']: the training mask of each configuration
+    """
+    batch_idxs = torch.arange(idxs.size(0), device=idxs.device)
+    y, mask_train = y.repeat(idxs.size(0), 1), mask_train.repeat(idxs.size(0), 1)
+    y[batch_idxs, idxs] = labels
+    mask_train[batch_idxs, idxs] = observed
+    return y, mask_train
+
+
+def refit_approximation_error(regression: BatchedLogisticRegression, approximation: RefitApproximation,
+                              x: Float[Tensor, 'num_nodes num_features'], y: Int[Tensor, 'batch num_nodes'],
+                              mask_train: Bool[Tensor, 'batch num_nodes'], num_classes: int,
+                              coef: Float[Tensor, 'num_classes num_features'], intercept: Float[Tensor, 'num_classes'],
+                              y_fitted: Int[Tensor, 'num_nodes'], mask_train_fitted: Bool[Tensor, 'num_nodes'],
+                              mask_evaluate: Bool[Tensor, 'num_nodes'], num_newton_steps: int = 10) -> Dict[str, float]:
+    """ Compares the predictions of approximate refits to exact refits of the same label configurations.
+
+    Returns:
+        Dict[str, float]: mean and max absolute error of the probabilities and the confidences (max. probability)
+            on `mask_evaluate`
+    """
+    probabilities = regression.refit(approximation, x, y, mask_train, num_classes, coef, intercept, y_fitted, mask_train_fitted,
+                                     num_newton_steps=num_newton_steps).predict_proba(x[mask_evaluate])
+    probabilities_exact = regression.refit(RefitApproximation.EXACT, x, y, mask_train, num_classes, coef, intercept, y_fitted,
+                                           mask_train_fitted).predict_proba(x[mask_evaluate])
+    error = (probabilities - probabilities_exact).abs()
+    error_confidence = (probabilities.max(-1).values - probabilities_exact.max(-1).values).abs()
+    return {
+        'probability_error_mean' : float(error.mean()),
+        'probability_error_max' : float(error.max()),
+        'confidence_error_mean' : float(error_confidence.mean()),
+        'confidence_error_max' : float(error_confidence.max()),
+    }
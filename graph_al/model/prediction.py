@@ -10,7 +10,7 @@ from jaxtyping import jaxtyped, Shaped
 from numpy import ndarray
 from graph_al.model.enum import *
 
-class PredictionAttributeNotFound(BaseException):
+class PredictionAttributeNotFound(Exception):
     ...
 
 @dataclass
@@ -76,7 +76,7 @@ class Prediction:
         
 
     @jaxtyped(typechecker=typechecked)
-    def get_predictions(self, propagated: bool = True) -> Float[Tensor, 'num_samples num_nodes'] | None:
+    def get_predictions(self, propagated: bool = True) -> Int[Tensor, 'num_nodes'] | None:
 
         probabilities = self.get_probabilities(propagated=propagated)
         if probabilities is not None:
@@ -60,6 +60,15 @@ class SGC(BaseModel):
         self._frozen_prediction = None
         self.model_set = False
 
+    def get_extra_state(self) -> Any:
+        """ The fitted regression is not a parameter of the module, so it is part of the state dict as extra state. """
+        return {'logistic_regression' : self.logistic_regression, 'frozen_prediction' : self._frozen_prediction}
+
+    def set_extra_state(self, state: Any):
+        self.logistic_regression = state['logistic_regression']
+        self._frozen_prediction = state['frozen_prediction']
+        self.model_set = False
+
     @torch.no_grad()
     def predict(self, batch: Data, acquisition: bool = False) -> Prediction:
         if isinstance(self._frozen_prediction, int): # Prediction is frozen to this one class
@@ -73,10 +82,7 @@ class SGC(BaseModel):
                 raise RuntimeError(f'No regression model was fitted for SGC')
             try:
                 x = self.get_diffused_node_features(batch, cache=self.cached)
-                probs = self.predict_proba(x)
-                probs_unpropagated = self.predict_proba(batch.x)
-                logits = self.decision_function(x)
-                logits_unpropagated = self.decision_function(batch.x)
+                logits, logits_unpropagated, probs, probs_unpropagated = self.predict_fused(x, batch.x)
             except NotFittedError:
                 get_logger().warn(f'Predictions with a non-fitted regression model: Fall back to uniform predictions')
                 probs = np.ones((batch.num_nodes, batch.num_classes), dtype=float) / batch.num_classes # type: ignore
@@ -99,7 +105,8 @@ class SGC(BaseModel):
         with torch.no_grad():
             self.model.linear.weight.copy_(torch.tensor(self.logistic_regression.coef_).float())
             self.model.linear.bias.copy_(torch.tensor(self.logistic_regression.intercept_).float())
-        self.model =  self.model.cuda()
+        if torch.cuda.is_available():
+            self.model = self.model.cuda()
         self.model_set = True
     
     def predict_proba(self, batch: Data) -> Prediction: 
@@ -116,6 +123,19 @@ class SGC(BaseModel):
             logits, probs = self.model(batch)
         return logits
 
+    @torch.no_grad()
+    def predict_fused(self, x: torch.Tensor, x_unpropagated: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        """ Computes logits and probabilities of propagated and unpropagated features in one pass of the linear layer.
+
+        Returns:
+            logits, logits_unpropagated, probabilities, probabilities_unpropagated
+        """
+        self.set_model()
+        self.model.eval()
+        num_nodes = x.size(0)
+        logits, probs = self.model(torch.cat([x, x_unpropagated.to(x.device)], dim=0).to(self.model.linear.weight.device))
+        return logits[:num_nodes], logits[num_nodes:], probs[:num_nodes], probs[num_nodes:]
+
     @torch.no_grad()
     @jaxtyped(typechecker=typechecked)
     def get_diffused_node_features(self, batch: Data, cache: bool = None) -> Float[torch.Tensor, 'num_nodes num_features']:
@@ -7,7 +7,7 @@ from jaxtyping import jaxtyped, Shaped
 from graph_al.data.config import DatasetSplit
 from graph_al.model.base import BaseModel
 from graph_al.model.prediction import Prediction
-from graph_al.model.trainer.config import TrainerConfig
+from graph_al.model.trainer.config import TrainerConfig, WarmStartConfig
 from graph_al.data.base import Data, Dataset
 from graph_al.evaluation.result import Result
 from graph_al.evaluation.enum import MetricName, MetricTemplate
@@ -20,11 +20,18 @@ from torchmetrics.functional import accuracy, f1_score
 
 from graph_al.utils.utils import apply_to_nested_tensors
 
+def warm_starts(config: WarmStartConfig | None, acquisition_step: int) -> bool:
+    """ If training after an acquisition step continues from the weights of the previous step instead of resetting them. """
+    if config is None or acquisition_step <= 0:
+        return False
+    return config.reset_every is None or config.reset_every <= 0 or acquisition_step % config.reset_every != 0
+
 class BaseTrainer:
     """ Base class for model training. """
     
     def __init__(self, config: TrainerConfig, model: BaseModel, dataset: Dataset, generator: torch.Generator):
         self.verbose = config.verbose
+        self.warm_start = config.warm_start
 
     @torch.no_grad()
     @jaxtyped(typechecker=typechecked)
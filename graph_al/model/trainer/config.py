@@ -19,6 +19,14 @@ class EarlyStoppingConfig:
     save_model_state: bool = False
 
 
+@dataclass
+class WarmStartConfig:
+    """ Warm-start retraining: After an acquisition, training continues from the weights of the previous step. """
+    
+    max_epochs: int | None = None # Epoch (or solver iteration) budget of warm-started training, if None the regular budget is used
+    reset_every: int | None = None # Fully reset the parameters every this many acquisition steps, if None never
+
+
 @dataclass
 class TrainerConfig:
     """ Base training configuration. """
@@ -29,6 +37,7 @@ class TrainerConfig:
     use_gpu: bool = True
     verbose: bool = False
     evaluation: TrainerEvaluationConfig = field(default_factory=TrainerEvaluationConfig)
+    warm_start: WarmStartConfig | None = None # If given, retrain from the weights of the previous acquisition step
     
     
 @dataclass
@@ -90,6 +99,7 @@ cs.store(name="base", node=TrainerConfig, group='model/trainer')
 cs.store(name="base_sgd", node=SGDTrainerConfig, group='model/trainer')
 cs.store(name="base_gpn", node=GPNTrainerConfig, group='model/trainer')
 cs.store(name="base", node=EarlyStoppingConfig, group='model/trainer/early_stopping')
+cs.store(name="base", node=WarmStartConfig, group='model/trainer/warm_start')
 cs.store(name="base_oracle", node=OracleTrainerConfig, group='model/trainer')
 cs.store(name="base_sgc", node=SGCTrainerConfig, group='model/trainer')
 cs.store(name="base_seal", node=SEALTrainerConfig, group='model/trainer')
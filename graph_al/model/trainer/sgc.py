@@ -1,3 +1,4 @@
+import numpy as np
 import torch
 
 from typeguard import typechecked
@@ -10,7 +11,7 @@ from graph_al.model.prediction import Prediction
 from graph_al.data.base import Data, Dataset
 from graph_al.model.sgc import SGC
 from graph_al.model.trainer.config import SGCTrainerConfig
-from graph_al.model.trainer.base import BaseTrainer
+from graph_al.model.trainer.base import BaseTrainer, warm_starts
 from graph_al.evaluation.result import Result
 from graph_al.evaluation.config import MetricTemplate
 from graph_al.model.base import BaseModel
@@ -65,5 +66,16 @@ class SGCTrainer(BaseTrainer):
             model.freeze_predictions(labels_in_mask_train[0].item())
         else:
             model.unfreeze_predictions()
-            model.logistic_regression.fit(x.cpu().numpy(), batch.y[mask_train].cpu().numpy())
+            y = batch.y[mask_train].cpu().numpy()
+            if warm_starts(self.warm_start, acquisition_step):
+                if np.array_equal(getattr(model.logistic_regression, 'classes_', None), np.unique(y)): # type: ignore
+                    # Continue from the previous coefficients (ignored by the liblinear solver)
+                    model.logistic_regression.set_params(warm_start=True)
+                    if self.warm_start.max_epochs is not None: # type: ignore
+                        model.logistic_regression.set_params(max_iter=self.warm_start.max_epochs) # type: ignore
+                else:
+                    # The coefficients of a different set of classes can not be reused
+                    model.reset_parameters(generator)
+            model.logistic_regression.fit(x.cpu().numpy(), y)
+            model.model_set = False # The linear layer needs the new coefficients
             
\ No newline at end of file
@@ -15,7 +15,7 @@ from graph_al.model.prediction import Prediction
 from graph_al.data.base import Data, Dataset
 from graph_al.model.base import BaseModel
 from graph_al.model.trainer.config import SGDTrainerConfig, LossFunction
-from graph_al.model.trainer.base import BaseTrainer
+from graph_al.model.trainer.base import BaseTrainer, warm_starts
 from graph_al.model.trainer.early_stopping import EarlyStopping
 from graph_al.model.trainer.loss import balanced_loss_weights
 from graph_al.evaluation.result import Result
@@ -239,6 +239,9 @@ class SGDTrainer(BaseTrainer):
             Dict[str, List]: Metrics logged over training.
         """
         model, dataset = self.transfer_model_to_device(model), self.transfer_dataset_to_device(dataset)
+        if warm_starts(self.warm_start, acquisition_step) and self.warm_start.max_epochs is not None: # type: ignore
+            self.max_epochs = self.warm_start.max_epochs # type: ignore
+            self.min_epochs = min(self.min_epochs, self.max_epochs)
         
         optimizer = self.get_optimizer(model)
         self.setup_early_stopping()
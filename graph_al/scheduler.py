@@ -0,0 +1,342 @@
+import hashlib
+import json
+import os
+from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import torch
+import torch.multiprocessing
+import tqdm
+from omegaconf import OmegaConf
+
+from graph_al.config import Config
+from graph_al.data.base import Dataset
+from graph_al.data.build import get_dataset
+from graph_al.data.enum import DatasetSplit
+from graph_al.model.build import get_model
+from graph_al.acquisition.build import get_acquisition_strategy
+from graph_al.acquisition.base import BaseAcquisitionStrategy, mask_not_in_val
+from graph_al.acquisition.enum import AdaptationMode, AdaptationIntegration
+from graph_al.active_learning import initial_acquisition, train_model
+from graph_al.evaluation.result import Result, Results
+from graph_al.model.base import BaseModel
+from graph_al.model.trainer.base import warm_starts
+from graph_al.test_time_adaptation.graph_agent import GraphAgent
+from graph_al.test_time_adaptation.feat_agent import FeatAgent
+from graph_al.test_time_adaptation.edge_agent import EdgeAgent
+from graph_al.utils.logging import get_logger
+from graph_al.utils.seed import manual_seed, get_rng_state, set_rng_state
+from graph_al.utils.profiler import get_profiler
+from graph_al.utils.checkpoint import AsyncCheckpointWriter, load_checkpoint
+
+# Tags that separate the rng streams derived from the seed of a run
+_STREAM_DATASET = 0
+_STREAM_SPLIT = 1
+_STREAM_TRAJECTORY = 2
+
+# Masks of the dataset that are checkpointed after each acquisition step
+_CHECKPOINT_MASKS = ('mask_train', 'mask_val', 'mask_test', 'mask_train_pool')
+
+# Parts of the configuration that do not change a trajectory, i.e. how and where it is run and logged
+_CONFIG_HASH_EXCLUDED_KEYS = ('progress_bar', 'progress_bar_metrics', 'num_workers', 'num_threads_per_worker', 'profile',
+                              'checkpoint_dir', 'wandb', 'print_summary')
+
+
+def derived_seed(seed: int, *key: int) -> int:
+    """ A seed of an independent rng stream that only depends on the seed of the run and the key of the stream. """
+    return int(np.random.SeedSequence(seed, spawn_key=key).generate_state(1, np.uint64)[0])
+
+def derived_generator(seed: int, *key: int) -> torch.Generator:
+    """ A generator of an independent rng stream, see `derived_seed`. Also seeds the global rngs for libraries that use them. """
+    stream_seed = derived_seed(seed, *key)
+    manual_seed(stream_seed)
+    torch.manual_seed(stream_seed)
+    return torch.Generator().manual_seed(stream_seed)
+
+def load_dataset(config: Config) -> Dataset:
+    """ Loads the dataset of a run. It only depends on the seed of the run, so each worker loads the same dataset. """
+    assert config.seed is not None, 'Runs need a seed to derive rng streams from'
+    return get_dataset(config.data, derived_generator(config.seed, _STREAM_DATASET))
+
+
+def resolve_acquisition_config(config: Config):
+    """ Resolves which optional parts of the acquisition are enabled, before any strategy is built.
+
+    Adaptation is enabled whenever it is configured. Test time augmentation only runs if `tta_enabled` is set
+    explicitly, as the default configuration always has a `tta` section.
+    """
+    if config.acquisition_strategy.tta is None:
+        config.model.cached = False
+    if config.acquisition_strategy.adaptation_enabled is None and config.acquisition_strategy.adaptation is not None:
+        get_logger().info('Enabling adaptation')
+        config.acquisition_strategy.adaptation_enabled = True
+    if config.acquisition_strategy.tta_enabled is None:
+        config.acquisition_strategy.tta_enabled = False
+
+
+def config_hash(config: Config) -> str:
+    """ A hash of the resolved configuration, which identifies the trajectories a checkpoint can belong to. """
+    config_dict = OmegaConf.to_container(OmegaConf.structured(config), resolve=True, enum_to_str=True)
+    for key in _CONFIG_HASH_EXCLUDED_KEYS:
+        config_dict.pop(key, None) # type: ignore
+    return hashlib.sha256(json.dumps(config_dict, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def reset_dataset(dataset, dataset_original):
+    dataset.data.x = dataset_original.data.x
+    dataset.data.edge_index = dataset_original.data.edge_index
+    return dataset
+
+
+def trajectory_state(config: Config, acquisition_step: int, dataset: Dataset, model: BaseModel,
+                     acquisition_strategy: BaseAcquisitionStrategy, generator: torch.Generator,
+                     results: List[Result], acquisition_metrics: List[Any]) -> Dict[str, Any]:
+    """ The state of a trajectory after an acquisition step, from which it can be resumed. """
+    state = {
+        'config_hash' : config_hash(config),
+        'acquisition_step' : acquisition_step,
+        'masks' : {name : getattr(dataset.data, name) for name in _CHECKPOINT_MASKS},
+        'model' : model.state_dict(),
+        'acquisition_strategy' : acquisition_strategy.state_dict(),
+        'rng' : get_rng_state(generator),
+        'results' : results,
+        'acquisition_metrics' : acquisition_metrics,
+    }
+    if config.acquisition_strategy.adaptation_enabled:
+        # Test time adaptation may change the graph
+        state['x'], state['edge_index'] = dataset.data.x, dataset.data.edge_index
+    return state
+
+def restore_trajectory_state(state: Dict[str, Any], dataset: Dataset, model: BaseModel,
+                             acquisition_strategy: BaseAcquisitionStrategy, generator: torch.Generator):
+    """ Restores the state returned by `trajectory_state`. """
+    model.load_state_dict(state['model'])
+    model.reset_cache()
+    with torch.no_grad():
+        # In an uninterrupted run, models cache (e.g. the normalized adjacency of) the unadapted graph,
+        # so caches are filled before the adapted graph is restored
+        model.eval().predict(dataset.data)
+    device = dataset.data.x.device
+    for name, mask in state['masks'].items():
+        setattr(dataset.data, name, mask.to(device))
+    if 'x' in state:
+        dataset.data.x, dataset.data.edge_index = state['x'].to(device), state['edge_index'].to(device)
+    acquisition_strategy.load_state_dict(state['acquisition_strategy'])
+    set_rng_state(state['rng'], generator)
+
+
+def run_trajectory(config: Config, dataset: Dataset, split_idx: int, init_idx: int, outdir: Path) -> Results:
+    """ Runs one active learning trajectory, i.e. one model initialization on one dataset split.
+
+    The trajectory draws all randomness from rng streams that are derived from the seed of the run, the split and
+    the initialization. Therefore, its results do not depend on which other trajectories ran before it.
+    If `config.checkpoint_dir` is set, the state of the trajectory is checkpointed after every acquisition step
+    and a rerun of the same configuration resumes from the last completed step. Checkpoints of a different
+    configuration are refused.
+
+    Args:
+        config (Config): the configuration of the run
+        dataset (Dataset): the dataset, which is modified in-place
+        split_idx (int): which dataset split to use
+        init_idx (int): which model initialization to use
+        outdir (Path): where to save checkpoints
+
+    Returns:
+        Results: the results of the trajectory
+    """
+    assert config.seed is not None, 'Runs need a seed to derive rng streams from'
+    get_logger().info(f'Dataset split {split_idx}, Model initialization {init_idx}')
+    acquisition_strategy = get_acquisition_strategy(config.acquisition_strategy, dataset)
+    initial_acquisition_strategy = get_acquisition_strategy(config.initial_acquisition_strategy, dataset)
+
+    dataset.split(generator=derived_generator(config.seed, _STREAM_SPLIT, split_idx),
+                  mask_not_in_val=mask_not_in_val(acquisition_strategy, initial_acquisition_strategy))
+    generator = derived_generator(config.seed, _STREAM_TRAJECTORY, split_idx, init_idx)
+    profiler = get_profiler()
+    profiler.enabled = config.profile
+    profiler.pop()
+
+    acquisition_metrics_init = []
+
+    model = get_model(config.model, dataset, generator)
+
+    acquisition_step = 0
+    acquisition_results = []
+    dataset.reset_train_idxs()
+
+    checkpoint_path = None if config.checkpoint_dir is None else Path(config.checkpoint_dir) / f'trajectory-{split_idx}-{init_idx}.ckpt'
+    checkpoint = None if checkpoint_path is None else load_checkpoint(checkpoint_path)
+    if checkpoint is not None and checkpoint.get('config_hash') != config_hash(config):
+        raise RuntimeError(f'Checkpoint {checkpoint_path} belongs to a run with a different configuration. '
+                           'Use a different checkpoint directory or remove the checkpoint.')
+
+    if checkpoint is None:
+        # 0. Initial aqcuisition: Usually randomly select nodes
+        # If no nodes are selected, the model is also not trained
+        # and the first actual acquisition uses an untrained model
+        with profiler.phase('acquisition'):
+            initial_train_idxs = initial_acquisition(initial_acquisition_strategy, config, model, dataset, generator)
+        get_logger().info(f'Acquired the following initial pool: {initial_train_idxs.tolist()}')
+        get_logger().info(f'Initial pool class counts: {dataset.data.class_counts_train.tolist()}')
+        model.reset_cache()
+        result = train_model(config.model.trainer, model, dataset, generator, acquisition_step=0)
+        result.acquired_idxs = initial_train_idxs.cpu()
+        if profiler.enabled:
+            result.acquisition_metrics['profile'] = profiler.pop()
+        acquisition_results.append(result)
+
+    acquisition_strategy.reset()
+
+    dataset_original = deepcopy(dataset)
+    dataset_original.data = dataset_original.data.to(dataset.data.x.device)
+
+    if checkpoint is not None:
+        acquisition_step = checkpoint['acquisition_step']
+        restore_trajectory_state(checkpoint, dataset, model, acquisition_strategy, generator)
+        acquisition_results, acquisition_metrics_init = checkpoint['results'], checkpoint['acquisition_metrics']
+        get_logger().info(f'Resuming from checkpoint {checkpoint_path} after acquisition step {acquisition_step}')
+        
+    writer = AsyncCheckpointWriter() if checkpoint_path is not None else None
+    if writer is not None and checkpoint is None:
+        checkpoint_path.parent.mkdir(parents=True, exist_ok=True) # type: ignore
+        writer.save(trajectory_state(config, acquisition_step, dataset, model, acquisition_strategy, generator,
+                                     acquisition_results, acquisition_metrics_init), checkpoint_path) # type: ignore
+
+    iterator = range(acquisition_step + 1, 1 + config.acquisition_strategy.num_steps)
+    if config.progress_bar:
+        iterator = tqdm.tqdm(iterator)
+
+    for acquisition_step in iterator:
+        model = model.eval()
+        if dataset.data.mask_train_pool.sum().item() <= 0:
+            get_logger().info(f'Acquisition ends early because the entire pool was acquired: {dataset.data.class_counts_train.tolist()}')
+            break
+        print()
+        #################################################################
+
+        if config.acquisition_strategy.adaptation_enabled:
+            with profiler.phase('adaptation'):
+                match config.acquisition_strategy.adaptation.mode:
+                    case AdaptationMode.FEATURE:
+                        agent = FeatAgent(dataset,model, config.acquisition_strategy.adaptation)
+                        with torch.enable_grad():
+                            new_feat, _ = agent.learn_graph(dataset)
+                        dataset.data.x = dataset.data.x + new_feat
+                        dataset.data.x = deepcopy(dataset.data.x.detach()).to(dataset_original.data.x.device)
+                    case AdaptationMode.STRUCTURE:
+                        agent = EdgeAgent(dataset,model, config.acquisition_strategy.adaptation)
+                        with torch.enable_grad():
+                            new_edge, new_edge_weight,_ = agent.learn_graph(dataset)
+                        dataset.data.edge_index = new_edge
+                    case AdaptationMode.BOTH:
+                        agent = GraphAgent(dataset, model, config.acquisition_strategy.adaptation)
+                        with torch.enable_grad():
+                            new_feat, new_edge, new_edge_weight = agent.learn_graph(dataset)
+                        dataset.data.edge_index = new_edge
+                        dataset.data.x = dataset.data.x + new_feat
+                        dataset.data.x = deepcopy(dataset.data.x.detach()).to(dataset_original.data.x.device)
+                    case _:
+                        raise ValueError(f"Unknown adaptation mode: {config.acquisition_strategy.adaptation.mode}")
+
+        #################################################################
+        if config.acquisition_strategy.adaptation.integration == AdaptationIntegration.NONE and config.acquisition_strategy.adaptation_enabled:
+            dataset = reset_dataset(dataset, dataset_original)
+        with torch.no_grad(), profiler.phase('acquisition'):
+            acquired_idxs, acquisition_metrics = acquisition_strategy.acquire(model, dataset, config.acquisition_strategy.num_to_acquire_per_step, config.model, generator)
+        acquisition_metrics_init.append(acquisition_metrics)
+        dataset.add_to_train_idxs(acquired_idxs)
+
+        # CHOOSE - RESET
+        if config.acquisition_strategy.adaptation.integration == AdaptationIntegration.QUERY and config.acquisition_strategy.adaptation_enabled:
+            dataset = reset_dataset(dataset, dataset_original)
+        # 2. Retrain the model
+        if config.retrain_after_acquisition and acquisition_strategy.retrain_after_each_acquisition is not False \
+            and not warm_starts(config.model.trainer.warm_start, acquisition_step):
+            model.reset_parameters(generator=generator)
+
+        # # TRAIN
+        result = train_model(config.model.trainer, model, dataset, generator, acquisition_step=acquisition_step)
+
+        if config.acquisition_strategy.adaptation.integration == AdaptationIntegration.TRAIN and config.acquisition_strategy.adaptation_enabled:
+            dataset = reset_dataset(dataset, dataset_original)
+
+        torch.cuda.empty_cache()
+
+        # 3. Collect results
+        result.acquired_idxs = acquired_idxs.cpu()
+        acquisition_results.append(result)
+        get_logger().info(f'Acquired node(s): {acquired_idxs.tolist()}')
+        get_logger().info(f'Class counts after acquisition: {dataset.data.class_counts_train.tolist()}')
+
+        if config.progress_bar:
+            message = f'Run {split_idx},{init_idx}: Num acquired: {dataset.data.num_train}, ' + ', '.join(f'{name} : {result.metrics[name]:.3f}' for name in config.progress_bar_metrics)
+            iterator.set_description(message) # type: ignore
+
+        if writer is not None:
+            with profiler.phase('checkpointing'):
+                writer.save(trajectory_state(config, acquisition_step, dataset, model, acquisition_strategy, generator,
+                                             acquisition_results, acquisition_metrics_init), checkpoint_path) # type: ignore
+        if profiler.enabled:
+            acquisition_metrics['profile'] = result.acquisition_metrics['profile'] = profiler.pop()
+
+    if writer is not None:
+        writer.close()
+
+    # After the budget is exhausted
+    run_results = Results(acquisition_results, dataset_split_num=split_idx, model_initialization_num=init_idx)
+
+    # Checkpoint this model
+    torch.save(model.state_dict(), outdir / f'model-{split_idx}-{init_idx}-{acquisition_step}.ckpt')
+    torch.save({'mask_train' : dataset.data.get_mask(DatasetSplit.TRAIN).cpu(),
+                'mask_val' : dataset.data.get_mask(DatasetSplit.VAL).cpu(),
+                'mask_test' : dataset.data.get_mask(DatasetSplit.TEST).cpu(),
+                'mask_train_pool' : dataset.data.get_mask(DatasetSplit.TRAIN_POOL).cpu()}, outdir / f'masks-{split_idx}-{init_idx}-{acquisition_step}.ckpt')
+    torch.save(acquisition_metrics_init, outdir / f'acquisition_metrics-{split_idx}-{init_idx}-{acquisition_step}.pt')
+    return run_results
+
+
+# State of a worker process, which loads the dataset once and reuses it for all of its trajectories
+_worker_state: Tuple[Config, Dataset, Path] | None = None
+
+def _initialize_worker(config: Config, outdir: Path, num_threads: int):
+    global _worker_state
+    torch.set_num_threads(num_threads)
+    torch.multiprocessing.set_sharing_strategy('file_system')
+    _worker_state = (config, load_dataset(config), outdir)
+
+def _run_trajectory_in_worker(split_idx: int, init_idx: int) -> Results:
+    assert _worker_state is not None, 'Worker was not initialized'
+    config, dataset, outdir = _worker_state
+    return run_trajectory(config, deepcopy(dataset), split_idx, init_idx, outdir)
+
+
+def run_trajectories(config: Config, dataset: Dataset, num_splits: int, outdir: Path) -> List[Results]:
+    """ Runs the trajectories of all splits and model initializations, in parallel if `config.num_workers > 1`.
+
+    As every trajectory derives its own rng streams, results are identical regardless of the number of workers.
+
+    Args:
+        config (Config): the configuration of the run
+        dataset (Dataset): the dataset as loaded by `load_dataset`, only used if trajectories are run in this process
+        num_splits (int): how many dataset splits to run
+        outdir (Path): where to save checkpoints
+
+    Returns:
+        List[Results]: the results of all trajectories, ordered by split and then initialization
+    """
+    trajectories = [(split_idx, init_idx) for split_idx in range(num_splits) for init_idx in range(config.model.num_inits)]
+    num_workers = min(config.num_workers, len(trajectories))
+    if num_workers <= 1:
+        return [run_trajectory(config, deepcopy(dataset), split_idx, init_idx, outdir) for split_idx, init_idx in trajectories]
+
+    num_threads = config.num_threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+    get_logger().info(f'Running {len(trajectories)} trajectories on {num_workers} workers with {num_threads} thread(s) each')
+    # Spawned workers do not inherit (possibly initialized) cuda contexts
+    context = torch.multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context, initializer=_initialize_worker,
+                             initargs=(config, outdir, num_threads)) as executor:
+        futures = [executor.submit(_run_trajectory_in_worker, *trajectory) for trajectory in trajectories]
+        return [future.result() for future in futures]
@@ -15,7 +15,7 @@ from graph_al.acquisition.enum import *
 class EdgeAgent(FeatAgent):
 
     def __init__(self, data_all,model, config):
-        self.device = 'cuda'
+        self.device = data_all.data.x.device
         self.config = config
         self.data_all = data_all
         self.model = model
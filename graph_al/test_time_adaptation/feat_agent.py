@@ -83,11 +83,11 @@ class FeatAgent:
         if strategy == AdaptationStrategy.DROPEDGE:
             edge_index, edge_weight = dropout_adj(edge_index, edge_weight, p=p)
         if strategy == AdaptationStrategy.DROPNODE:
-            mask = torch.cuda.FloatTensor(len(x)).uniform_() > p
+            mask = torch.rand(len(x), device=x.device) > p
             x = x * mask.view(-1, 1)
             #TODO DONE
         if strategy == AdaptationStrategy.DROPMIX:
-            mask = torch.cuda.FloatTensor(len(x)).uniform_() > p
+            mask = torch.rand(len(x), device=x.device) > p
             x = x * mask.view(-1, 1)
             edge_index, edge_weight = dropout_adj(edge_index, edge_weight, p=p)
         if strategy == AdaptationStrategy.DROPFEAT:
@@ -16,7 +16,7 @@ from graph_al.acquisition.enum import AdaptationStrategy
 class GraphAgent(EdgeAgent):
 
     def __init__(self, data_all, model, config):
-        self.device = 'cuda'
+        self.device = data_all.data.x.device
         self.config = config
         self.data_all = data_all
         self.model = model
@@ -24,7 +24,7 @@ class GraphAgent(EdgeAgent):
     def learn_graph(self, dataset):
         print('====learning on this graph===')
         config = self.config
-        data= dataset.data.cuda()
+        data = dataset.data.to(self.device)
         import torch_geometric.nn as tgnn
         
         # MODIFY
@@ -140,7 +140,7 @@ class GraphAgent(EdgeAgent):
         if strategy == AdaptationStrategy.DROPEDGE:
             edge_index, edge_weight = dropout_adj(edge_index, edge_weight, p=p)
         if strategy == AdaptationStrategy.DROPNODE:
-            mask = torch.cuda.FloatTensor(len(x)).uniform_() > p
+            mask = torch.rand(len(x), device=x.device) > p
             x = x * mask.view(-1, 1)
         if strategy == AdaptationStrategy.RWSAMPLE:
             import augmentor as A
@@ -150,7 +150,7 @@ class GraphAgent(EdgeAgent):
             x, edge_index, edge_weight = aug(x, edge_index, edge_weight)
 
         if strategy == AdaptationStrategy.DROPMIX:
-            mask = torch.cuda.FloatTensor(len(x)).uniform_() > p
+            mask = torch.rand(len(x), device=x.device) > p
             x = x * mask.view(-1, 1)
             edge_index, edge_weight = dropout_adj(edge_index, edge_weight, p=p)
         if strategy == AdaptationStrategy.DROPFEAT:
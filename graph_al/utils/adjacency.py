@@ -0,0 +1,245 @@
+import torch
+import torch_scatter
+import weakref
+from torch import Tensor
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Tuple
+
+from jaxtyping import jaxtyped, Float, Int, Bool
+from typeguard import typechecked
+from torch_geometric.nn.conv.gcn_conv import gcn_norm
+from torch_geometric.utils import add_remaining_self_loops
+
+Fingerprint = Tuple[int, int, str, int, int]
+NormalizationKey = Tuple[bool, bool, torch.dtype]
+
+@jaxtyped(typechecker=typechecked)
+def edge_index_fingerprint(edge_index: Int[Tensor, '2 num_edges'], num_nodes: int) -> Fingerprint:
+    """ A fingerprint of the content (including the order) of an edge index. Collisions are possible, but cheap
+    to rule out by comparing the edge indices themselves. """
+    ids = edge_index[0] * num_nodes + edge_index[1]
+    positions = torch.arange(1, ids.size(0) + 1, device=ids.device) % 1000003
+    return (num_nodes, ids.size(0), str(ids.device), int(ids.sum().item()), int((ids * positions).sum().item()))
+
+
+@dataclass
+class _NormalizedAdjacency:
+    edge_index: Tensor # the normalized edges, including self-loops
+    edge_weight: Tensor
+    degree: Tensor # the node degrees (including self-loops) before normalization
+    self_loop_weight: Tensor | None # the weights of added self-loops before normalization
+
+
+@dataclass
+class _CacheEntry:
+    edge_index: Tensor # the unnormalized edges
+    has_self_loops: bool
+    normalized: Dict[NormalizationKey, _NormalizedAdjacency] = field(default_factory=dict)
+
+
+@dataclass
+class _ViewEntry:
+    parent: _CacheEntry | None # the graph this is a subgraph of, if any
+    edge_keep: Tensor | None # which edges of the parent graph the view keeps
+    # The normalized edges and weights. The edges are None if they are the edges of the view itself: The entry must
+    # not reference them, as it lives exactly as long as they do.
+    normalized: Dict[NormalizationKey, Tuple[Tensor | None, Tensor]] = field(default_factory=dict)
+
+
+class NormalizedAdjacencyCache:
+    """ Caches the symmetrically normalized adjacency D^-1/2 (A + I) D^-1/2 of graphs, keyed by a fingerprint of their edges.
+
+    As the cache is keyed by content, it stays valid across models, acquisition steps and (shallow) views of the same graph.
+    The fingerprint of an edge tensor is remembered for its lifetime, so repeated lookups of the same tensor neither
+    fingerprint nor compare the edges. As with `cached=True` in torch_geometric, edges must therefore not be modified in-place.
+
+    Short-lived graphs (e.g. augmented views) are registered with `register_view` or `register_subgraph` instead. They are
+    cached only as long as their edges are alive and never evict long-lived graphs. Subgraphs that only drop edges are
+    normalized from the cached degrees of the full graph by subtracting the contributions of dropped edges.
+
+    Args:
+        max_size (int): how many long-lived graphs to cache at most, the least recently used graph is evicted first
+    """
+
+    def __init__(self, max_size: int = 64):
+        self.max_size = max_size
+        self.entries: OrderedDict[Fingerprint, _CacheEntry] = OrderedDict()
+        # Both are keyed by the id of an edge tensor and hold a weak reference to it, entries are dropped with the tensor
+        self.fingerprints: Dict[Tuple[int, int], Tuple[weakref.ref, Fingerprint]] = {}
+        self.views: Dict[int, Tuple[weakref.ref, _ViewEntry]] = {}
+
+    def clear(self):
+        self.entries.clear()
+        self.fingerprints.clear()
+        self.views.clear()
+
+    def _track(self, store: Dict, key, edge_index: Tensor, value):
+        """ Stores `value` in `store` for as long as `edge_index` is alive. """
+        def forget(ref: weakref.ref):
+            if key in store and store[key][0] is ref:
+                del store[key]
+        store[key] = (weakref.ref(edge_index, forget), value)
+
+    def _fingerprint(self, edge_index: Tensor, num_nodes: int) -> Fingerprint:
+        key = (id(edge_index), num_nodes)
+        known = self.fingerprints.get(key, None)
+        if known is not None and known[0]() is edge_index:
+            return known[1]
+        fingerprint = edge_index_fingerprint(edge_index, num_nodes)
+        self._track(self.fingerprints, key, edge_index, fingerprint)
+        return fingerprint
+
+    def _lookup(self, edge_index: Tensor, num_nodes: int) -> Tuple[Fingerprint, _CacheEntry | None]:
+        fingerprint = self._fingerprint(edge_index, num_nodes)
+        entry = self.entries.get(fingerprint, None)
+        if entry is not None and not (entry.edge_index is edge_index or torch.equal(entry.edge_index, edge_index)):
+            entry = None # Collision of fingerprints
+        if entry is not None:
+            self.entries.move_to_end(fingerprint)
+        return fingerprint, entry
+
+    def _insert(self, fingerprint: Fingerprint, entry: _CacheEntry) -> _CacheEntry:
+        self.entries[fingerprint] = entry
+        self.entries.move_to_end(fingerprint)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return entry
+
+    def _get_or_insert(self, edge_index: Tensor, num_nodes: int) -> _CacheEntry:
+        fingerprint, entry = self._lookup(edge_index, num_nodes)
+        if entry is None:
+            entry = self._insert(fingerprint, _CacheEntry(edge_index, bool((edge_index[0] == edge_index[1]).any().item())))
+        return entry
+
+    def _get_view(self, edge_index: Tensor) -> _ViewEntry | None:
+        view = self.views.get(id(edge_index), None)
+        if view is None or view[0]() is not edge_index:
+            return None
+        return view[1]
+
+    @jaxtyped(typechecker=typechecked)
+    def register_view(self, edge_index: Int[Tensor, '2 num_edges']):
+        """ Registers the edges of a short-lived graph, which are then only cached as long as they are alive.
+
+        Args:
+            edge_index (Tensor): the edges
+        """
+        self._track(self.views, id(edge_index), edge_index, _ViewEntry(None, None))
+
+    @jaxtyped(typechecker=typechecked)
+    def register_subgraph(self, edge_index: Int[Tensor, '2 num_edges'], edge_keep: Bool[Tensor, 'num_edges'],
+                          num_nodes: int) -> Int[Tensor, '2 num_edges_kept']:
+        """ Creates the edges of a subgraph that only keeps some edges of a graph and registers it for incremental renormalization.
+
+        The subgraph is only cached as long as its edges are alive, see `register_view`.
+
+        Args:
+            edge_index (Tensor): the edges of the full graph
+            edge_keep (Tensor): which edges the subgraph keeps
+            num_nodes (int): the number of nodes
+
+        Returns:
+            Tensor: the edges of the subgraph, i.e. `edge_index[:, edge_keep]`
+        """
+        parent = self._get_or_insert(edge_index, num_nodes)
+        edge_keep = edge_keep.to(edge_index.device)
+        edge_index_subgraph = edge_index[:, edge_keep]
+        if parent.has_self_loops: # The normalization moves existing self-loops, which breaks the correspondence of edges
+            self.register_view(edge_index_subgraph)
+        else:
+            self._track(self.views, id(edge_index_subgraph), edge_index_subgraph, _ViewEntry(parent, edge_keep))
+        return edge_index_subgraph
+
+    def _normalize_subgraph(self, edge_index: Tensor, view: _ViewEntry, key: NormalizationKey,
+                            num_nodes: int) -> Tuple[Tensor, Tensor]:
+        """ Normalizes a subgraph from the cached degrees of its full graph. """
+        parent, edge_keep = view.parent, view.edge_keep
+        assert parent is not None and edge_keep is not None
+        improved, add_self_loops, dtype = key
+        parent_normalized = self._normalize_entry(parent, key, num_nodes)
+        edge_drop = ~edge_keep
+        degree = parent_normalized.degree - torch_scatter.scatter_add(
+            torch.ones(int(edge_drop.sum().item()), dtype=dtype, device=parent_normalized.degree.device),
+            parent.edge_index[1, edge_drop], dim=0, dim_size=num_nodes)
+        num_edges = edge_index.size(1)
+        if add_self_loops:
+            edge_index = torch.cat([edge_index, parent_normalized.edge_index[:, parent.edge_index.size(1):]], dim=1)
+        edge_weight = torch.ones(edge_index.size(1), dtype=dtype, device=edge_index.device)
+        if parent_normalized.self_loop_weight is not None:
+            edge_weight[num_edges:] = parent_normalized.self_loop_weight
+        degree_inv_sqrt = degree.pow(-0.5)
+        degree_inv_sqrt.masked_fill_(degree_inv_sqrt == float('inf'), 0)
+        edge_weight = degree_inv_sqrt[edge_index[0]] * edge_weight * degree_inv_sqrt[edge_index[1]]
+        return edge_index, edge_weight
+
+    def _normalize_view(self, edge_index: Tensor, view: _ViewEntry, key: NormalizationKey,
+                        num_nodes: int) -> Tuple[Tensor, Tensor]:
+        normalized = view.normalized.get(key, None)
+        if normalized is None:
+            if view.parent is None:
+                improved, add_self_loops, dtype = key
+                edge_index_normalized, edge_weight = gcn_norm(edge_index, None, num_nodes, improved=improved,
+                                                              add_self_loops=add_self_loops, dtype=dtype)
+            else:
+                edge_index_normalized, edge_weight = self._normalize_subgraph(edge_index, view, key, num_nodes)
+            normalized = (None if edge_index_normalized is edge_index else edge_index_normalized, edge_weight)
+            view.normalized[key] = normalized
+        edge_index_normalized, edge_weight = normalized
+        return (edge_index if edge_index_normalized is None else edge_index_normalized), edge_weight
+
+    def _normalize_entry(self, entry: _CacheEntry, key: NormalizationKey, num_nodes: int) -> _NormalizedAdjacency:
+        normalized = entry.normalized.get(key, None)
+        if normalized is None:
+            improved, add_self_loops, dtype = key
+            edge_index, edge_weight = gcn_norm(entry.edge_index, None, num_nodes, improved=improved,
+                                               add_self_loops=add_self_loops, dtype=dtype)
+            # Unnormalized weights exactly as in `gcn_norm`
+            weight = None
+            if add_self_loops:
+                _, weight = add_remaining_self_loops(entry.edge_index, None, 2.0 if improved else 1.0, num_nodes)
+            weight = torch.ones_like(edge_weight) if weight is None else weight.to(edge_weight.dtype)
+            degree = torch_scatter.scatter_add(weight, edge_index[1], dim=0, dim_size=num_nodes)
+            self_loop_weight = weight[entry.edge_index.size(1):] if add_self_loops and not entry.has_self_loops else None
+            normalized = _NormalizedAdjacency(edge_index, edge_weight, degree, self_loop_weight)
+            entry.normalized[key] = normalized
+        return normalized
+
+    @jaxtyped(typechecker=typechecked)
+    def normalize(self, edge_index: Int[Tensor, '2 num_edges'], num_nodes: int, improved: bool = False, add_self_loops: bool = True,
+                  dtype: torch.dtype | None = None) -> Tuple[Int[Tensor, '2 num_edges_normalized'], Float[Tensor, 'num_edges_normalized']]:
+        """ Gets (and caches) the GCN normalization of an unweighted graph, equivalent to `gcn_norm`.
+
+        Args:
+            edge_index (Tensor): the edges
+            num_nodes (int): the number of nodes
+            improved (bool): if self-loops have weight 2
+            add_self_loops (bool): whether to add self-loops
+            dtype (torch.dtype | None): dtype of the edge weights
+
+        Returns:
+            Tensor: the normalized edges
+            Tensor: the normalized edge weights
+        """
+        key = (improved, add_self_loops, dtype or torch.get_default_dtype())
+        view = self._get_view(edge_index)
+        if view is not None:
+            return self._normalize_view(edge_index, view, key, num_nodes)
+        normalized = self._normalize_entry(self._get_or_insert(edge_index, num_nodes), key, num_nodes)
+        return normalized.edge_index, normalized.edge_weight
+
+
+_cache = NormalizedAdjacencyCache()
+
+def get_normalized_adjacency_cache() -> NormalizedAdjacencyCache:
+    """ The normalized adjacency cache that is shared by all models. """
+    return _cache
+
+@jaxtyped(typechecker=typechecked)
+def normalized_adjacency(edge_index: Int[Tensor, '2 num_edges'], edge_weight: Tensor | None, num_nodes: int,
+                         improved: bool = False, add_self_loops: bool = True,
+                         dtype: torch.dtype | None = None) -> Tuple[Int[Tensor, '2 num_edges_normalized'], Float[Tensor, 'num_edges_normalized']]:
+    """ Drop-in replacement for `gcn_norm` that uses the shared cache for unweighted graphs. """
+    if edge_weight is not None:
+        return gcn_norm(edge_index, edge_weight, num_nodes, improved=improved, add_self_loops=add_self_loops, dtype=dtype)
+    return _cache.normalize(edge_index, num_nodes, improved=improved, add_self_loops=add_self_loops, dtype=dtype)
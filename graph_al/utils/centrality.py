@@ -0,0 +1,64 @@
+import numpy as np
+import scipy.sparse as sp
+import torch
+from torch import Tensor
+
+from jaxtyping import jaxtyped, Float, Int
+from typeguard import typechecked
+
+from graph_al.utils.logging import get_logger
+
+
+def adjacency_matrix(edge_index: Int[Tensor, '2 num_edges'], num_nodes: int, symmetric: bool = True) -> sp.csr_matrix:
+    """ Builds a sparse adjacency matrix directly from the edges, where duplicate edges are counted.
+
+    Args:
+        edge_index (Int[Tensor, '2 num_edges']): the edges
+        num_nodes (int): the number of nodes
+        symmetric (bool): whether to treat the graph as undirected, i.e. each edge is present in both directions
+
+    Returns:
+        sp.csr_matrix: the adjacency matrix
+    """
+    edge_idxs = edge_index.cpu().numpy()
+    A = sp.csr_matrix((np.ones(edge_idxs.shape[1]), (edge_idxs[0], edge_idxs[1])), shape=(num_nodes, num_nodes))
+    if symmetric:
+        A = A.maximum(A.T).tocsr()
+    return A
+
+
+@jaxtyped(typechecker=typechecked)
+def pagerank(edge_index: Int[Tensor, '2 num_edges'], num_nodes: int, damping: float = 0.85, tolerance: float = 1e-6,
+             max_iterations: int = 100, symmetric: bool = True) -> Float[Tensor, 'num_nodes']:
+    """ Computes pagerank centralities by power iteration on a sparse adjacency matrix.
+
+    It follows `networkx.pagerank`: The mass of dangling nodes is distributed uniformly and the iteration stops once the
+    l1 change of the scores falls below `num_nodes * tolerance`.
+
+    Args:
+        edge_index (Int[Tensor, '2 num_edges']): the edges
+        num_nodes (int): the number of nodes
+        damping (float): the probability of following an edge instead of teleporting
+        tolerance (float): the convergence tolerance per node
+        max_iterations (int): the maximal number of power iterations
+        symmetric (bool): whether to treat the graph as undirected
+
+    Returns:
+        Float[Tensor, 'num_nodes']: the pagerank score of each node, which sum to 1
+    """
+    A = adjacency_matrix(edge_index, num_nodes, symmetric=symmetric)
+    out_degree = np.asarray(A.sum(axis=1)).ravel()
+    is_dangling = out_degree == 0
+    inverse_out_degree = np.zeros(num_nodes)
+    inverse_out_degree[~is_dangling] = 1 / out_degree[~is_dangling]
+    transition = (sp.diags(inverse_out_degree) @ A).T.tocsr() # transition[v, u] is the probability of moving from u to v
+
+    scores = np.full(num_nodes, 1 / num_nodes)
+    for iteration in range(max_iterations):
+        previous = scores
+        scores = damping * (transition @ scores + scores[is_dangling].sum() / num_nodes) + (1 - damping) / num_nodes
+        if np.abs(scores - previous).sum() < num_nodes * tolerance:
+            break
+    else:
+        get_logger().warning(f'Pagerank did not converge within {max_iterations} iterations')
+    return torch.from_numpy(scores).float()
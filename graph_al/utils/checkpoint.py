@@ -0,0 +1,58 @@
+import io
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import torch
+
+
+def _write(data: bytes, path: Path):
+    # Write to a temporary file first, such that a crash while writing never corrupts the last checkpoint
+    path_tmp = path.with_name(path.name + '.tmp')
+    with open(path_tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path_tmp, path)
+
+
+class AsyncCheckpointWriter:
+    """ Writes checkpoints to disk in a background thread.
+
+    The state is serialized when `save` is called, so it can be modified right after. Only the (slow) disk
+    write happens in the background. At most one write is in flight, older ones are waited for first.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending: Future | None = None
+
+    def save(self, state: Any, path: Path):
+        buffer = io.BytesIO()
+        torch.save(state, buffer)
+        self.wait()
+        self.pending = self.executor.submit(_write, buffer.getvalue(), path)
+
+    def wait(self):
+        """ Waits for the last checkpoint to be written. """
+        if self.pending is not None:
+            self.pending.result()
+            self.pending = None
+
+    def close(self):
+        self.wait()
+        self.executor.shutdown()
+
+    def __enter__(self) -> 'AsyncCheckpointWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+
+def load_checkpoint(path: Path) -> Any | None:
+    """ Loads a checkpoint written by `AsyncCheckpointWriter`, or None if there is none. """
+    if not path.exists():
+        return None
+    return torch.load(path, weights_only=False)
@@ -7,9 +7,18 @@ from jaxtyping import jaxtyped, Float, Int
 from typeguard import typechecked
 from torch import Tensor
 import numpy as np
+from typing import Dict
 import scipy.sparse as sp
 from sklearn.preprocessing import normalize
 
+def _check_stochastic(edge_index: Int[Tensor, '2 num_edges'], edge_weights: Float[Tensor, 'num_edges'], num_nodes: int):
+    """ Checks that the edge weights are a (row-)stochastic matrix """
+    idx_src, idx_target = edge_index
+    sums = torch_scatter.scatter_add(edge_weights, idx_src, dim=-1, dim_size=num_nodes)
+    assert torch.allclose(sums, torch.tensor(1.0), atol=1e-4), \
+        f'Expected stochastic matrix for PPR approximation but got {sums[~torch.isclose(sums, torch.tensor(1.0), atol=1e-4)]}' + \
+            f' at indices {torch.where(~torch.isclose(sums, torch.tensor(1.0), atol=1e-4))[0]}'
+
 def approximate_ppr_matrix(edge_index: Int[Tensor, '2 num_edges'], edge_weights: Float[Tensor, 'num_edges'],
                            teleport_probability: float = 0.2, num_iterations: int = 10, verbose: bool=True,
                            num_nodes: int | None=None) -> Float[Tensor, 'num_nodes num_nodes']:
@@ -18,23 +27,20 @@ def approximate_ppr_matrix(edge_index: Int[Tensor, '2 num_edges'], edge_weights:
     if num_nodes is None:
         num_nodes = int(edge_index.max().item()) + 1
         
-    idx_src, idx_target = edge_index
-    # Check for a stochastic matrix
-    sums = torch_scatter.scatter_add(edge_weights, idx_src, dim=-1, dim_size=num_nodes)
-    assert torch.allclose(sums, torch.tensor(1.0), atol=1e-4), \
-        f'Expected stochastic matrix for PPR approximation but got {sums[~torch.isclose(sums, torch.tensor(1.0), atol=1e-4)]}' + \
-            f' at indices {torch.where(~torch.isclose(sums, torch.tensor(1.0), atol=1e-4))[0]}'
+    _check_stochastic(edge_index, edge_weights, num_nodes)
 
     
     edge_idxs = edge_index.cpu().numpy()
     A = sp.coo_matrix((edge_weights.cpu().numpy(), edge_idxs), shape=(num_nodes, num_nodes))
 
     Pi = np.ones((num_nodes, num_nodes)) / num_nodes
+    diagonal = np.diag_indices(num_nodes)
     pbar = (range(num_iterations))
     if verbose:
         pbar = tqdm(pbar)
     for it in pbar:
-        new = (1 - teleport_probability) * (A.T @ Pi) + (teleport_probability / num_nodes) * np.eye(num_nodes)
+        new = (1 - teleport_probability) * (A.T @ Pi)
+        new[diagonal] += teleport_probability / num_nodes
         diff = np.linalg.norm(new - Pi)
         if verbose:
             pbar.set_description(f'APPR residuals: {diff:.5f}') # type: ignore
@@ -51,12 +57,7 @@ def approximate_ppr_scores(edge_index: Int[Tensor, '2 num_edges'], edge_weights:
     if num_nodes is None:
         num_nodes = int(edge_index.max().item()) + 1
         
-    idx_src, idx_target = edge_index
-    # Check for a stochastic matrix
-    sums = torch_scatter.scatter_add(edge_weights, idx_src, dim=-1, dim_size=num_nodes)
-    assert torch.allclose(sums, torch.tensor(1.0), atol=1e-4), \
-        f'Expected stochastic matrix for PPR approximation but got {sums[~torch.isclose(sums, torch.tensor(1.0), atol=1e-4)]}' + \
-            f' at indices {torch.where(~torch.isclose(sums, torch.tensor(1.0), atol=1e-4))[0]}'
+    _check_stochastic(edge_index, edge_weights, num_nodes)
         
     edge_idxs = edge_index.cpu().numpy()
     A = sp.coo_matrix((edge_weights.cpu().numpy(), edge_idxs), shape=(num_nodes, num_nodes))
@@ -72,4 +73,90 @@ def approximate_ppr_scores(edge_index: Int[Tensor, '2 num_edges'], edge_weights:
         if verbose:
             pbar.set_description(f'APPR residuals: {diff:.5f}')# type: ignore
         assert np.allclose(page_rank_scores.sum(), 1.0, atol=1e-4)
-    return torch.tensor(page_rank_scores)
\ No newline at end of file
+    return torch.tensor(page_rank_scores)
+
+
+class SparsePPR:
+    """ Personalized page rank vectors of single source nodes that are computed on demand with forward push [1] and cached per source.
+    
+    The vector of source s approximates ppr_s = alpha (I - (1 - alpha) A^T)^-1 e_s for the stochastic adjacency A, i.e.
+    num_nodes times column s of the matrix of `approximate_ppr_matrix`. Each entry v has an error of at most `tolerance * degree(v)`
+    and entries that the push does not reach are zero. Unlike the dense matrix, memory and time only depend on the requested sources.
+    
+    Args:
+        edge_index (Int[Tensor, '2 num_edges']): the edges
+        edge_weights (Float[Tensor, 'num_edges']): the weights of the stochastic adjacency matrix
+        teleport_probability (float): the teleport probability alpha
+        tolerance (float): the residual per degree below which a node is not pushed anymore
+        num_nodes (int | None): the number of nodes
+        
+    References:
+    [1]: Andersen, Chung, Lang. Local Graph Partitioning using PageRank Vectors. FOCS 2006.
+    """
+    
+    def __init__(self, edge_index: Int[Tensor, '2 num_edges'], edge_weights: Float[Tensor, 'num_edges'],
+                 teleport_probability: float = 0.2, tolerance: float = 1e-4, num_nodes: int | None = None):
+        if num_nodes is None:
+            num_nodes = int(edge_index.max().item()) + 1
+        _check_stochastic(edge_index, edge_weights, num_nodes)
+        self.num_nodes = num_nodes
+        self.teleport_probability = teleport_probability
+        self.tolerance = tolerance
+        edge_idxs = edge_index.cpu().numpy()
+        A = sp.csr_matrix((edge_weights.cpu().numpy().astype(np.float64), (edge_idxs[0], edge_idxs[1])), shape=(num_nodes, num_nodes))
+        self.transition = A.T.tocsr() # transition[v, u] is the probability of moving from u to v
+        self.push_threshold = tolerance * np.maximum(np.diff(A.indptr), 1)
+        self.rows: Dict[int, sp.csr_matrix] = {}
+        
+    def push(self, sources: np.ndarray) -> sp.csr_matrix:
+        """ Computes the ppr vectors of `sources` with forward push, where all nodes above the threshold are pushed at once.
+        
+        Args:
+            sources (np.ndarray): the source nodes
+        
+        Returns:
+            sp.csr_matrix: shape [num_sources, num_nodes], the ppr vector of each source
+        """
+        shape = (self.num_nodes, sources.shape[0])
+        residual = sp.csr_matrix((np.ones(sources.shape[0]), (sources, np.arange(sources.shape[0]))), shape=shape)
+        ppr = sp.csr_matrix(shape)
+        while residual.nnz > 0:
+            residual = residual.tocoo()
+            active = residual.data > self.push_threshold[residual.row]
+            if not active.any():
+                break
+            pushed = sp.csr_matrix((residual.data[active], (residual.row[active], residual.col[active])), shape=shape)
+            remaining = sp.csr_matrix((residual.data[~active], (residual.row[~active], residual.col[~active])), shape=shape)
+            ppr = ppr + self.teleport_probability * pushed
+            residual = remaining + (1 - self.teleport_probability) * (self.transition @ pushed)
+        return ppr.T.tocsr()
+    
+    def get_rows(self, sources: np.ndarray, top_k: int | None = None, threshold: float | None = None) -> sp.csr_matrix:
+        """ Gets the (sparsified) ppr vectors of `sources`, only vectors that are not cached yet are computed.
+        
+        Args:
+            sources (np.ndarray): the source nodes
+            top_k (int | None): if given, only the `top_k` largest entries of each vector are kept
+            threshold (float | None): if given, only entries of at least `threshold` are kept
+            
+        Returns:
+            sp.csr_matrix: shape [num_sources, num_nodes], the ppr vector of each source
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        missing = np.array([source for source in np.unique(sources) if int(source) not in self.rows], dtype=np.int64)
+        if missing.shape[0] > 0:
+            ppr = self.push(missing)
+            for source, row in zip(missing, ppr):
+                self.rows[int(source)] = row
+        if sources.shape[0] == 0:
+            return sp.csr_matrix((0, self.num_nodes))
+        rows = sp.vstack([self.rows[int(source)] for source in sources], format='csr')
+        if threshold is not None:
+            rows.data[rows.data < threshold] = 0
+        if top_k is not None:
+            for i in range(rows.shape[0]):
+                data = rows.data[rows.indptr[i] : rows.indptr[i + 1]]
+                if data.shape[0] > top_k:
+                    data[np.argsort(data)[:-top_k]] = 0
+        rows.eliminate_zeros()
+        return rows
@@ -0,0 +1,91 @@
+import os
+import resource
+import sys
+import time
+from contextlib import nullcontext
+from typing import Dict, List
+
+# `ru_maxrss` is reported in kilobytes on Linux and in bytes on macOS
+_RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+PhaseStatistics = Dict[str, float]
+
+def _peak_rss() -> int:
+    """ The peak resident memory of the process so far in bytes. """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_UNIT
+
+def _current_rss() -> float:
+    """ The current resident memory of the process in bytes, nan if it is not available (i.e. not on Linux). """
+    try:
+        with open('/proc/self/statm') as f:
+            return float(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE'))
+    except (OSError, ValueError, IndexError):
+        return float('nan')
+
+
+class _Phase:
+    """ Measures one (possibly nested) phase of a profiler. """
+
+    def __init__(self, profiler: 'PhaseProfiler', name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.stack.append(self.name)
+        self.path = '/'.join(self.profiler.stack)
+        self.wall_time = time.perf_counter()
+        self.cpu_time = time.process_time()
+        self.peak_rss, self.rss = _peak_rss(), _current_rss()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        wall_time, cpu_time = time.perf_counter() - self.wall_time, time.process_time() - self.cpu_time
+        peak_rss_increase, rss_delta = _peak_rss() - self.peak_rss, _current_rss() - self.rss
+        self.profiler.stack.pop()
+        statistics = self.profiler.phases.setdefault(self.path, {'wall_time' : 0.0, 'cpu_time' : 0.0, 'peak_rss_increase' : 0.0,
+                                                                 'rss_delta' : 0.0, 'count' : 0.0})
+        statistics['wall_time'] += wall_time
+        statistics['cpu_time'] += cpu_time
+        statistics['peak_rss_increase'] = max(statistics['peak_rss_increase'], float(peak_rss_increase))
+        statistics['rss_delta'] += rss_delta
+        statistics['count'] += 1
+
+
+class PhaseProfiler:
+    """ Hierarchical profiler that records wall time, cpu time and resident memory of (nested) phases.
+
+    Phases are identified by their path, e.g. `acquisition/prediction/augmentation`. Repeated phases are accumulated
+    until the statistics are collected with `pop`. Memory is recorded as
+        - `peak_rss_increase`: how much a phase raised the peak resident memory of the process (the maximum over
+          repetitions). It is zero if the phase stays below an earlier peak, so it only attributes new peaks.
+        - `rss_delta`: the change of the current resident memory from the start to the end of a phase, summed over
+          repetitions, i.e. the memory a phase leaves allocated. Only available on Linux, nan otherwise.
+    When disabled, entering a phase does nothing.
+
+    Args:
+        enabled (bool): whether to record phases
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.stack: List[str] = []
+        self.phases: Dict[str, PhaseStatistics] = {}
+
+    def phase(self, name: str) -> _Phase | nullcontext:
+        """ Context manager that measures a phase. """
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def pop(self) -> Dict[str, PhaseStatistics]:
+        """ Returns the statistics of all finished phases and clears them. """
+        phases, self.phases = self.phases, {}
+        return phases
+
+
+_NULL_PHASE = nullcontext()
+_profiler = PhaseProfiler()
+
+def get_profiler() -> PhaseProfiler:
+    """ The profiler of this process. """
+    return _profiler
@@ -1,7 +1,7 @@
 # Code by https://github.com/martenlienen?tab=repositories
 
 import random
-from typing import Optional
+from typing import Any, Dict, Optional
 
 import numpy as np
 import torch
@@ -34,17 +34,17 @@ def manual_seed(seed: Optional[int]):
     random.seed(std_ss.generate_state(624).tobytes())
 
     # We seed the global RNG anyway in case some library uses it internally
-    np.random.seed(int(npg_ss.generate_state(1, np.uint32)))
+    np.random.seed(int(npg_ss.generate_state(1, np.uint32)[0]))
 
     if torch.cuda.is_available():
 
         def lazy_seed_cuda():
             for i in range(torch.cuda.device_count()):
-                device_seed = int(cuda_ss[i].generate_state(1, np.uint64))
+                device_seed = int(cuda_ss[i].generate_state(1, np.uint64)[0])
                 torch.cuda.default_generators[i].manual_seed(device_seed)
 
         torch.random.default_generator.manual_seed(
-            int(pt_ss.generate_state(1, np.uint64))
+            int(pt_ss.generate_state(1, np.uint64)[0])
         )
         torch.cuda._lazy_call(lazy_seed_cuda)
 
@@ -54,9 +54,36 @@ def manual_seed(seed: Optional[int]):
     seed = root_ss.entropy # type: ignore
     return seed, rng
 
+def draw_seed(generator: torch.Generator) -> int:
+    """ Draws a seed from a generator. Unlike `generator.seed()`, this does not reseed the generator nondeterministically. """
+    return int(torch.randint(2**63 - 1, (1,), generator=generator).item())
+
 def next_generator(generator: torch.Generator | None, *args, **kwargs) -> torch.Generator:
     """ Creates a new generator on a device. """
     generator_new = torch.Generator(*args, **kwargs)
     if generator is not None:
-        generator_new.manual_seed(generator.seed())
+        generator_new.manual_seed(draw_seed(generator))
     return generator_new
+
+def get_rng_state(generator: torch.Generator | None = None) -> Dict[str, Any]:
+    """ Gets the states of all rngs (python, numpy, torch, cuda and optionally a generator), e.g. for checkpointing. """
+    state: Dict[str, Any] = {
+        'random' : random.getstate(),
+        'numpy' : np.random.get_state(),
+        'torch' : torch.random.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    if generator is not None:
+        state['generator'] = generator.get_state()
+    return state
+
+def set_rng_state(state: Dict[str, Any], generator: torch.Generator | None = None):
+    """ Restores the rng states returned by `get_rng_state`. """
+    random.setstate(state['random'])
+    np.random.set_state(state['numpy'])
+    torch.random.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+    if generator is not None and 'generator' in state:
+        generator.set_state(state['generator'])
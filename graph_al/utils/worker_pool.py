@@ -0,0 +1,146 @@
+import atexit
+import pickle
+from dataclasses import dataclass
+from functools import partial
+from multiprocessing import Pool, cpu_count, resource_tracker, shared_memory
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+# Shared memory that a process has attached to, by key: (name of the segment, segment, content)
+_attached: Dict[str, Tuple[str, shared_memory.SharedMemory, Any]] = {}
+
+
+def _attach(key: str, name: str, load: Callable[[shared_memory.SharedMemory], Any]) -> Any:
+    """ Attaches to a shared memory segment once per process and caches its content until the segment of `key` changes. """
+    if key in _attached and _attached[key][0] == name:
+        return _attached[key][2]
+    if key in _attached:
+        _attached.pop(key)[1].close()
+    segment = shared_memory.SharedMemory(name=name)
+    # The segment is owned by the process that created it, which also unlinks it
+    resource_tracker.unregister(segment._name, 'shared_memory') # type: ignore
+    content = load(segment)
+    _attached[key] = (name, segment, content)
+    return content
+
+
+@dataclass(frozen=True)
+class SharedArray:
+    """ Handle to a numpy array in shared memory, which is cheap to send to workers. """
+    key: str
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+    def numpy(self) -> np.ndarray:
+        """ The array, which shares its memory with all other processes. """
+        return _attach(self.key, self.name, lambda segment: np.ndarray(self.shape, dtype=self.dtype, buffer=segment.buf))
+
+
+@dataclass(frozen=True)
+class SharedObject:
+    """ Handle to a pickled object in shared memory. Each process unpickles it only once. """
+    key: str
+    name: str
+    size: int
+
+    def load(self) -> Any:
+        return _attach(self.key, self.name, lambda segment: pickle.loads(segment.buf[:self.size]))
+
+
+def _resolve(value: Any) -> Any:
+    if isinstance(value, SharedArray):
+        return value.numpy()
+    elif isinstance(value, SharedObject):
+        return value.load()
+    else:
+        return value
+
+def call_with_shared(fn: Callable, *args, **kwargs) -> Any:
+    """ Calls `fn` with all shared arrays and objects in its arguments resolved. `fn` must not modify them in-place. """
+    return fn(*map(_resolve, args), **{key : _resolve(value) for key, value in kwargs.items()})
+
+def _star_call_with_shared(fn: Callable, kwargs: Dict[str, Any], args: Tuple) -> Any:
+    return call_with_shared(fn, *args, **kwargs)
+
+
+class WorkerPool:
+    """ A pool of worker processes that persists over acquisition steps, together with data in shared memory.
+
+    Large data (e.g. features) is put into shared memory once with `share` and workers only receive small handles.
+    Sharing an array under the same key again overwrites it in-place if its shape and dtype did not change, so workers
+    see the update without copying it again.
+
+    Args:
+        num_workers (int | None): the number of workers, if None, the number of cpus
+    """
+
+    def __init__(self, num_workers: int | None = None):
+        self.num_workers = num_workers or cpu_count()
+        self.pool = Pool(processes=self.num_workers)
+        self.segments: Dict[str, Tuple[shared_memory.SharedMemory, SharedArray | SharedObject]] = {}
+
+    def _new_segment(self, key: str, size: int) -> shared_memory.SharedMemory:
+        self.unlink(key)
+        return shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+    def share(self, key: str, array: np.ndarray) -> SharedArray:
+        """ Puts an array into shared memory under `key`. """
+        array = np.ascontiguousarray(array)
+        if key in self.segments:
+            segment, handle = self.segments[key]
+            if isinstance(handle, SharedArray) and handle.shape == array.shape and handle.dtype == array.dtype.str:
+                np.copyto(np.ndarray(handle.shape, dtype=handle.dtype, buffer=segment.buf), array)
+                return handle
+        segment = self._new_segment(key, array.nbytes)
+        handle = SharedArray(key, segment.name, array.shape, array.dtype.str)
+        np.copyto(np.ndarray(handle.shape, dtype=handle.dtype, buffer=segment.buf), array)
+        self.segments[key] = (segment, handle)
+        return handle
+
+    def share_object(self, key: str, obj: Any) -> SharedObject:
+        """ Puts a pickled object into shared memory under `key`. """
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        segment = self._new_segment(key, len(data))
+        segment.buf[:len(data)] = data
+        handle = SharedObject(key, segment.name, len(data))
+        self.segments[key] = (segment, handle)
+        return handle
+
+    def unlink(self, key: str):
+        """ Frees the shared memory of `key`. """
+        if key in self.segments:
+            segment, _ = self.segments.pop(key)
+            segment.close()
+            segment.unlink()
+
+    def starmap(self, fn: Callable, iterable: Iterable, **kwargs) -> List[Any]:
+        """ Like `Pool.starmap`, but shared arrays and objects in `kwargs` and `iterable` are resolved in the workers. """
+        return self.pool.starmap(partial(call_with_shared, fn, **kwargs), iterable)
+
+    def imap_unordered(self, fn: Callable, iterable: Iterable, **kwargs) -> Iterator[Any]:
+        """ Like `starmap`, but yields results as soon as they are done, e.g. to report progress. """
+        return self.pool.imap_unordered(partial(_star_call_with_shared, fn, kwargs), iterable)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        for key in list(self.segments):
+            self.unlink(key)
+
+
+_pools: Dict[int, WorkerPool] = {}
+
+def get_worker_pool(num_workers: int | None = None) -> WorkerPool:
+    """ The persistent worker pool of this process with `num_workers` workers. It is created on first use. """
+    num_workers = num_workers or cpu_count()
+    if num_workers not in _pools:
+        _pools[num_workers] = WorkerPool(num_workers)
+    return _pools[num_workers]
+
+@atexit.register
+def close_worker_pools():
+    """ Shuts down all worker pools and frees their shared memory. """
+    while len(_pools) > 0:
+        _pools.popitem()[1].close()
@@ -0,0 +1,53 @@
+import gc
+
+import pytest
+import torch
+from torch_geometric.nn.conv.gcn_conv import gcn_norm
+
+from graph_al.utils.adjacency import NormalizedAdjacencyCache
+
+
+def random_graph(num_nodes: int, num_edges: int, seed: int = 0) -> torch.Tensor:
+    generator = torch.Generator().manual_seed(seed)
+    edge_index = torch.randint(num_nodes, (2, num_edges), generator=generator)
+    return edge_index[:, edge_index[0] != edge_index[1]]
+
+
+def assert_same_adjacency(actual, expected, num_nodes: int):
+    """ Compares two normalized adjacencies independently of the order of their edges. """
+    dense_actual = torch.sparse_coo_tensor(actual[0], actual[1], (num_nodes, num_nodes)).to_dense()
+    dense_expected = torch.sparse_coo_tensor(expected[0], expected[1], (num_nodes, num_nodes)).to_dense()
+    assert torch.allclose(dense_actual, dense_expected, atol=1e-6)
+
+
+@pytest.mark.parametrize('improved', [False, True])
+@pytest.mark.parametrize('add_self_loops', [False, True])
+def test_subgraph_normalization_matches_gcn_norm(improved: bool, add_self_loops: bool):
+    num_nodes = 50
+    cache = NormalizedAdjacencyCache()
+    edge_index = random_graph(num_nodes, 300)
+    edge_keep = torch.rand(edge_index.size(1), generator=torch.Generator().manual_seed(1)) > 0.3
+    subgraph = cache.register_subgraph(edge_index, edge_keep, num_nodes)
+    assert_same_adjacency(cache.normalize(subgraph, num_nodes, improved=improved, add_self_loops=add_self_loops),
+                          gcn_norm(subgraph, None, num_nodes, improved=improved, add_self_loops=add_self_loops), num_nodes)
+    assert_same_adjacency(cache.normalize(edge_index, num_nodes, improved=improved, add_self_loops=add_self_loops),
+                          gcn_norm(edge_index, None, num_nodes, improved=improved, add_self_loops=add_self_loops), num_nodes)
+
+
+def test_views_are_dropped_with_their_edges():
+    num_nodes = 50
+    cache = NormalizedAdjacencyCache(max_size=2)
+    edge_index = random_graph(num_nodes, 300)
+    cache.normalize(edge_index, num_nodes)
+    for seed in range(10):
+        edge_keep = torch.rand(edge_index.size(1), generator=torch.Generator().manual_seed(seed)) > 0.3
+        subgraph = cache.register_subgraph(edge_index, edge_keep, num_nodes)
+        cache.normalize(subgraph, num_nodes)
+        union = torch.cat([subgraph, subgraph + num_nodes], dim=1)
+        cache.register_view(union)
+        cache.normalize(union, 2 * num_nodes)
+        del subgraph, union
+        gc.collect()
+        assert len(cache.views) == 0
+    # Views never evict the full graph
+    assert len(cache.entries) == 1
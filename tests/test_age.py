@@ -0,0 +1,14 @@
+import pytest
+import torch
+
+from graph_al.acquisition.age import perc, percd, percentile_ranks
+
+
+@pytest.mark.parametrize('descending', [False, True])
+@pytest.mark.parametrize('num_distinct', [3, 1000])
+def test_percentile_ranks_match_perc_and_percd(descending: bool, num_distinct: int):
+    # Few distinct values produce many ties, which are counted with a strict inequality
+    input = torch.randint(num_distinct, (200,), generator=torch.Generator().manual_seed(0)).float()
+    reference = percd if descending else perc
+    expected = torch.tensor([reference(input, k) for k in range(input.size(0))])
+    assert torch.equal(percentile_ranks(input, descending=descending), expected)
@@ -0,0 +1,53 @@
+import argparse
+
+import pytest
+import torch
+
+from graph_al.acquisition.build import get_acquisition_strategy
+from graph_al.bench import benchmark_config
+from graph_al.model.build import get_model
+from graph_al.model.prediction import Prediction
+from graph_al.scheduler import load_dataset
+
+
+@pytest.mark.parametrize('num', [1, 10, 40])
+def test_kmeans_plus_plus_matches_recomputed_distances(num, tmp_path, monkeypatch):
+    args = argparse.Namespace(data='csbm_1000_4', model='gcn', seed=7, num_to_acquire=1, overrides=[])
+    config = benchmark_config('badge', 100, args, str(tmp_path))
+    dataset = load_dataset(config)
+    dataset.split(generator=torch.Generator().manual_seed(0))
+    dataset.reset_train_idxs()
+    strategy = get_acquisition_strategy(config.acquisition_strategy, dataset)
+    model = get_model(config.model, dataset, torch.Generator().manual_seed(0))
+
+    generator = torch.Generator().manual_seed(0)
+    num_nodes, num_classes = dataset.num_nodes, dataset.data.num_classes
+    probabilities = torch.softmax(3 * torch.randn(1, num_nodes, num_classes, generator=generator, dtype=torch.float64), -1)
+    embeddings = torch.randn(1, num_nodes, 8, generator=generator, dtype=torch.float64)
+    prediction = Prediction(probabilities=probabilities, embeddings=embeddings)
+    # The gradient embeddings of BADGE, materialized
+    factors = torch.nn.functional.one_hot(probabilities[0].argmax(-1), num_classes).double() - probabilities[0]
+    gradient_embeddings = (factors[:, :, None] * embeddings[0, :, None, :]).flatten(1)
+
+    # The maintained distances to the closest center are the weights of sampling the next center
+    weights_sampled = []
+    multinomial = torch.multinomial
+    def recording_multinomial(weights, *args, **kwargs):
+        weights_sampled.append(weights.clone())
+        return multinomial(weights, *args, **kwargs)
+    monkeypatch.setattr(torch, 'multinomial', recording_multinomial)
+
+    acquired_idxs = strategy.kmeans_plus_plus(num, torch.zeros_like(dataset.data.mask_train_pool), prediction, model,
+                                              dataset, torch.Generator().manual_seed(0))
+    assert len(acquired_idxs) == num
+    assert len(set(acquired_idxs)) == num
+    idx_pool = torch.where(dataset.data.mask_train_pool)[0]
+    assert all(idx in idx_pool.tolist() for idx in acquired_idxs)
+    assert acquired_idxs[0] == int(idx_pool[gradient_embeddings[idx_pool].norm(dim=-1).argmax()])
+
+    assert len(weights_sampled) == num - 1
+    for num_centers, weights in enumerate(weights_sampled, 1):
+        mask_pool = dataset.data.mask_train_pool.clone()
+        mask_pool[acquired_idxs[:num_centers]] = False
+        distances = torch.cdist(gradient_embeddings[acquired_idxs[:num_centers]], gradient_embeddings[mask_pool]).min(0)[0]
+        assert torch.allclose(weights, distances ** 2, atol=1e-8)
@@ -0,0 +1,43 @@
+import networkx as nx
+import numpy as np
+import pytest
+import torch
+
+from graph_al.utils.centrality import pagerank
+
+
+def random_graph(num_nodes: int, num_edges: int, seed: int = 0) -> torch.Tensor:
+    """ An undirected graph with duplicate edges that does not touch the last nodes, which are isolated. """
+    generator = torch.Generator().manual_seed(seed)
+    edge_index = torch.randint(num_nodes - 5, (2, num_edges), generator=generator)
+    edge_index = edge_index[:, edge_index[0] != edge_index[1]]
+    edge_index = torch.cat([edge_index, edge_index[:, :num_edges // 10]], dim=1)
+    return torch.cat([edge_index, edge_index.flip(0)], dim=1)
+
+
+def networkx_pagerank(edge_index: torch.Tensor, num_nodes: int, directed: bool, **kwargs) -> np.ndarray:
+    adjacency = np.zeros((num_nodes, num_nodes))
+    np.add.at(adjacency, tuple(edge_index.numpy()), 1.0)
+    graph = nx.from_numpy_array(adjacency, create_using=nx.DiGraph if directed else nx.Graph)
+    scores = nx.pagerank(graph, **kwargs)
+    return np.array([scores[node] for node in range(num_nodes)])
+
+
+@pytest.mark.parametrize('damping', [0.5, 0.85])
+def test_pagerank_matches_networkx(damping: float):
+    num_nodes = 100
+    edge_index = random_graph(num_nodes, 400)
+    expected = networkx_pagerank(edge_index, num_nodes, directed=False, alpha=damping, tol=1e-10, max_iter=1000)
+    scores = pagerank(edge_index, num_nodes, damping=damping, tolerance=1e-10, max_iterations=1000)
+    assert np.allclose(scores.numpy(), expected, atol=1e-6)
+    assert np.isclose(scores.sum().item(), 1.0, atol=1e-5)
+
+
+def test_directed_pagerank_with_dangling_nodes_matches_networkx():
+    num_nodes = 100
+    edge_index = random_graph(num_nodes, 400)
+    # Only keep edges towards larger indices, so nodes without out-edges have their mass redistributed
+    edge_index = edge_index[:, edge_index[0] < edge_index[1]]
+    expected = networkx_pagerank(edge_index, num_nodes, directed=True, tol=1e-10, max_iter=1000)
+    scores = pagerank(edge_index, num_nodes, tolerance=1e-10, max_iterations=1000, symmetric=False)
+    assert np.allclose(scores.numpy(), expected, atol=1e-6)
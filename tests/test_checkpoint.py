@@ -0,0 +1,69 @@
+import argparse
+from pathlib import Path
+
+import pytest
+
+import graph_al.scheduler as scheduler
+from graph_al.bench import benchmark_config
+from graph_al.config import Config
+from graph_al.scheduler import load_dataset, run_trajectory
+from graph_al.utils.checkpoint import AsyncCheckpointWriter
+
+
+class Interrupted(Exception):
+    ...
+
+
+class SynchronousCheckpointWriter(AsyncCheckpointWriter):
+    """ Finishes each write before returning, such that an interruption never races with the writer thread. """
+
+    def save(self, state, path):
+        super().save(state, path)
+        self.wait()
+
+
+def trajectory_config(strategy: str, model: str, output_dir: Path, checkpoint_dir: Path | None) -> Config:
+    args = argparse.Namespace(data='csbm_1000_4', model=model, seed=7, num_to_acquire=1, overrides=[
+        'acquisition_strategy.num_steps=4',
+        f'checkpoint_dir={checkpoint_dir}' if checkpoint_dir is not None else 'checkpoint_dir=null',
+    ] + (['model.trainer.max_epochs=20'] if model == 'gcn' else
+         # Test time adaptation needs a differentiable model
+         ['model.solver=LBFGS', 'acquisition_strategy.adaptation_enabled=false']))
+    return benchmark_config(strategy, 100, args, str(output_dir))
+
+
+@pytest.mark.parametrize('strategy,model', [('geem', 'sgc'), ('age', 'gcn'), ('anrmab', 'gcn'), ('galaxy', 'gcn')])
+def test_resumed_trajectory_matches_uninterrupted(strategy, model, tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler, 'AsyncCheckpointWriter', SynchronousCheckpointWriter)
+    config = trajectory_config(strategy, model, tmp_path, None)
+    reference = run_trajectory(config, load_dataset(config), 0, 0, tmp_path)
+
+    config = trajectory_config(strategy, model, tmp_path, tmp_path / 'checkpoints')
+    train_model = scheduler.train_model
+
+    def interrupted_train_model(*args, acquisition_step: int, **kwargs):
+        if acquisition_step == 3:
+            raise Interrupted()
+        return train_model(*args, acquisition_step=acquisition_step, **kwargs)
+
+    monkeypatch.setattr(scheduler, 'train_model', interrupted_train_model)
+    with pytest.raises(Interrupted):
+        run_trajectory(config, load_dataset(config), 0, 0, tmp_path)
+    monkeypatch.setattr(scheduler, 'train_model', train_model)
+    resumed = run_trajectory(config, load_dataset(config), 0, 0, tmp_path)
+
+    assert [result.acquired_idxs.tolist() for result in resumed.results] == \
+        [result.acquired_idxs.tolist() for result in reference.results]
+    for result, result_reference in zip(resumed.results, reference.results):
+        metrics = {name : value for name, value in result.metrics.items() if 'time' not in str(name)}
+        metrics_reference = {name : value for name, value in result_reference.metrics.items() if 'time' not in str(name)}
+        assert metrics == pytest.approx(metrics_reference, nan_ok=True)
+
+
+def test_checkpoint_of_different_configuration_is_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler, 'AsyncCheckpointWriter', SynchronousCheckpointWriter)
+    config = trajectory_config('entropy', 'gcn', tmp_path, tmp_path / 'checkpoints')
+    run_trajectory(config, load_dataset(config), 0, 0, tmp_path)
+    config = trajectory_config('random', 'gcn', tmp_path, tmp_path / 'checkpoints')
+    with pytest.raises(RuntimeError, match='different configuration'):
+        run_trajectory(config, load_dataset(config), 0, 0, tmp_path)
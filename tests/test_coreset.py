@@ -0,0 +1,97 @@
+import argparse
+from pathlib import Path
+
+import pytest
+import torch
+
+from graph_al.acquisition.build import get_acquisition_strategy
+from graph_al.acquisition.coreset_backend import chunked_min_distance
+from graph_al.bench import benchmark_config
+from graph_al.config import Config
+from graph_al.model.build import get_model
+from graph_al.scheduler import load_dataset
+
+
+def coreset_config(strategy: str, output_dir: Path, overrides: list[str]) -> Config:
+    args = argparse.Namespace(data='csbm_1000_4', model='gcn', seed=7, num_to_acquire=1, overrides=overrides)
+    return benchmark_config(strategy, 100, args, str(output_dir))
+
+
+def acquire(config: Config, dataset, num: int) -> tuple[list[int], list[float]]:
+    strategy = get_acquisition_strategy(config.acquisition_strategy, dataset)
+    model = get_model(config.model, dataset, torch.Generator().manual_seed(0))
+    acquired_idxs, info = strategy.acquire(model, dataset, num, config.model, torch.Generator().manual_seed(0))
+    return acquired_idxs.tolist(), info['coreset_distance'].tolist()
+
+
+@pytest.mark.parametrize('connected', [True, False])
+def test_sparse_appr_selections_match_dense(connected, tmp_path):
+    selections = {}
+    for name, overrides in [
+        # Enough power iterations for the dense matrix to converge
+        ('dense', ['acquisition_strategy.k=200']),
+        ('sparse', ['acquisition_strategy.ppr_tolerance=1e-4']),
+    ]:
+        config = coreset_config('coreset_appr_propagated', tmp_path, overrides)
+        dataset = load_dataset(config)
+        dataset.split(generator=torch.Generator().manual_seed(0))
+        dataset.reset_train_idxs()
+        # Move the last nodes into a chain that is far away from or disconnected to all other nodes,
+        # such that the push from training nodes does not reach most of it
+        edge_index = dataset.data.edge_index
+        idx_chain = torch.arange(dataset.num_nodes - 10, dataset.num_nodes)
+        edge_index = edge_index[:, ~(torch.isin(edge_index, idx_chain).any(0))]
+        chain = torch.stack([idx_chain[:-1], idx_chain[1:]])
+        if connected:
+            chain = torch.cat([chain, torch.tensor([[0], [idx_chain[0]]])], dim=1)
+        dataset.data.edge_index = torch.cat([edge_index, chain, chain.flip(0)], dim=1)
+        idx_pool = torch.where(dataset.data.mask_train_pool)[0]
+        dataset.add_to_train_idxs(idx_pool[idx_pool < idx_chain[0]][:3])
+
+        selections[name], distances = acquire(config, dataset, 6)
+        assert all(distance < float('inf') for distance in distances)
+        assert len(set(selections[name]) & set(idx_chain.tolist())) > 0
+    assert selections['sparse'] == selections['dense']
+
+
+def test_appr_defaults_to_dense(tmp_path):
+    config = coreset_config('coreset_appr_propagated', tmp_path, [])
+    assert config.acquisition_strategy.ppr_tolerance is None
+
+
+@pytest.mark.parametrize('chunk_size,p', [(4096, 2), (7, 2), (5, 1), (1, 2)])
+def test_chunked_min_distance_matches_cdist(chunk_size, p):
+    generator = torch.Generator().manual_seed(0)
+    x_centers, x_targets = torch.randn(23, 4, generator=generator), torch.randn(31, 4, generator=generator)
+    assert torch.allclose(chunked_min_distance(x_centers, x_targets, p=p, chunk_size=chunk_size),
+                          torch.cdist(x_centers, x_targets, p=p).min(0)[0])
+
+
+def greedy_coreset_from_scratch(x: torch.Tensor, mask_centers: torch.Tensor, mask_pool: torch.Tensor, num: int) -> list[int]:
+    """ Recomputes all distances to the centers for each pick. """
+    mask_centers, mask_pool, acquired_idxs = mask_centers.clone(), mask_pool.clone(), []
+    for _ in range(num):
+        idx_pool = torch.where(mask_pool)[0]
+        distance = torch.cdist(x[mask_centers], x[idx_pool]).min(0)[0]
+        idx = int(idx_pool[distance.argmax()])
+        acquired_idxs.append(idx)
+        mask_centers[idx], mask_pool[idx] = True, False
+    return acquired_idxs
+
+
+@pytest.mark.parametrize('chunk_size', [4096, 7])
+def test_incremental_coreset_matches_recomputed_distances(chunk_size, tmp_path):
+    config = coreset_config('coreset_input_features_propagated', tmp_path, [
+        'acquisition_strategy.distance_norm=2', f'acquisition_strategy.chunk_size={chunk_size}'])
+    dataset = load_dataset(config)
+    dataset.split(generator=torch.Generator().manual_seed(0))
+    dataset.reset_train_idxs()
+    dataset.add_to_train_idxs(torch.where(dataset.data.mask_train_pool)[0][:3])
+    strategy = get_acquisition_strategy(config.acquisition_strategy, dataset)
+    model = get_model(config.model, dataset, torch.Generator().manual_seed(0))
+    # Acquire over multiple iterations, such that the min-distances of the previous iteration are reused
+    for _ in range(3):
+        expected = greedy_coreset_from_scratch(dataset.data.x, dataset.data.mask_train, dataset.data.mask_train_pool, 5)
+        acquired_idxs, _ = strategy.acquire(model, dataset, 5, config.model, torch.Generator().manual_seed(0))
+        assert acquired_idxs.tolist() == expected
+        dataset.add_to_train_idxs(acquired_idxs)
@@ -0,0 +1,150 @@
+from queue import PriorityQueue
+
+import numpy as np
+import pytest
+
+from graph_al.acquisition.galaxy.linear_graph import create_linear_graphs, sort_by_margin
+
+
+# The node based implementation of https://github.com/jifanz/GALAXY that the array based graphs replace, reduced to
+# what the bisection uses: labeling nodes (cutting edges) and finding shortest paths (growing the order if there are none)
+
+class ReferenceNode:
+    def __init__(self, idx, label):
+        self.idx = idx
+        self.label = label
+        self.queried = False
+        self.neighbors = set()
+
+
+class ReferenceGraph:
+    def __init__(self, nodes):
+        self.nodes = set(nodes)
+        self.node_list = list(nodes)
+        self.node_dict = {node.idx: node for node in nodes}
+        self.queried = []
+
+    def label(self, idx):
+        node = self.node_dict[idx]
+        node.queried = True
+        self.queried.append(node)
+        new_neighbors = []
+        for neighbor in node.neighbors:
+            if neighbor.queried and neighbor.label != node.label:
+                neighbor.neighbors.remove(node)
+            else:
+                new_neighbors.append(neighbor)
+        node.neighbors = set(new_neighbors)
+
+    def shortest_shortest_path(self):
+        queue = PriorityQueue()
+        count = 0
+        dist, path_prev = {}, {}
+        positive_queried = {node for node in self.queried if node.label == 1}
+        negative_queried = {node for node in self.queried if node.label != 1}
+        for node in self.nodes:
+            if node in positive_queried:
+                dist[node] = 0
+                queue.put((0, count, node))
+                count += 1
+            else:
+                dist[node] = 2 * len(self.nodes)
+            path_prev[node] = None
+        while not queue.empty():
+            _, _, node = queue.get()
+            for neighbor in node.neighbors:
+                new_dist = dist[node] + 1
+                if new_dist < dist[neighbor]:
+                    dist[neighbor] = new_dist
+                    path_prev[neighbor] = node
+                    queue.put((new_dist, count, neighbor))
+                    count += 1
+                if neighbor in negative_queried:
+                    current = neighbor
+                    path = [neighbor]
+                    while path_prev[current] is not None:
+                        current = path_prev[current]
+                        path.append(current)
+                    return new_dist, path
+        return float('inf'), None
+
+
+class ReferenceMultiLinearGraph:
+    def __init__(self, scores, labels, n_order):
+        self.graphs = []
+        for c, sorted_idx in enumerate(sort_by_margin(scores, int(np.max(labels)) + 1)):
+            nodes = [ReferenceNode(idx, 1 if labels[idx] == c else -1) for idx in sorted_idx]
+            for order in range(1, n_order + 1):
+                for i in range(len(nodes) - order):
+                    nodes[i].neighbors.add(nodes[i + order])
+                    nodes[i + order].neighbors.add(nodes[i])
+            self.graphs.append(ReferenceGraph(nodes))
+        self.n_order = n_order
+        self.s2_iteration = 0
+
+    def label(self, idx):
+        for graph in self.graphs:
+            graph.label(idx)
+
+    def shortest_shortest_path(self, increment=True):
+        dist, path = self.graphs[self.s2_iteration % len(self.graphs)].shortest_shortest_path()
+        if path is None and increment and self.n_order < len(self.graphs[0].node_list):
+            self.n_order += 1
+            for graph in self.graphs:
+                nodes = graph.node_list
+                for i in range(len(nodes) - self.n_order):
+                    n1, n2 = nodes[i], nodes[i + self.n_order]
+                    if n1.label == n2.label or not n1.queried or not n2.queried:
+                        n1.neighbors.add(n2)
+                        n2.neighbors.add(n1)
+            return self.shortest_shortest_path(increment=False)
+        self.s2_iteration += 1
+        return dist, path
+
+
+def assert_valid_path(graph, path: np.ndarray, graph_idx: int):
+    """ The path starts at a queried node of another class, ends at a queried node of the class of the graph and only
+    follows edges of the current order that are not cut. """
+    position = np.argsort(graph.sorted_idxs[graph_idx])[path]
+    is_positive = graph.labels[path] == graph_idx
+    assert graph.queried[path[0]] and not is_positive[0]
+    assert graph.queried[path[-1]] and is_positive[-1]
+    assert np.all(np.abs(np.diff(position)) <= graph.n_order)
+    is_cut = graph.queried[path[:-1]] & graph.queried[path[1:]] & (is_positive[:-1] != is_positive[1:])
+    assert not is_cut.any()
+
+
+@pytest.mark.parametrize('num_nodes,num_classes,n_order,num_initial', [(10, 2, 1, 2), (40, 3, 1, 3), (40, 3, 2, 3), (80, 4, 1, 1)])
+def test_bisection_matches_node_based_graphs(num_nodes: int, num_classes: int, n_order: int, num_initial: int):
+    rng = np.random.default_rng(num_nodes + n_order)
+    scores = rng.dirichlet(np.ones(num_classes), num_nodes)
+    labels = rng.integers(0, num_classes, num_nodes)
+    labels[:num_classes] = np.arange(num_classes)
+    graph = create_linear_graphs(scores, labels, n_order)
+    reference = ReferenceMultiLinearGraph(scores, labels, n_order)
+    for idx in rng.choice(num_nodes, num_initial, replace=False):
+        graph.label(int(idx))
+        reference.label(int(idx))
+
+    orders = set()
+    while graph.not_queried.size > 0:
+        graph_idx = graph.s2_iteration % graph.sorted_idxs.shape[0]
+        dist, path = graph.shortest_shortest_path()
+        reference_dist, reference_path = reference.shortest_shortest_path()
+        # Ties between paths may be broken differently, but the lengths and the growth of the order have to agree
+        assert dist == reference_dist
+        assert (path is None) == (reference_path is None)
+        assert graph.n_order == reference.n_order
+        orders.add(graph.n_order)
+        if path is None:
+            query = int(rng.choice(graph.not_queried))
+        else:
+            assert len(path) == dist + 1
+            assert_valid_path(graph, path, graph_idx)
+            # Only the ends of a shortest path are queried
+            assert not graph.queried[path[1:-1]].any()
+            query = int(path[len(path) // 2])
+        graph.label(query)
+        reference.label(query)
+    # Cuts between adjacent queried nodes force the order to grow
+    assert len(orders) > 1
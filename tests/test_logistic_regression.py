@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+import torch
+from sklearn.linear_model import LogisticRegression
+
+from graph_al.model.enum import RefitApproximation
+from graph_al.model.logistic_regression import BatchedLogisticRegression, label_configurations, refit_approximation_error
+
+
+def random_problem(num_nodes: int = 80, num_features: int = 6, num_classes: int = 4, seed: int = 0):
+    generator = torch.Generator().manual_seed(seed)
+    y = torch.randint(num_classes, (num_nodes,), generator=generator)
+    # Separable enough to have a well-conditioned optimum, noisy enough to not be perfectly separable
+    x = torch.randn(num_classes, num_features, generator=generator)[y] + 1.5 * torch.randn(num_nodes, num_features, generator=generator)
+    mask_train = torch.zeros(num_nodes, dtype=torch.bool)
+    mask_train[torch.randperm(num_nodes, generator=generator)[:30]] = True
+    return x, y, mask_train, num_classes
+
+
+def sklearn_probabilities(x: torch.Tensor, y: torch.Tensor, mask_train: torch.Tensor, num_classes: int, C: float,
+                          balanced: bool) -> np.ndarray:
+    """ Probabilities of sklearn's regression over all classes, with zero probability for classes it did not observe. """
+    regression = LogisticRegression(C=C, solver='lbfgs', tol=1e-10, max_iter=10000,
+                                    class_weight='balanced' if balanced else None)
+    regression.fit(x[mask_train].numpy().astype(np.float64), y[mask_train].numpy())
+    probabilities = np.zeros((x.size(0), num_classes))
+    probabilities[:, regression.classes_] = regression.predict_proba(x.numpy().astype(np.float64))
+    return probabilities
+
+
+@pytest.mark.parametrize('balanced', [False, True])
+@pytest.mark.parametrize('C', [0.1, 1.0])
+def test_batched_logistic_regression_matches_sklearn(balanced: bool, C: float):
+    x, y, mask_train, num_classes = random_problem()
+    # Each configuration additionally labels one node, including configurations where one class or all but two classes
+    # are not observed, in which case sklearn fits a binary regression
+    idxs = torch.where(~mask_train)[0][:num_classes]
+    y_batch, mask_train_batch = label_configurations(y, mask_train, idxs, torch.arange(num_classes))
+    mask_train_batch = torch.cat([mask_train_batch, (mask_train & (y != 0))[None], (mask_train & (y >= 2))[None]])
+    y_batch = torch.cat([y_batch, y[None], y[None]])
+
+    regression = BatchedLogisticRegression(C=C, balanced=balanced, max_iter=1000, tol=1e-8)
+    probabilities = regression.fit(x, y_batch, mask_train_batch, num_classes).predict_proba(x)
+    for idx in range(y_batch.size(0)):
+        expected = sklearn_probabilities(x, y_batch[idx], mask_train_batch[idx], num_classes, C, balanced)
+        np.testing.assert_allclose(probabilities[idx].numpy(), expected, atol=1e-4)
+
+
+@pytest.mark.parametrize('approximation', [RefitApproximation.EXACT, RefitApproximation.NEWTON])
+def test_binary_refits_match_sklearn(approximation: RefitApproximation):
+    x, y, mask_train, _ = random_problem(num_classes=2)
+    regression = BatchedLogisticRegression(tol=1e-8, max_iter=1000).fit(x, y[None], mask_train[None], 2)
+    np.testing.assert_allclose(regression.predict_proba(x)[0].numpy(), sklearn_probabilities(x, y, mask_train, 2, 1.0, False), atol=1e-4)
+    idxs = torch.where(~mask_train)[0][:2]
+    y_batch, mask_train_batch = label_configurations(y, mask_train, idxs, torch.tensor([0, 1]))
+    regression.refit(approximation, x, y_batch, mask_train_batch, 2, regression.coef_[0].float(), regression.intercept_[0].float(),
+                     y, mask_train, num_newton_steps=20)
+    for idx in range(y_batch.size(0)):
+        expected = sklearn_probabilities(x, y_batch[idx], mask_train_batch[idx], 2, 1.0, False)
+        np.testing.assert_allclose(regression.predict_proba(x)[idx].numpy(), expected, atol=1e-3)
+
+
+def test_newton_refits_match_exact_refits():
+    x, y, mask_train, num_classes = random_problem(num_nodes=300, num_features=16)
+    regression = BatchedLogisticRegression(tol=1e-8, max_iter=1000).fit(x, y[None], mask_train[None], num_classes)
+    coef, intercept = regression.coef_[0].float(), regression.intercept_[0].float()
+    idxs = torch.where(~mask_train)[0][:50]
+    labels = torch.randint(num_classes, (50,), generator=torch.Generator().manual_seed(0))
+    y_batch, mask_train_batch = label_configurations(y, mask_train, idxs, labels)
+    error = refit_approximation_error(regression, RefitApproximation.NEWTON, x, y_batch, mask_train_batch, num_classes,
+                                      coef, intercept, y, mask_train, ~mask_train)
+    assert error['probability_error_max'] < 1e-3
+
+
+def test_hessian_matches_hessian_vector_products():
+    x, y, mask_train, num_classes = random_problem()
+    mask_train &= y != 3 # the Hessian is the identity for classes that are not observed
+    regression = BatchedLogisticRegression(tol=1e-8, max_iter=1000).fit(x, y[None], mask_train[None], num_classes)
+    params, x_train, _, sample_weight, mask_classes = regression._prepare(x, y[None], mask_train[None], num_classes,
+                                                                          regression.coef_[0], regression.intercept_[0])
+    hessian = regression._hessian(params[0], x_train, sample_weight[0], mask_classes[0])
+    vectors = torch.randn(5, hessian.size(0), generator=torch.Generator().manual_seed(0), dtype=torch.float64)
+    vectors = vectors * mask_classes[0].repeat_interleave(x.size(1) + 1)
+    products = regression._hessian_vector_product(params, vectors, x_train, sample_weight, mask_classes)
+    torch.testing.assert_close(vectors @ hessian.T, products)
+
+
+def test_influence_refits_approximate_exact_refits():
+    x, y, mask_train, num_classes = random_problem(num_nodes=300, num_features=16)
+    regression = BatchedLogisticRegression(tol=1e-8, max_iter=1000).fit(x, y[None], mask_train[None], num_classes)
+    coef, intercept = regression.coef_[0].float(), regression.intercept_[0].float()
+    idxs = torch.where(~mask_train)[0][:50]
+    labels = torch.randint(num_classes, (50,), generator=torch.Generator().manual_seed(0))
+    y_batch, mask_train_batch = label_configurations(y, mask_train, idxs, labels)
+    error = refit_approximation_error(regression, RefitApproximation.INFLUENCE, x, y_batch, mask_train_batch, num_classes,
+                                      coef, intercept, y, mask_train, ~mask_train)
+    # A single step with a shared Hessian is much less exact than Newton refits
+    assert error['probability_error_mean'] < 0.05
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+import torch
+import torch_scatter
+from torch_geometric.utils import to_undirected
+
+from graph_al.utils.ppr import SparsePPR, approximate_ppr_matrix
+
+
+def random_stochastic_graph(num_nodes: int, num_edges: int, seed: int = 0):
+    """ An undirected graph without isolated nodes and the row-stochastic weights of its random walk. """
+    generator = torch.Generator().manual_seed(seed)
+    edge_index = torch.randint(num_nodes, (2, num_edges), generator=generator)
+    chain = torch.stack([torch.arange(num_nodes - 1), torch.arange(1, num_nodes)])
+    edge_index = torch.cat([edge_index[:, edge_index[0] != edge_index[1]], chain], dim=1)
+    edge_index = to_undirected(edge_index, num_nodes=num_nodes)
+    degree = torch_scatter.scatter_add(torch.ones(edge_index.size(1)), edge_index[0], dim_size=num_nodes)
+    return edge_index, 1 / degree[edge_index[0]], degree.numpy()
+
+
+@pytest.mark.parametrize('teleport_probability', [0.1, 0.2])
+@pytest.mark.parametrize('tolerance', [1e-3, 1e-4])
+def test_sparse_ppr_matches_dense_ppr(teleport_probability: float, tolerance: float):
+    num_nodes = 100
+    edge_index, edge_weights, degree = random_stochastic_graph(num_nodes, 300)
+    dense = approximate_ppr_matrix(edge_index, edge_weights, teleport_probability=teleport_probability,
+                                   num_iterations=200, verbose=False, num_nodes=num_nodes).numpy()
+    sources = np.array([0, 17, 42, 99])
+    sparse = SparsePPR(edge_index, edge_weights, teleport_probability=teleport_probability, tolerance=tolerance,
+                       num_nodes=num_nodes).push(sources).toarray()
+    expected = num_nodes * dense[:, sources].T
+    assert np.all(np.abs(sparse - expected) <= tolerance * degree[None, :] + 1e-8)
+    # The push only moves mass from the residual to the vector, so it never overestimates
+    assert np.all(sparse <= expected + 1e-8)
+
+
+def test_sparse_ppr_rows_are_cached_and_sparsified():
+    num_nodes = 100
+    edge_index, edge_weights, _ = random_stochastic_graph(num_nodes, 300)
+    sparse_ppr = SparsePPR(edge_index, edge_weights, num_nodes=num_nodes)
+    sources = np.array([3, 5, 3])
+    rows = sparse_ppr.get_rows(sources).toarray()
+    assert set(sparse_ppr.rows) == {3, 5}
+    assert np.allclose(rows, sparse_ppr.push(sources).toarray())
+
+    top_k = sparse_ppr.get_rows(sources, top_k=5)
+    assert np.all(np.diff(top_k.indptr) <= 5)
+    for row, full_row in zip(top_k.toarray(), rows):
+        assert np.allclose(row[row > 0], full_row[row > 0])
+        assert row[row > 0].min() >= np.sort(full_row)[-5]
+    thresholded = sparse_ppr.get_rows(sources, threshold=1e-2).toarray()
+    assert np.allclose(thresholded, np.where(rows >= 1e-2, rows, 0))
@@ -0,0 +1,89 @@
+import argparse
+from pathlib import Path
+
+import pytest
+import torch
+
+from graph_al.acquisition.build import get_acquisition_strategy
+from graph_al.acquisition.tta_statistics import TTAEarlyStopping
+from graph_al.bench import benchmark_config
+from graph_al.config import Config
+from graph_al.model.build import get_model
+from graph_al.scheduler import load_dataset
+
+
+def first_stop(early_stopping: TTAEarlyStopping, scores: list[torch.Tensor]) -> int | None:
+    """ After how many views (one per step) the rule fires. """
+    mask_pool = torch.ones(scores[0].size(0), dtype=torch.bool)
+    for num_views_total, score in enumerate(scores, 1):
+        if early_stopping.step(score, mask_pool, 1, num_views_total):
+            return num_views_total
+    return None
+
+
+@pytest.mark.parametrize('min_num,patience', [(10, 3), (2, 5), (1, 1)])
+def test_early_stopping_waits_for_min_num_and_patience(min_num, patience):
+    scores = [torch.arange(20, dtype=torch.float)] * 30
+    early_stopping = TTAEarlyStopping(top_k=3, min_num=min_num, patience=patience, confidence=None)
+    # The ranking is stable from the first view on, but at least `min_num` views are drawn
+    assert first_stop(early_stopping, scores) == max(min_num, patience + 1)
+
+
+@pytest.mark.parametrize('num_unstable', [1, 5, 12])
+def test_early_stopping_fires_once_ranking_is_stable(num_unstable):
+    generator = torch.Generator().manual_seed(0)
+    stable = torch.arange(20, dtype=torch.float)
+    # The top nodes change with every view until the ranking settles
+    unstable = [torch.roll(stable, i + 1) + 0.1 * torch.rand(20, generator=generator) for i in range(num_unstable)]
+    # Only nodes outside the top 3 change in the stable views
+    tail = [stable.clone() for _ in range(20)]
+    for score in tail:
+        score[3:] += torch.rand(17, generator=generator)
+    early_stopping = TTAEarlyStopping(top_k=3, min_num=1, patience=4, confidence=None)
+    # The ranking settles with the first stable view and is stable for `patience` views after it
+    assert first_stop(early_stopping, unstable + tail) == num_unstable + 1 + 4
+
+
+def tta_config(output_dir: Path, overrides: list[str]) -> Config:
+    args = argparse.Namespace(data='csbm_1000_4', model='gcn', seed=7, num_to_acquire=1, overrides=[
+        'acquisition_strategy.tta_enabled=true',
+        'acquisition_strategy.tta.num=20',
+        'acquisition_strategy.tta.batch_size=4',
+    ] + overrides)
+    return benchmark_config('entropy', 100, args, str(output_dir))
+
+
+def tta_predict(output_dir: Path, overrides: list[str]):
+    config = tta_config(output_dir, overrides)
+    dataset = load_dataset(config)
+    dataset.split(generator=torch.Generator().manual_seed(0))
+    dataset.reset_train_idxs()
+    strategy = get_acquisition_strategy(config.acquisition_strategy, dataset)
+    model = get_model(config.model, dataset, torch.Generator().manual_seed(0))
+    model.eval()
+    prediction = strategy.tta_predict(model, config.model, dataset, torch.Generator().manual_seed(0),
+                                      num=strategy.num, top_k=1)
+    return prediction, strategy.tta_num_views_used
+
+
+def test_disabled_early_stopping_draws_all_views(tmp_path):
+    prediction, num_views_used = tta_predict(tmp_path, ['acquisition_strategy.tta.early_stopping=false'])
+    assert num_views_used == [20]
+    # An early stopping rule that can not fire before all views are drawn gives the same statistics
+    prediction_full, num_views_used_full = tta_predict(tmp_path, ['acquisition_strategy.tta.early_stopping=true',
+                                                                  'acquisition_strategy.tta.min_num=20'])
+    assert num_views_used_full == [20]
+    assert torch.allclose(prediction.get_probabilities(propagated=True), prediction_full.get_probabilities(propagated=True))
+    assert torch.allclose(prediction.get_logits(propagated=True), prediction_full.get_logits(propagated=True))
+
+
+def test_early_stopped_prediction_matches_fewer_views(tmp_path):
+    prediction, num_views_used = tta_predict(tmp_path, ['acquisition_strategy.tta.early_stopping=true',
+                                                        'acquisition_strategy.tta.min_num=4',
+                                                        'acquisition_strategy.tta.patience=4',
+                                                        'acquisition_strategy.tta.confidence=null'])
+    assert 4 <= num_views_used[0] < 20
+    # Stopping early aggregates the same views as drawing only that many views in the first place
+    prediction_fewer, _ = tta_predict(tmp_path, ['acquisition_strategy.tta.early_stopping=false',
+                                                 f'acquisition_strategy.tta.num={num_views_used[0]}'])
+    assert torch.allclose(prediction.get_probabilities(propagated=True), prediction_fewer.get_probabilities(propagated=True))